@@ -0,0 +1,195 @@
+import contextvars
+import asyncio
+import itertools
+import math
+import time
+import os
+
+from metrics import ADMISSION_DECISIONS, ADMISSION_WAIT_SECONDS
+
+
+# name: (priority, concurrency limit, queue size, timeout in seconds); a lower priority number is served first.
+DEFAULT_LANES = {
+    "voice": (0, 4, 16, 30.0),
+    "chat": (1, 8, 32, 60.0),
+    "vision": (2, 4, 16, 60.0),
+    "bulk": (3, 2, 8, 300.0),
+}
+ROUTE_LANES = {
+    "/api/voice": "voice",
+    "/api/transcribe": "voice",
+    "/api/transcribe/stream": "voice",
+    "/api/chat": "chat",
+    "/api/chat/stream": "chat",
+    "/api/vision": "vision",
+    "/api/vision/batch": "bulk",
+    "/api/jobs": "bulk",
+}
+
+request_deadline = contextvars.ContextVar("omni_request_deadline", default=None)
+# The admitted lane's priority, so the model scheduler and the batcher serve queued work in lane order too.
+request_priority = contextvars.ContextVar("omni_request_priority", default=None)
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code, detail, retry_after):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+def deadline_exceeded(deadline=None):
+    """True once the current request's deadline (or the given one) has passed."""
+    deadline = deadline if deadline is not None else request_deadline.get()
+    return deadline is not None and time.monotonic() > deadline
+
+
+class Lane:
+    def __init__(self, name, priority, limit, queue_size, timeout_s):
+        self.name = name
+        self.priority = priority
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout_s
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.expired = 0
+        # Moving average of how long admitted requests hold their slot, for Retry-After.
+        self.service_time = 1.0
+
+    def retry_after(self):
+        return max(1, math.ceil(self.service_time * (self.waiting + 1) / self.limit))
+
+
+def lanes_from_env(workers=1):
+    lanes = {}
+    for name, defaults in DEFAULT_LANES.items():
+        # OMNI_ADMISSION_CHAT="8,32,60" overrides the limit, queue size and timeout of the chat lane.
+        override = os.getenv(f"OMNI_ADMISSION_{name.upper()}")
+        priority, limit, queue_size, timeout_s = defaults
+        if override:
+            limit, queue_size, timeout_s = (t(v) for t, v in zip((int, int, float), override.split(",")))
+        lanes[name] = Lane(name, priority, math.ceil(limit / workers), math.ceil(queue_size / workers), timeout_s)
+    return lanes
+
+
+class AdmissionController:
+    """Bounded admission per lane with priority between lanes.
+
+    Each lane caps how many of its requests run at once and how many may wait; a full
+    queue is rejected straight away (429), and a request that is still queued when its
+    deadline passes is dropped (503). On top of the lane limits, at most
+    `max_concurrency` requests run in total, and when a slot frees up the waiting
+    request from the highest-priority lane gets it, so voice turns overtake bulk jobs.
+    Everything runs on the event loop, so no locking is needed.
+
+    Each HTTP worker admits on its own; with OMNI_WORKERS set to the worker count, the
+    configured limits and queue sizes are split between them (rounded up).
+    """
+
+    def __init__(self, lanes=None, max_concurrency=None, workers=None):
+        self.workers = workers or int(os.getenv("OMNI_WORKERS", "1"))
+        self.lanes = lanes if lanes is not None else lanes_from_env(self.workers)
+        self.max_concurrency = max_concurrency or math.ceil(int(os.getenv("OMNI_MAX_CONCURRENCY", "16")) / self.workers)
+        self.active = 0
+        self.waiters = []
+        self.sequence = itertools.count()
+
+    def lane_for(self, method, path):
+        if method != "POST":
+            return None
+        name = ROUTE_LANES.get(path)
+        return self.lanes.get(name) if name else None
+
+    def _can_run(self, lane):
+        return lane.active < lane.limit and self.active < self.max_concurrency
+
+    def _start(self, lane):
+        lane.active += 1
+        lane.admitted += 1
+        self.active += 1
+        ADMISSION_DECISIONS.inc(lane=lane.name, result="admitted")
+
+    def _dispatch(self):
+        for waiter in list(self.waiters):
+            _, _, lane, future = waiter
+            if future.done():
+                self.waiters.remove(waiter)
+                continue
+            if self.active >= self.max_concurrency:
+                return
+            if lane.active < lane.limit:
+                self.waiters.remove(waiter)
+                lane.waiting -= 1
+                self._start(lane)
+                future.set_result(True)
+
+    async def acquire(self, lane, deadline):
+        """Waits for a slot in `lane` until `deadline` (monotonic), raising AdmissionRejected if there is none."""
+        start = time.monotonic()
+        # Anyone still queued is blocked by the global cap or by their own lane, so only this lane's queue can be ahead of us.
+        if self._can_run(lane) and not lane.waiting:
+            self._start(lane)
+            ADMISSION_WAIT_SECONDS.observe(0.0, lane=lane.name)
+            return
+        if lane.waiting >= lane.queue_size:
+            lane.rejected += 1
+            ADMISSION_DECISIONS.inc(lane=lane.name, result="rejected")
+            raise AdmissionRejected(429, f"Too many {lane.name} requests queued, try again later.", lane.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = (lane.priority, next(self.sequence), lane, future)
+        self.waiters.append(waiter)
+        self.waiters.sort(key=lambda w: w[:2])
+        lane.waiting += 1
+        try:
+            await asyncio.wait_for(future, timeout=max(deadline - start, 0))
+        except asyncio.TimeoutError:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+                lane.waiting -= 1
+            lane.expired += 1
+            ADMISSION_DECISIONS.inc(lane=lane.name, result="expired")
+            raise AdmissionRejected(503, f"The server is busy with {lane.name} requests, try again later.", lane.retry_after())
+        except BaseException:
+            # Cancelled after being admitted (client went away): hand the slot straight back.
+            if future.done() and not future.cancelled():
+                self.release(lane, 0.0)
+            elif waiter in self.waiters:
+                self.waiters.remove(waiter)
+                lane.waiting -= 1
+            raise
+        ADMISSION_WAIT_SECONDS.observe(time.monotonic() - start, lane=lane.name)
+
+    def release(self, lane, held_s=None):
+        """Frees a slot; `held_s` feeds the lane's service-time average unless it is None (live sessions)."""
+        lane.active -= 1
+        self.active -= 1
+        if held_s is not None:
+            lane.service_time = 0.8 * lane.service_time + 0.2 * held_s
+        self._dispatch()
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "max_concurrency": self.max_concurrency,
+            "active": self.active,
+            "lanes": {
+                name: {
+                    "priority": lane.priority,
+                    "limit": lane.limit,
+                    "queue_size": lane.queue_size,
+                    "timeout_s": lane.timeout,
+                    "active": lane.active,
+                    "waiting": lane.waiting,
+                    "admitted": lane.admitted,
+                    "rejected": lane.rejected,
+                    "expired": lane.expired,
+                    "avg_service_s": round(lane.service_time, 2),
+                }
+                for name, lane in self.lanes.items()
+            },
+        }
@@ -1,92 +1,88 @@
 import gradio as gr
-import requests
+import httpx
 import os
 
+from omni_client import OmniClient, OmniClientError, Conversation, save_audio
+
 
 print("Initializing OmniLocal WebUI Client...\n")
 
-API_URL = os.getenv("OMNI_API_URL", "http://127.0.0.1:8000")
 CLIENT_AUDIO_DIR = "client_audio"
+VOICE_PLACEHOLDER = "🎤 (Voice Message)"
 os.makedirs(CLIENT_AUDIO_DIR, exist_ok=True)
-
-
-def download_audio(audio_url):
-    try:
-        filename = audio_url.split("/")[-1]
-        local_path = os.path.join(CLIENT_AUDIO_DIR, filename)
-        response = requests.get(audio_url)
-        with open(local_path, "wb") as f:
-            f.write(response.content)
-        return local_path
-    except Exception as e:
-        print(f"Failed to download audio: {e}")
-        return None
-
-
-def chat_and_speak(user_input, chat_history, use_search, progress=gr.Progress()):
+client = OmniClient()
+
+
+def stream_reply(events, chat_history, conversation):
+    """Renders chat events into the last two chat turns, yielding UI updates."""
+    chunk_index = 0
+    for event in events:
+        if event["type"] == "session_renewed":
+            gr.Info("Your previous session expired, so a new conversation was started.")
+        elif event["type"] == "partial_transcript":
+            heard = "" if chat_history[-2]["content"] == VOICE_PLACEHOLDER else chat_history[-2]["content"]
+            chat_history[-2]["content"] = f"{heard} {event['text']}".strip()
+            yield chat_history, "", None, conversation.session_id
+        elif event["type"] == "transcript":
+            chat_history[-2]["content"] = event["text"] or VOICE_PLACEHOLDER
+            yield chat_history, "", None, conversation.session_id
+        elif event["type"] == "token":
+            chat_history[-1]["content"] += event["text"]
+            yield chat_history, "", None, conversation.session_id
+        elif event["type"] == "audio":
+            chunk_index += 1
+            local_audio_path = save_audio(event["data"], os.path.join(CLIENT_AUDIO_DIR, f"stream_{id(chat_history)}_{chunk_index}.{event['format']}"))
+            yield chat_history, "", local_audio_path, conversation.session_id
+        elif event["type"] == "done":
+            chat_history[-1]["content"] = event["response_text"].strip()
+            print(f"[Timings] {event.get('timings', {})}")
+            yield chat_history, "", None, conversation.session_id
+        elif event["type"] == "error":
+            chat_history[-1]["content"] = f"[Server Error] {event['detail']}"
+            yield chat_history, "", None, conversation.session_id
+
+
+def chat_and_speak(user_input, chat_history, use_search, session_id, progress=gr.Progress()):
     if not user_input.strip():
-        return chat_history, "", None
+        yield chat_history, "", None, session_id
+        return
         
     progress(0.2, desc="Sending request to server...")
     
-    formatted_history = []
-    if chat_history:
-        for msg in chat_history:
-            formatted_history.append({"role": msg["role"], "content": msg["content"]})
-            
-    payload = {
-        "user_input": user_input,
-        "chat_history": formatted_history,
-        "use_search": use_search
-    }
+    chat_history = chat_history or []
+    chat_history.append({"role": "user", "content": user_input})
+    chat_history.append({"role": "assistant", "content": ""})
+    conversation = Conversation(client, session_id)
     
     try:
         progress(0.5, desc="Waiting for OmniLocal API...")
-        response = requests.post(f"{API_URL}/api/chat", json=payload)
-        response.raise_for_status()
-        data = response.json()
-        
-        response_text = data["response_text"]
-        
-        progress(0.8, desc="Downloading Audio...")
-        local_audio_path = download_audio(data["audio_url"])
+        yield from stream_reply(conversation.stream(user_input, use_search), chat_history, conversation)
         
-        chat_history.append({"role": "user", "content": user_input})
-        chat_history.append({"role": "assistant", "content": response_text})
-        
-        return chat_history, "", local_audio_path
-        
-    except requests.exceptions.RequestException as e:
-        error_msg = f"[Connection Error] Is the FastAPI server running? Details: {e}"
-        chat_history.append({"role": "user", "content": user_input})
-        chat_history.append({"role": "assistant", "content": error_msg})
-        return chat_history, "", None
+    except (httpx.HTTPError, OmniClientError) as e:
+        chat_history[-1]["content"] = f"[Connection Error] Is the FastAPI server running? Details: {e}"
+        yield chat_history, "", None, conversation.session_id
 
 
-def transcribe_and_chat(audio_path, chat_history, use_search, progress=gr.Progress()):
+def transcribe_and_chat(audio_path, chat_history, use_search, session_id, progress=gr.Progress()):
     if not audio_path:
-        return chat_history, "", None, None
+        yield chat_history, "", None, session_id, None
+        return
         
     progress(0.1, desc="🎙️ Transcribing...")
+    
+    chat_history = chat_history or []
+    chat_history.append({"role": "user", "content": VOICE_PLACEHOLDER})
+    chat_history.append({"role": "assistant", "content": ""})
+    conversation = Conversation(client, session_id)
+    
     try:
-        with open(audio_path, "rb") as f:
-            res = requests.post(f"{API_URL}/api/transcribe", files={"file": f})
-        res.raise_for_status()
-        user_text = res.json().get("text", "").strip()
-        
-    except Exception as e:
-        print(f"Transcription error: {e}")
-        error_msg = "[Transcription Error] Could not understand audio or server is down."
-        chat_history.append({"role": "user", "content": "🎤 (Voice Message)"})
-        chat_history.append({"role": "assistant", "content": error_msg})
-        return chat_history, "", None, None
-
-    if not user_text:
-        return chat_history, "", None, None
+        for history, txt, audio, session_id in stream_reply(conversation.voice(audio_path, use_search), chat_history, conversation):
+            yield history, txt, audio, session_id, None
         
-    history, txt, audio = chat_and_speak(user_text, chat_history, use_search, progress)
-    
-    return history, txt, audio, None
+    except (httpx.HTTPError, OmniClientError) as e:
+        print(f"Voice error: {e}")
+        chat_history[-1]["content"] = "[Transcription Error] Could not understand audio or server is down."
+        yield chat_history, "", None, conversation.session_id, None
 
 
 def vision_and_speak(image_path, prompt, progress=gr.Progress()):
@@ -97,21 +93,14 @@ def vision_and_speak(image_path, prompt, progress=gr.Progress()):
     
     try:
         progress(0.5, desc="Waiting for Vision API...")
-        with open(image_path, "rb") as image_file:
-            response = requests.post(
-                f"{API_URL}/api/vision", 
-                data={"prompt": prompt},
-                files={"image_file": image_file}
-            )
-        response.raise_for_status()
-        data = response.json()
+        data = client.vision(image_path, prompt)
         
-        progress(0.8, desc="Downloading Audio...")
-        local_audio_path = download_audio(data["audio_url"])
+        progress(0.8, desc="Saving Audio...")
+        local_audio_path = client.save_response_audio(data, os.path.join(CLIENT_AUDIO_DIR, f"vision_{id(data)}.{data['audio_format']}"))
         
         return data["response_text"], local_audio_path
         
-    except requests.exceptions.RequestException as e:
+    except (httpx.HTTPError, OmniClientError) as e:
         return f"[Connection Error] Is the FastAPI server running? Details: {e}", None
 
 
@@ -132,13 +121,14 @@ with gr.Blocks(title="OmniLocal", theme=gr.themes.Soft()) as demo:
                     web_search_toggle = gr.Checkbox(label="🌐 Search Web")
                     chat_btn = gr.Button("Send", variant="primary", size="lg")
                 
-            chat_audio = gr.Audio(visible=True, autoplay=True, label="Chat TTS")
+            chat_audio = gr.Audio(visible=True, autoplay=True, streaming=True, label="Chat TTS")
+            session_state = gr.State(None)
             
-            mic_input.stop_recording(transcribe_and_chat, inputs=[mic_input, chatbot, web_search_toggle], outputs=[chatbot, chat_txt, chat_audio, mic_input])
-            mic_input.upload(transcribe_and_chat, inputs=[mic_input, chatbot, web_search_toggle], outputs=[chatbot, chat_txt, chat_audio, mic_input])
+            mic_input.stop_recording(transcribe_and_chat, inputs=[mic_input, chatbot, web_search_toggle, session_state], outputs=[chatbot, chat_txt, chat_audio, session_state, mic_input])
+            mic_input.upload(transcribe_and_chat, inputs=[mic_input, chatbot, web_search_toggle, session_state], outputs=[chatbot, chat_txt, chat_audio, session_state, mic_input])
             
-            chat_txt.submit(chat_and_speak, inputs=[chat_txt, chatbot, web_search_toggle], outputs=[chatbot, chat_txt, chat_audio])
-            chat_btn.click(chat_and_speak, inputs=[chat_txt, chatbot, web_search_toggle], outputs=[chatbot, chat_txt, chat_audio])
+            chat_txt.submit(chat_and_speak, inputs=[chat_txt, chatbot, web_search_toggle, session_state], outputs=[chatbot, chat_txt, chat_audio, session_state])
+            chat_btn.click(chat_and_speak, inputs=[chat_txt, chatbot, web_search_toggle, session_state], outputs=[chatbot, chat_txt, chat_audio, session_state])
             
         with gr.Tab("👁️ Vision"):
             with gr.Row():
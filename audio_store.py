@@ -0,0 +1,79 @@
+import soundfile as sf
+import threading
+import uuid
+import time
+import io
+import os
+
+from collections import OrderedDict
+
+
+AUDIO_FORMATS = {
+    "wav": ("WAV", "PCM_16", "audio/wav"),
+    "ogg": ("OGG", "VORBIS", "audio/ogg"),
+    "opus": ("OGG", "OPUS", "audio/ogg"),
+    "mp3": ("MP3", "MPEG_LAYER_III", "audio/mpeg"),
+}
+
+
+def encode_audio(samples, sample_rate, audio_format="wav"):
+    """Encodes float32 samples in memory, returning (bytes, media_type)."""
+    if audio_format not in AUDIO_FORMATS:
+        raise ValueError(f"Unsupported audio format '{audio_format}'. Choose one of: {', '.join(AUDIO_FORMATS)}.")
+    container, subtype, media_type = AUDIO_FORMATS[audio_format]
+    buffer = io.BytesIO()
+    sf.write(buffer, samples, sample_rate, format=container, subtype=subtype)
+    return buffer.getvalue(), media_type
+
+
+class AudioStore:
+    """Bounded, TTL-expiring in-memory store for synthesized replies awaiting download."""
+
+    def __init__(self, max_bytes=None, ttl_seconds=None):
+        self.max_bytes = max_bytes or float(os.getenv("OMNI_AUDIO_STORE_MB", "128")) * 1024 ** 2
+        self.ttl = ttl_seconds or float(os.getenv("OMNI_AUDIO_TTL_S", "300"))
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.expired = 0
+
+    def _evict(self):
+        now = time.time()
+        for audio_id in list(self.entries):
+            created, samples, _ = self.entries[audio_id]
+            if now - created <= self.ttl and self.bytes <= self.max_bytes:
+                break
+            del self.entries[audio_id]
+            self.bytes -= samples.nbytes
+            self.expired += 1
+
+    def put(self, samples, sample_rate):
+        """Stores the samples and returns their id, or None if they alone exceed the store's budget."""
+        if samples.nbytes > self.max_bytes:
+            return None
+        audio_id = uuid.uuid4().hex
+        with self.lock:
+            self.entries[audio_id] = (time.time(), samples, sample_rate)
+            self.bytes += samples.nbytes
+            self._evict()
+        return audio_id
+
+    def pop(self, audio_id):
+        """Removes and returns (samples, sample_rate), or None if unknown or expired."""
+        with self.lock:
+            self._evict()
+            entry = self.entries.pop(audio_id, None)
+            if entry is None:
+                return None
+            self.bytes -= entry[1].nbytes
+            return entry[1], entry[2]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "memory_mb": round(self.bytes / 1024 ** 2, 2),
+                "max_memory_mb": round(self.max_bytes / 1024 ** 2, 2),
+                "ttl_s": self.ttl,
+                "expired": self.expired,
+            }
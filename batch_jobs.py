@@ -0,0 +1,273 @@
+import threading
+import argparse
+import uuid
+import json
+import time
+import os
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from admission import DEFAULT_LANES, request_priority
+
+
+# Items run grouped by kind in this order, so the text and vision models are each loaded once.
+JOB_KINDS = ("chat", "vision", "transcribe", "speak")
+REQUIRED_FIELDS = {"chat": ("prompt", "messages"), "vision": ("image",), "transcribe": ("audio",), "speak": ("text",)}
+# Job items wait for the models behind interactive requests, like the bulk lane the job was submitted through.
+JOB_PRIORITY = DEFAULT_LANES["bulk"][0]
+
+
+def load_manifest(path):
+    """Reads a JSONL manifest, giving every item an id (its line number unless it has one)."""
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            kind = item.get("type")
+            if kind not in JOB_KINDS:
+                raise ValueError(f"Line {line_number}: type must be one of: {', '.join(JOB_KINDS)}.")
+            if not any(field in item for field in REQUIRED_FIELDS[kind]):
+                raise ValueError(f"Line {line_number}: a '{kind}' item needs '{' or '.join(REQUIRED_FIELDS[kind])}'.")
+            item["id"] = str(item.get("id", line_number))
+            items.append(item)
+    return items
+
+
+def resolve_job_path(base_dir, path):
+    """Resolves a relative `path` inside `base_dir`, refusing absolute paths, '..' and symlinks leading out."""
+    if not isinstance(path, str) or not path or os.path.isabs(path) or ".." in path.replace("\\", "/").split("/"):
+        raise ValueError(f"'{path}' must be a relative path inside the jobs directory without '..'.")
+    root = os.path.realpath(base_dir)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise ValueError(f"'{path}' points outside the jobs directory.")
+    return resolved
+
+
+def completed_ids(output_path):
+    """Ids that already have a result in `output_path`; failed items are retried on resume."""
+    if not os.path.exists(output_path):
+        return set()
+    done = set()
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut off by a crash; the item simply runs again.
+                continue
+            if "result" in record:
+                done.add(record["id"])
+    return done
+
+
+class BatchJob:
+    """Runs a manifest of chat, vision, transcribe and speak items through the engine.
+
+    Items are grouped by kind and processed `chunk_size` at a time: chat items are
+    submitted together so the text batcher decodes them in one batch, and vision items
+    go through `generate_vision_batch`. Every result is appended to the output JSONL as
+    soon as it is ready, which doubles as the checkpoint: rerunning the same job skips
+    items that already have a result. With a `base_dir`, the image and audio paths
+    inside the manifest must resolve within it.
+    """
+
+    def __init__(self, manifest_path, output_path, audio_dir=None, chunk_size=None, cache=False, engine=None, job_id=None, base_dir=None):
+        self.engine = engine
+        self.base_dir = base_dir
+        self.job_id = job_id or uuid.uuid4().hex
+        self.manifest_path = manifest_path
+        self.output_path = output_path
+        self.audio_dir = audio_dir or os.path.splitext(output_path)[0] + "_audio"
+        self.chunk_size = chunk_size or int(os.getenv("OMNI_JOB_CHUNK_SIZE", "16"))
+        self.cache = cache
+        self.state = "pending"
+        self.error = None
+        self.started = None
+        self.finished = None
+        self.progress = {}
+        self.lock = threading.Lock()
+
+    def _input_path(self, path):
+        return resolve_job_path(self.base_dir, path) if self.base_dir else path
+
+    def _chat(self, item):
+        messages = item.get("messages") or [{"role": "system", "content": self.engine.SYSTEM_PROMPT}, {"role": "user", "content": item["prompt"]}]
+        web_context = self.engine.search_web(messages[-1]["content"]) if item.get("use_search") else ""
+        return {"response_text": self.engine.generate_text(messages, web_context, item.get("max_new_tokens", self.engine.MAX_NEW_TOKENS), item.get("temperature", self.engine.TEMPERATURE), self.cache)}
+
+    def _transcribe(self, item):
+        return {"text": self.engine.transcribe_audio(self._input_path(item["audio"]), item.get("model_size"), item.get("beam_size"), item.get("vad"), item.get("language"))}
+
+    def _speak(self, item):
+        from audio_store import encode_audio
+        audio_format = item.get("format", "wav")
+        samples = self.engine.generate_audio(item["text"], item.get("voice", self.engine.DEFAULT_VOICE), item.get("speed", 1.0))
+        if os.path.basename(item["id"]) != item["id"]:
+            raise ValueError(f"Item id '{item['id']}' cannot be used as a file name.")
+        data, _ = encode_audio(samples, self.engine.SAMPLE_RATE, audio_format)
+        os.makedirs(self.audio_dir, exist_ok=True)
+        path = os.path.join(self.audio_dir, f"{item['id']}.{audio_format}")
+        with open(path, "wb") as f:
+            f.write(data)
+        return {"audio_path": path, "duration_s": round(samples.size / self.engine.SAMPLE_RATE, 2)}
+
+    def _run_chunk(self, kind, chunk, executor):
+        """Yields (item, result, error) for one chunk as items finish."""
+        if kind == "vision":
+            try:
+                images = []
+                for item in chunk:
+                    with open(self._input_path(item["image"]), "rb") as f:
+                        images.append(f.read())
+                replies = self.engine.generate_vision_batch([(data, item.get("prompt", "Describe this image in three sentences.")) for data, item in zip(images, chunk)], cache=self.cache)
+            except Exception as e:
+                # One unreadable image fails the whole batch, so retry the items one by one.
+                if len(chunk) == 1:
+                    yield chunk[0], None, str(e)
+                    return
+                for item in chunk:
+                    yield from self._run_chunk(kind, [item], executor)
+                return
+            for item, reply in zip(chunk, replies):
+                yield item, {"response_text": reply}, None
+            return
+
+        handler = {"chat": self._chat, "transcribe": self._transcribe, "speak": self._speak}[kind]
+        futures = {executor.submit(handler, item): item for item in chunk}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, str(e)
+
+    def _report(self, kind):
+        with self.lock:
+            p = self.progress[kind]
+            rate = p["done"] / (time.perf_counter() - p["started"]) if p["done"] else 0.0
+        print(f"[Batch] {self.job_id[:8]} {kind}: {p['done'] + p['failed']}/{p['total']} ({p['failed']} failed, {rate:.1f} items/s)")
+
+    def run(self):
+        self.state = "running"
+        self.started = time.time()
+        request_priority.set(JOB_PRIORITY)
+        if self.engine is None:
+            import omni_engine
+            self.engine = omni_engine
+        try:
+            items = load_manifest(self.manifest_path)
+            done = completed_ids(self.output_path)
+            pending = {kind: [item for item in items if item["type"] == kind and item["id"] not in done] for kind in JOB_KINDS}
+            with self.lock:
+                for kind in JOB_KINDS:
+                    total = sum(1 for item in items if item["type"] == kind)
+                    self.progress[kind] = {"total": total, "skipped": total - len(pending[kind]), "done": 0, "failed": 0, "started": None, "seconds": 0.0}
+
+            with open(self.output_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=self.chunk_size, thread_name_prefix="job", initializer=request_priority.set, initargs=(JOB_PRIORITY,)) as executor:
+                for kind in JOB_KINDS:
+                    if not pending[kind]:
+                        continue
+                    self.progress[kind]["started"] = time.perf_counter()
+                    for start in range(0, len(pending[kind]), self.chunk_size):
+                        for item, result, error in self._run_chunk(kind, pending[kind][start:start + self.chunk_size], executor):
+                            record = {"id": item["id"], "type": kind, "result": result} if error is None else {"id": item["id"], "type": kind, "error": error}
+                            out.write(json.dumps(record) + "\n")
+                            with self.lock:
+                                self.progress[kind]["done" if error is None else "failed"] += 1
+                        out.flush()
+                        os.fsync(out.fileno())
+                        self._report(kind)
+                    with self.lock:
+                        self.progress[kind]["seconds"] = round(time.perf_counter() - self.progress[kind]["started"], 2)
+            self.state = "completed"
+        except Exception as e:
+            print(f"[Warning] Batch job {self.job_id} failed: {e}")
+            self.state = "failed"
+            self.error = str(e)
+        finally:
+            self.finished = time.time()
+
+    def stats(self):
+        with self.lock:
+            progress = {}
+            for kind, p in self.progress.items():
+                seconds = p["seconds"] or (time.perf_counter() - p["started"] if p["started"] else 0.0)
+                progress[kind] = {
+                    "total": p["total"],
+                    "skipped": p["skipped"],
+                    "done": p["done"],
+                    "failed": p["failed"],
+                    "items_per_s": round(p["done"] / seconds, 2) if seconds else 0.0,
+                }
+            return {
+                "job_id": self.job_id,
+                "state": self.state,
+                "error": self.error,
+                "manifest": self.manifest_path,
+                "output": self.output_path,
+                "elapsed_s": round((self.finished or time.time()) - self.started, 2) if self.started else 0.0,
+                "progress": progress,
+            }
+
+
+class JobManager:
+    """Runs submitted batch jobs one at a time in the background and keeps their status.
+
+    Jobs submitted over HTTP may only touch files under `base_dir` (OMNI_JOBS_DIR);
+    without one, submit() refuses every job.
+    """
+
+    def __init__(self, engine=None, base_dir=None):
+        self.engine = engine
+        self.base_dir = base_dir or os.getenv("OMNI_JOBS_DIR")
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="batch-job")
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.base_dir)
+
+    def submit(self, manifest_path, output_path, audio_dir=None, chunk_size=None, cache=False):
+        """Queues a job and returns its status."""
+        if not self.enabled:
+            raise PermissionError("Batch jobs are disabled; set OMNI_JOBS_DIR to the directory they may read and write.")
+        manifest_path = resolve_job_path(self.base_dir, manifest_path)
+        output_path = resolve_job_path(self.base_dir, output_path)
+        audio_dir = resolve_job_path(self.base_dir, audio_dir) if audio_dir else None
+        # Validate up front so a bad manifest is reported to the caller, not just in the job status.
+        load_manifest(manifest_path)
+        job = BatchJob(manifest_path, output_path, audio_dir, chunk_size, cache, self.engine, base_dir=self.base_dir)
+        with self.lock:
+            self.jobs[job.job_id] = job
+        self.executor.submit(job.run)
+        return job.stats()
+
+    def status(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+        return job.stats() if job is not None else None
+
+    def stats(self):
+        with self.lock:
+            jobs = list(self.jobs.values())
+        return {"jobs": [job.stats() for job in jobs]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a JSONL manifest of chat, vision, transcribe and speak items offline.")
+    parser.add_argument("manifest", help='JSONL with one item per line, e.g. {"type": "vision", "image": "cat.jpg", "prompt": "..."}.')
+    parser.add_argument("--output", required=True, help="Results JSONL; rerunning with the same file resumes the job.")
+    parser.add_argument("--audio-dir", default=None, help="Where 'speak' items write their audio (default: next to the output).")
+    parser.add_argument("--chunk-size", type=int, default=None)
+    parser.add_argument("--cache", action="store_true", help="Serve and store replies in the response cache even when sampling.")
+    args = parser.parse_args()
+
+    job = BatchJob(args.manifest, args.output, args.audio_dir, args.chunk_size, args.cache)
+    job.run()
+    print(json.dumps(job.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,387 @@
+import threading
+import queue
+import time
+import os
+
+import torch
+import torch.nn.functional as F
+
+from concurrent.futures import Future
+from scheduler import DeadlineExceeded
+from metrics import TOKENS_GENERATED, TIME_TO_FIRST_TOKEN_SECONDS, DECODE_TOKENS_PER_SECOND
+
+
+def cache_layers(past):
+    if hasattr(past, "layers"):
+        return [(layer.keys, layer.values) for layer in past.layers]
+    if hasattr(past, "key_cache"):
+        return list(zip(past.key_cache, past.value_cache))
+    return [(k, v) for k, v in past]
+
+
+def build_cache(layers):
+    from transformers import DynamicCache
+    cache = DynamicCache()
+    for layer_idx, (k, v) in enumerate(layers):
+        cache.update(k, v, layer_idx)
+    return cache
+
+
+def sampling_filters(model):
+    """The (top_k, top_p) that generate(do_sample=True) would apply for this model."""
+    config = model.generation_config
+    # Unset values fall back to generate()'s own defaults, top_k=50 and no nucleus cut.
+    top_k = config.top_k if config.top_k is not None else 50
+    top_p = config.top_p if config.top_p is not None else 1.0
+    return top_k, top_p
+
+
+def filter_logits(logits, top_k=0, top_p=1.0):
+    """Sets logits outside the top-k tokens or the top-p nucleus to -inf, along the last dimension."""
+    if top_k and top_k < logits.shape[-1]:
+        kth = torch.topk(logits, top_k, dim=-1).values[..., -1:]
+        logits = logits.masked_fill(logits < kth, float("-inf"))
+    if top_p < 1.0:
+        sorted_logits, sorted_index = torch.sort(logits, descending=True, dim=-1)
+        probs = torch.softmax(sorted_logits.float(), dim=-1)
+        # A token goes once the tokens ranked above it already cover top_p, so the top token always stays.
+        remove = probs.cumsum(-1) - probs >= top_p
+        logits = logits.masked_fill(remove.scatter(-1, sorted_index, remove), float("-inf"))
+    return logits
+
+
+class BatchRequest:
+    def __init__(self, input_ids, max_new_tokens, temperature, stream=False, deadline=None, priority=None):
+        self.input_ids = list(input_ids)
+        self.deadline = deadline
+        self.priority = priority or 0
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.generated = []
+        self.future = Future()
+        self.stream = queue.Queue() if stream else None
+        self.cancelled = False
+        self.created = time.perf_counter()
+        self.first_token_at = None
+
+    @property
+    def finished(self):
+        return self.cancelled or len(self.generated) >= self.max_new_tokens
+
+    def emit(self, token):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.generated.append(token)
+        if self.stream is not None:
+            self.stream.put(token)
+
+    def finish(self):
+        self.future.set_result(self.generated)
+        if self.stream is not None:
+            self.stream.put(None)
+
+    def fail(self, error):
+        self.future.set_exception(error)
+        if self.stream is not None:
+            self.stream.put(error)
+
+
+class BatchEngine:
+    """Continuously batches generate requests for one causal LM.
+
+    Requests arriving within `window_ms` of each other are left-padded into a single
+    batch and decoded together. Between decode steps finished sequences leave the
+    batch and newly queued requests join it, so a long reply never holds back a short
+    one and a new user does not wait for the whole batch to drain. Requests whose
+    deadline has passed by the time they would join are failed instead of prefilled.
+    Queued requests join in priority order, and the batch waits for the model at the
+    priority of its most urgent row.
+
+    When a `prefix_cache` is given, new rows start from the longest cached prefix of
+    their prompt and only the remaining tokens are prefilled; finished rows are stored
+    back so the next turn of the same conversation can reuse them.
+    """
+
+    def __init__(self, load_fn, scheduler, model_name="text", prefix_cache=None, max_batch_size=None, window_ms=None):
+        self.load_fn = load_fn
+        self.scheduler = scheduler
+        self.model_name = model_name
+        self.prefix_cache = prefix_cache
+        self.max_batch_size = max_batch_size or int(os.getenv("OMNI_MAX_BATCH_SIZE", "8"))
+        if window_ms is None:
+            window_ms = float(os.getenv("OMNI_BATCH_WINDOW_MS", "10"))
+        self.window = window_ms / 1000
+        self.pending = []
+        self.active = []
+        self.cond = threading.Condition()
+        self.thread = None
+        self.prefills = 0
+        self.requests = 0
+        self.steps = 0
+        self.step_rows = 0
+        self.peak_batch_size = 0
+        self.expired = 0
+
+    def _enqueue(self, request):
+        if request.max_new_tokens <= 0:
+            request.finish()
+            return request
+
+        with self.cond:
+            self.requests += 1
+            self.pending.append(request)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._worker, daemon=True)
+                self.thread.start()
+            self.cond.notify()
+        return request
+
+    def submit(self, input_ids, max_new_tokens, temperature, deadline=None, priority=None):
+        """Queues a prompt and returns a Future resolving to the generated token ids."""
+        return self._enqueue(BatchRequest(input_ids, max_new_tokens, temperature, deadline=deadline, priority=priority)).future
+
+    def stream(self, input_ids, max_new_tokens, temperature, deadline=None, priority=None):
+        """Queues a prompt and yields generated token ids as they are decoded."""
+        request = self._enqueue(BatchRequest(input_ids, max_new_tokens, temperature, stream=True, deadline=deadline, priority=priority))
+        try:
+            while True:
+                item = request.stream.get()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            request.cancelled = True
+
+    def warm_prefix(self, input_ids):
+        """Prefills `input_ids` once and pins its key/values in the prefix cache."""
+        if self.prefix_cache is None:
+            return
+        try:
+            with self.scheduler.slot(self.model_name):
+                model, tokenizer = self.load_fn()
+                with torch.no_grad():
+                    _, past, attention_mask = self._forward(model, tokenizer, [None], [list(input_ids)])
+                self.prefix_cache.store(input_ids, self._extract_row(past, attention_mask, 0), pinned=True)
+        except Exception as e:
+            # Only a speed-up; requests still prefill the prefix themselves.
+            print(f"[Warning] Could not warm the {self.model_name} prefix cache: {e}")
+
+    def _worker(self):
+        while True:
+            with self.cond:
+                while not self.pending and not self.active:
+                    self.cond.wait()
+
+            if not self.active:
+                # Give concurrent callers a short window to join the first batch.
+                time.sleep(self.window)
+
+            with self.cond:
+                priority = min((r.priority for r in self.active + self.pending), default=None)
+            try:
+                with self.scheduler.slot(self.model_name, priority=priority):
+                    model, tokenizer = self.load_fn()
+                    self._run(model, tokenizer)
+            except Exception as e:
+                # A failed load or decode fails every request waiting on it, but the worker
+                # stays up so later requests get a fresh attempt instead of hanging.
+                with self.cond:
+                    failed, self.pending = self.active + self.pending, []
+                    self.active = []
+                for request in failed:
+                    if not request.future.done():
+                        request.fail(e)
+
+    def _take_pending(self, limit):
+        now = time.monotonic()
+        with self.cond:
+            expired = [r for r in self.pending if r.deadline is not None and now > r.deadline]
+            if expired:
+                self.pending = [r for r in self.pending if r.deadline is None or now <= r.deadline]
+                self.expired += len(expired)
+            # Stable, so requests of the same priority still join in arrival order.
+            self.pending.sort(key=lambda r: r.priority)
+            taken, self.pending = self.pending[:limit], self.pending[limit:]
+        for request in expired:
+            request.fail(DeadlineExceeded(f"Request deadline passed while queued for the {self.model_name} batch."))
+        return taken
+
+    def _eos_ids(self, model, tokenizer):
+        eos = model.generation_config.eos_token_id
+        if eos is None:
+            eos = tokenizer.eos_token_id
+        return set(eos) if isinstance(eos, (list, tuple)) else {eos}
+
+    def _extract_row(self, past, attention_mask, row):
+        index = attention_mask[row].nonzero().squeeze(-1)
+        return [(k[row:row + 1].index_select(2, index), v[row:row + 1].index_select(2, index)) for k, v in cache_layers(past)]
+
+    def _lookup(self, request):
+        sequence = request.input_ids + request.generated
+        if self.prefix_cache is None:
+            return None, sequence
+        length, layers = self.prefix_cache.lookup(sequence)
+        return layers, sequence[length:]
+
+    def _forward(self, model, tokenizer, row_layers, feeds):
+        """Runs one forward pass over rows that each have cached key/values (or None) plus tokens to feed.
+
+        Every row is laid out as [pad | cached prefix | pad | new tokens]; the attention
+        mask hides both pad runs and position ids continue from each row's own prefix.
+        """
+        batch_size = len(feeds)
+        past_width = max((layers[0][0].shape[2] for layers in row_layers if layers), default=0)
+        feed_width = max(len(feed) for feed in feeds)
+        pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+
+        attention_mask = torch.zeros((batch_size, past_width + feed_width), dtype=torch.long)
+        input_ids = torch.full((batch_size, feed_width), pad_id, dtype=torch.long)
+        for i, (layers, feed) in enumerate(zip(row_layers, feeds)):
+            cached = layers[0][0].shape[2] if layers else 0
+            attention_mask[i, past_width - cached:past_width] = 1
+            attention_mask[i, past_width + feed_width - len(feed):] = 1
+            input_ids[i, feed_width - len(feed):] = torch.tensor(feed, dtype=torch.long)
+
+        past = None
+        if past_width:
+            template = next(layers for layers in row_layers if layers)
+            merged = []
+            for layer_idx, (k_ref, v_ref) in enumerate(template):
+                keys, values = [], []
+                for layers in row_layers:
+                    if layers:
+                        k, v = layers[layer_idx]
+                        missing = past_width - k.shape[2]
+                        keys.append(F.pad(k, (0, 0, missing, 0)))
+                        values.append(F.pad(v, (0, 0, missing, 0)))
+                    else:
+                        keys.append(k_ref.new_zeros(k_ref.shape[:2] + (past_width,) + k_ref.shape[3:]))
+                        values.append(v_ref.new_zeros(v_ref.shape[:2] + (past_width,) + v_ref.shape[3:]))
+                merged.append((torch.cat(keys), torch.cat(values)))
+            past = build_cache(merged)
+
+        attention_mask = attention_mask.to(model.device)
+        position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)[:, past_width:]
+
+        outputs = model(input_ids=input_ids.to(model.device), attention_mask=attention_mask, position_ids=position_ids, past_key_values=past, use_cache=True)
+        self.prefills += 1
+        return outputs.logits[:, -1, :], outputs.past_key_values, attention_mask
+
+    def _sample(self, logits, rows, filters):
+        temperatures = torch.tensor([r.temperature for r in rows], dtype=logits.dtype, device=logits.device)
+        greedy = logits.argmax(dim=-1)
+        sampling = temperatures > 0
+        if not sampling.any():
+            return greedy
+
+        scaled = filter_logits(logits / temperatures.clamp(min=1e-5).unsqueeze(-1), *filters)
+        sampled = torch.multinomial(torch.softmax(scaled.float(), dim=-1), num_samples=1).squeeze(-1)
+        return torch.where(sampling, sampled, greedy)
+
+    def _run(self, model, tokenizer):
+        eos_ids = self._eos_ids(model, tokenizer)
+        filters = sampling_filters(model)
+        past, attention_mask = None, None
+        # Rows in the order of the cache's batch dimension. Finished rows linger here
+        # until the next rebuild when the cache cannot drop them in place.
+        batch_rows = []
+
+        with torch.no_grad():
+            while True:
+                joined = self._take_pending(self.max_batch_size - len(self.active))
+                if not self.active and not joined:
+                    return
+
+                if joined or past is None or len(batch_rows) != len(self.active):
+                    # Joined rows count as active straight away so a failed prefill fails them too.
+                    previous, self.active = self.active, self.active + joined
+                    row_layers, feeds = [], []
+                    for request in previous:
+                        if past is not None and request in batch_rows:
+                            row_layers.append(self._extract_row(past, attention_mask, batch_rows.index(request)))
+                            feeds.append([request.generated[-1]])
+                        else:
+                            layers, feed = self._lookup(request)
+                            row_layers.append(layers)
+                            feeds.append(feed)
+
+                    for request in joined:
+                        layers, feed = self._lookup(request)
+                        row_layers.append(layers)
+                        feeds.append(feed)
+
+                    logits, past, attention_mask = self._forward(model, tokenizer, row_layers, feeds)
+                    batch_rows = list(self.active)
+                    self.peak_batch_size = max(self.peak_batch_size, len(self.active))
+                else:
+                    step_ids = torch.tensor([r.generated[-1] for r in self.active], dtype=torch.long, device=attention_mask.device).unsqueeze(-1)
+                    attention_mask = torch.cat([attention_mask, attention_mask.new_ones((len(self.active), 1))], dim=-1)
+                    position_ids = attention_mask.sum(-1, keepdim=True) - 1
+
+                    outputs = model(input_ids=step_ids, attention_mask=attention_mask, position_ids=position_ids, past_key_values=past, use_cache=True)
+                    logits, past = outputs.logits[:, -1, :], outputs.past_key_values
+
+                next_tokens = self._sample(logits, self.active, filters).tolist()
+                self.steps += 1
+                self.step_rows += len(self.active)
+
+                keep = []
+                for i, (request, token) in enumerate(zip(self.active, next_tokens)):
+                    done = token in eos_ids
+                    if not done:
+                        request.emit(token)
+                        done = request.finished
+                    if not done:
+                        keep.append(i)
+                        continue
+
+                    if self.prefix_cache is not None:
+                        layers = self._extract_row(past, attention_mask, i)
+                        tokens = (request.input_ids + request.generated)[:layers[0][0].shape[2]]
+                        self.prefix_cache.store(tokens, layers)
+                    self._record(request)
+                    request.finish()
+
+                if len(keep) < len(self.active):
+                    self.active = [self.active[i] for i in keep]
+                    if self.active and hasattr(past, "batch_select_indices"):
+                        index = torch.tensor(keep, device=attention_mask.device)
+                        past.batch_select_indices(index)
+                        attention_mask = attention_mask[index]
+                        batch_rows = list(self.active)
+
+                if not self.active:
+                    past = None
+                    continue
+
+                if self.scheduler.should_yield(self.model_name, min(r.priority for r in self.active)):
+                    # Another model has waited past the fairness bound or has more urgent work;
+                    # hand over the accelerator and rebuild from the prefix cache when we get it back.
+                    return
+
+    def _record(self, request):
+        TOKENS_GENERATED.inc(len(request.generated), model=self.model_name)
+        if request.first_token_at is None:
+            return
+        TIME_TO_FIRST_TOKEN_SECONDS.observe(request.first_token_at - request.created, model=self.model_name)
+        decode_seconds = time.perf_counter() - request.first_token_at
+        if len(request.generated) > 1 and decode_seconds > 0:
+            DECODE_TOKENS_PER_SECOND.observe((len(request.generated) - 1) / decode_seconds, model=self.model_name)
+
+    def stats(self):
+        with self.cond:
+            stats = {
+                "queued": len(self.pending),
+                "active": len(self.active),
+                "requests": self.requests,
+                "prefills": self.prefills,
+                "decode_steps": self.steps,
+                "avg_batch_size": round(self.step_rows / self.steps, 2) if self.steps else 0.0,
+                "peak_batch_size": self.peak_batch_size,
+                "expired": self.expired,
+            }
+        if self.prefix_cache is not None:
+            stats["prefix_cache"] = self.prefix_cache.stats()
+        return stats
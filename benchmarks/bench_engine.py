@@ -0,0 +1,94 @@
+import itertools
+import argparse
+import time
+import sys
+import io
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+
+import omni_engine
+
+from stubs import install_stubs, sample_image, sample_speech
+from report import summarize, save_results, compare, print_table
+
+
+def timed(fn, iterations, warmup=1):
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def first_item_latency(make_iter):
+    """Returns a callable timing how long `make_iter()` takes to produce its first item (drains the rest)."""
+    def run():
+        start = time.perf_counter()
+        iterator = make_iter()
+        next(iterator, None)
+        latency = time.perf_counter() - start
+        for _ in iterator:
+            pass
+        return latency
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks of the omni_engine functions against stub models (offline, CPU).")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    parser.add_argument("--vision-ms", type=float, default=10.0, help="Stub vision model cost per image.")
+    parser.add_argument("--vision-batch-ms", type=float, default=50.0, help="Stub vision model cost per generate call.")
+    parser.add_argument("--tts-rtf", type=float, default=0.05, help="Stub TTS real-time factor.")
+    parser.add_argument("--stt-rtf", type=float, default=0.1, help="Stub STT real-time factor.")
+    parser.add_argument("--search-ms", type=float, default=100.0, help="Stub search backend latency.")
+    parser.add_argument("--output", default=None, help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", default=None, help="Compare against a previous --output file.")
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    install_stubs(omni_engine, args.vision_ms, args.tts_rtf, args.stt_rtf, args.search_ms, args.vision_batch_ms)
+    unique = itertools.count()
+    messages = [{"role": "system", "content": omni_engine.SYSTEM_PROMPT}, {"role": "user", "content": "Tell me about the weather on Mars."}]
+    reply = "The weather on Mars is cold and dusty. Storms can cover the whole planet. Summers are short."
+    image = sample_image()
+    images = [sample_image(seed) for seed in range(8)]
+    speech = sample_speech(3.0)
+
+    benches = {
+        "generate_text": lambda: omni_engine.generate_text(messages, max_new_tokens=args.max_new_tokens),
+        "stream_chat": lambda: list(omni_engine.stream_chat(messages)),
+        "generate_audio.cold": lambda: omni_engine.generate_audio(f"{reply} Take {next(unique)}."),
+        "generate_audio.cached": lambda: omni_engine.generate_audio(reply),
+        "generate_vision.cold": lambda: omni_engine.generate_vision(sample_image(1000 + next(unique)), "Describe this image."),
+        "generate_vision.cached": lambda: omni_engine.generate_vision(image, "Describe this image."),
+        "generate_vision_batch.8": lambda: omni_engine.generate_vision_batch([(data, "Describe this image.") for data in images]),
+        "transcribe_audio.3s": lambda: omni_engine.transcribe_audio(io.BytesIO(speech)),
+        "search_web.cold": lambda: omni_engine.search_web(f"mars weather {next(unique)}"),
+        "search_web.cached": lambda: omni_engine.search_web("mars weather"),
+    }
+
+    results = {}
+    for name, fn in benches.items():
+        results[name] = summarize(timed(fn, args.iterations))
+
+    ttft = first_item_latency(lambda: omni_engine.stream_text(messages, max_new_tokens=args.max_new_tokens))
+    results["stream_text.first_token"] = summarize([ttft() for _ in range(args.iterations)])
+    first_audio = first_item_latency(lambda: (item for item in omni_engine.stream_chat(messages) if item[0] == "audio"))
+    results["stream_chat.first_audio"] = summarize([first_audio() for _ in range(args.iterations)])
+
+    print_table(results)
+    if args.output:
+        save_results(args.output, "engine", vars(args), results)
+    if args.baseline:
+        compare(args.baseline, results)
+
+
+if __name__ == "__main__":
+    main()
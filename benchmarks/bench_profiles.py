@@ -0,0 +1,86 @@
+import subprocess
+import argparse
+import resource
+import json
+import time
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+
+from transformers import AutoModelForCausalLM, AutoTokenizer
+from profiles import PROFILES, get_profile
+
+
+PROMPT = "Explain in a few sentences why the sky is blue."
+
+
+def measure(profile_name, model_id, max_new_tokens):
+    """Loads `model_id` under one profile and returns its load time, memory and decode speed."""
+    profile = get_profile(profile_name)
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+
+    start = time.perf_counter()
+    model = profile.load_pretrained(AutoModelForCausalLM, model_id)
+    load_s = time.perf_counter() - start
+
+    inputs = tokenizer(PROMPT, return_tensors="pt").to(model.device)
+    with torch.no_grad():
+        model.generate(**inputs, max_new_tokens=4, do_sample=False)
+        start = time.perf_counter()
+        outputs = model.generate(**inputs, max_new_tokens=max_new_tokens, min_new_tokens=max_new_tokens, do_sample=False)
+        decode_s = time.perf_counter() - start
+
+    generated = outputs.shape[1] - inputs["input_ids"].shape[1]
+    return {
+        "profile": profile.name,
+        "load_s": round(load_s, 2),
+        # ru_maxrss is in KiB on Linux.
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "cuda_peak_mb": round(torch.cuda.max_memory_allocated() / 1024 ** 2, 1) if profile.device == "cuda" else None,
+        "tokens_per_s": round(generated / decode_s, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load time, memory and decode speed of the text LLM under each runtime profile.")
+    parser.add_argument("--model", default="microsoft/Phi-4-mini-instruct")
+    parser.add_argument("--profiles", default=None, help="Comma-separated profile names (default: every profile this machine supports).")
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--json", action="store_true", help="Print one JSON object per profile instead of a table.")
+    parser.add_argument("--only", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.only:
+        print(json.dumps(measure(args.only, args.model, args.max_new_tokens)))
+        return
+
+    if args.profiles:
+        names = [name.strip() for name in args.profiles.split(",") if name.strip()]
+    else:
+        names = [name for name, profile in PROFILES.items() if profile.device == "cpu" or torch.cuda.is_available()]
+
+    results = []
+    for name in names:
+        # Each profile runs in its own process so peak memory isn't inherited from the previous one.
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--only", name, "--model", args.model, "--max-new-tokens", str(args.max_new_tokens)], capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"[Warning] Profile '{name}' failed: {proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else proc.returncode}")
+            continue
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    if args.json:
+        for result in results:
+            print(json.dumps(result))
+        return
+
+    print(f"{'profile':<10} {'load_s':>8} {'rss_mb':>10} {'cuda_mb':>10} {'tok/s':>8}")
+    for r in results:
+        cuda_mb = r["cuda_peak_mb"] if r["cuda_peak_mb"] is not None else "-"
+        print(f"{r['profile']:<10} {r['load_s']:>8} {r['peak_rss_mb']:>10} {cuda_mb:>10} {r['tokens_per_s']:>8}")
+
+
+if __name__ == "__main__":
+    main()
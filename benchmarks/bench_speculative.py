@@ -0,0 +1,75 @@
+import argparse
+import time
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+
+import omni_engine
+
+from speculative import SpeculativeDecoder
+from stubs import install_stubs, build_scripted_lm, build_tiny_lm
+from report import save_results
+
+
+PROMPT = "Context: the rover landed in Jezero crater in February 2021 and has collected rock samples since. Question: where did the rover land? Answer from the context: the rover landed in"
+
+
+def decode_plain(input_ids, max_new_tokens):
+    return omni_engine.text_batcher.submit(input_ids, max_new_tokens, 0.0).result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Checks greedy speculative decoding against the batched path on a tiny CPU LM and reports acceptance and tokens/sec.")
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--draft-tokens", type=int, default=5)
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--output", default=None, help="Write the results to this JSON file.")
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    install_stubs(omni_engine)
+    tokenizer = omni_engine.get_text_tokenizer()
+    input_ids = tokenizer.apply_chat_template([{"role": "user", "content": PROMPT}], add_generation_prompt=True, return_dict=True)["input_ids"]
+    model, _ = omni_engine.load_text_brain()
+
+    plain = decode_plain(input_ids, args.max_new_tokens)
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        decode_plain(input_ids, args.max_new_tokens)
+    plain_tps = len(plain) * args.iterations / (time.perf_counter() - start)
+
+    # The same weights as the main model accept every draft; other weights show the overhead of bad drafts.
+    variants = {
+        "prompt-lookup": ("prompt-lookup", None),
+        "draft (same weights)": ("draft", build_scripted_lm(seed=0)),
+        "draft (other weights)": ("draft", build_tiny_lm(seed=1)),
+    }
+    results = {"plain": {"tokens_per_s": round(plain_tps, 1), "matches_plain": True}}
+    for name, (mode, draft_model) in variants.items():
+        decoder = SpeculativeDecoder(mode, args.draft_tokens)
+        output = list(decoder.generate(model, tokenizer, input_ids, args.max_new_tokens, 0.0, draft_model))
+        for _ in range(args.iterations - 1):
+            list(decoder.generate(model, tokenizer, input_ids, args.max_new_tokens, 0.0, draft_model))
+        stats = decoder.stats()
+        results[name] = {
+            "tokens_per_s": stats["tokens_per_s"],
+            "acceptance_rate": stats["acceptance_rate"],
+            "tokens_per_pass": stats["tokens_per_pass"],
+            "matches_plain": output == plain,
+        }
+
+    print(f"{'variant':<24}{'tok/s':>10}{'accept':>10}{'tok/pass':>10}{'matches':>10}")
+    for name, r in results.items():
+        print(f"{name:<24}{r['tokens_per_s']:>10}{r.get('acceptance_rate', '-'):>10}{r.get('tokens_per_pass', 1.0):>10}{'yes' if r['matches_plain'] else 'NO':>10}")
+    if args.output:
+        save_results(args.output, "speculative", vars(args), results)
+    if not all(r["matches_plain"] for r in results.values()):
+        print("[Warning] Greedy speculative output differs from the plain path.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
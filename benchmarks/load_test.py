@@ -0,0 +1,166 @@
+import threading
+import argparse
+import random
+import httpx
+import json
+import time
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stubs import install_stubs, sample_image, sample_speech
+from report import summarize, save_results, compare, print_table
+
+
+QUESTIONS = ["What is the capital of France?", "Tell me a short fact about octopuses.", "How do rainbows form?", "Suggest a name for a cat."]
+
+
+def start_stub_server(port, args):
+    """Runs the FastAPI app with stub models in a background uvicorn thread."""
+    import uvicorn
+    import omni_engine
+    install_stubs(omni_engine, args.vision_ms, args.tts_rtf, args.stt_rtf, args.search_ms, args.vision_batch_ms)
+    import server
+
+    uvicorn_server = uvicorn.Server(uvicorn.Config(server.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=uvicorn_server.run, daemon=True).start()
+    while not uvicorn_server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+
+def wait_ready(url, timeout=300):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{url}/readyz", timeout=5).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{url} did not become ready within {timeout}s")
+
+
+def read_events(response, started, marks):
+    """Consumes an SSE response, recording when the first token and first audio chunk arrived."""
+    for line in response.iter_lines():
+        if not line or not line.startswith("data: "):
+            continue
+        event = json.loads(line[6:])
+        if event["type"] in ("token", "audio"):
+            marks.setdefault(f"first_{event['type']}", time.perf_counter() - started)
+        elif event["type"] == "error":
+            raise RuntimeError(event["detail"])
+
+
+def chat_request(http, url, payloads, marks, started):
+    payload = {"user_input": random.choice(QUESTIONS), "session_id": payloads["session_id"], "use_search": random.random() < payloads["search_ratio"]}
+    with http.stream("POST", f"{url}/api/chat/stream", json=payload, timeout=120) as response:
+        response.raise_for_status()
+        read_events(response, started, marks)
+
+
+def vision_request(http, url, payloads, marks, started):
+    image = random.choice(payloads["images"])
+    response = http.post(f"{url}/api/vision", data={"prompt": "Describe this image.", "audio_delivery": "inline"}, files={"image_file": ("image.png", image, "image/png")}, timeout=120)
+    response.raise_for_status()
+
+
+def voice_request(http, url, payloads, marks, started):
+    data = {"session_id": payloads["session_id"]}
+    with http.stream("POST", f"{url}/api/voice", data=data, files={"file": ("speech.wav", payloads["speech"], "audio/wav")}, timeout=120) as response:
+        response.raise_for_status()
+        read_events(response, started, marks)
+
+
+REQUEST_KINDS = {"chat": chat_request, "vision": vision_request, "voice": voice_request}
+
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(","):
+        kind, _, weight = part.partition("=")
+        if kind.strip() not in REQUEST_KINDS:
+            raise ValueError(f"Unknown request kind '{kind}'. Choose from: {', '.join(REQUEST_KINDS)}.")
+        weights[kind.strip()] = float(weight or 1)
+    return weights
+
+
+def worker(url, weights, payloads, deadline, samples, lock):
+    http = httpx.Client()
+    session_id = http.post(f"{url}/api/sessions", timeout=30).json()["session_id"]
+    payloads = dict(payloads, session_id=session_id)
+    kinds, kind_weights = list(weights), list(weights.values())
+
+    while time.time() < deadline:
+        kind = random.choices(kinds, kind_weights)[0]
+        marks = {}
+        started = time.perf_counter()
+        try:
+            REQUEST_KINDS[kind](http, url, payloads, marks, started)
+            ok = True
+        except Exception as e:
+            print(f"[Warning] {kind} request failed: {e}")
+            ok = False
+        with lock:
+            samples.append((kind, ok, time.perf_counter() - started, marks))
+    http.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent mixed chat/vision/voice load against the OmniLocal API.")
+    parser.add_argument("--url", default=None, help="Target a running server instead of an in-process one with stub models.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of load after warm-up.")
+    parser.add_argument("--mix", default="chat=6,vision=2,voice=2", help="Relative weights of the request kinds.")
+    parser.add_argument("--search-ratio", type=float, default=0.2, help="Fraction of chat requests with web search.")
+    parser.add_argument("--vision-ms", type=float, default=10.0)
+    parser.add_argument("--vision-batch-ms", type=float, default=50.0)
+    parser.add_argument("--tts-rtf", type=float, default=0.05)
+    parser.add_argument("--stt-rtf", type=float, default=0.1)
+    parser.add_argument("--search-ms", type=float, default=100.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", default=None, help="Compare against a previous --output file.")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    weights = parse_mix(args.mix)
+    url = args.url or start_stub_server(args.port, args)
+    wait_ready(url)
+
+    # A few distinct images so the image cache sees both hits and misses.
+    payloads = {"images": [sample_image(seed) for seed in range(4)], "speech": sample_speech(2.0), "search_ratio": args.search_ratio}
+    samples, lock = [], threading.Lock()
+    start = time.perf_counter()
+    deadline = time.time() + args.duration
+    threads = [threading.Thread(target=worker, args=(url, weights, payloads, deadline, samples, lock)) for _ in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    results = {"all": summarize([s[2] for s in samples if s[1]], elapsed)}
+    for kind in weights:
+        done = [s for s in samples if s[0] == kind and s[1]]
+        results[kind] = summarize([s[2] for s in done], elapsed)
+        for mark in ("first_token", "first_audio"):
+            values = [s[3][mark] for s in done if mark in s[3]]
+            if values:
+                results[f"{kind}.{mark}"] = summarize(values)
+    errors = {kind: sum(1 for s in samples if s[0] == kind and not s[1]) for kind in weights}
+
+    print_table(results)
+    print(f"errors: {errors}")
+    if args.output:
+        config = {k: v for k, v in vars(args).items() if k not in ("output", "baseline")}
+        save_results(args.output, "load", dict(config, errors=errors), results)
+    if args.baseline:
+        compare(args.baseline, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import subprocess
+import platform
+import json
+import time
+import os
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = (len(ordered) - 1) * q / 100
+    lower = int(index)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (index - lower)
+
+
+def summarize(latencies, elapsed=None):
+    """Latency summary in milliseconds, plus throughput when the wall time is given."""
+    summary = {
+        "count": len(latencies),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+    if elapsed:
+        summary["throughput_rps"] = round(len(latencies) / elapsed, 2)
+    return summary
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def save_results(path, name, config, results):
+    payload = {
+        "benchmark": name,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "config": config,
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2)
+    print(f"[System] Results written to {path}")
+
+
+def compare(baseline_path, results, metric="p95_ms"):
+    """Prints the change of `metric` for every entry also present in a previous results file."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    print(f"\nChange in {metric} vs {baseline_path}:")
+    for name, summary in results.items():
+        before = baseline.get(name, {}).get(metric)
+        if not before or metric not in summary:
+            continue
+        change = (summary[metric] - before) / before * 100
+        print(f"  {name:<28} {before:>10.2f} -> {summary[metric]:>10.2f}  ({change:+.1f}%)")
+
+
+def print_table(results):
+    print(f"{'name':<28} {'count':>6} {'mean_ms':>10} {'p50_ms':>10} {'p95_ms':>10} {'p99_ms':>10} {'rps':>8}")
+    for name, s in results.items():
+        print(f"{name:<28} {s['count']:>6} {s['mean_ms']:>10} {s['p50_ms']:>10} {s['p95_ms']:>10} {s['p99_ms']:>10} {s.get('throughput_rps', '-'):>8}")
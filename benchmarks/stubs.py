@@ -0,0 +1,250 @@
+import numpy as np
+import time
+import io
+
+import torch
+
+from transformers import LlamaConfig, LlamaForCausalLM
+from types import SimpleNamespace
+from tts_service import TTSService, SAMPLE_RATE
+from stt_service import STTService, STT_SAMPLE_RATE
+from web_search import SearchBackend, SearchService
+
+
+VOCAB_SIZE = 512
+FIRST_CHAR = 3
+
+
+class StubTokenizer:
+    """Maps printable ASCII characters to token ids so a tiny random LM can stand in for the real one."""
+
+    pad_token_id = 0
+    eos_token_id = 1
+
+    def encode(self, text, add_special_tokens=False):
+        return [FIRST_CHAR + (ord(c) - 32) % 95 for c in text]
+
+    def apply_chat_template(self, messages, add_generation_prompt=False, return_dict=False, tokenize=True):
+        text = "".join(f"<{m['role']}>{m['content'] if isinstance(m['content'], str) else ''}\n" for m in messages)
+        if add_generation_prompt:
+            text += "<assistant>"
+        if not tokenize:
+            return text
+        ids = self.encode(text)
+        return {"input_ids": ids} if return_dict else ids
+
+    def decode(self, ids, skip_special_tokens=True):
+        # Ids above the printable range wrap around, so every token decodes to a character.
+        return "".join(chr(32 + (i - FIRST_CHAR) % 95) for i in ids if i >= FIRST_CHAR)
+
+    def batch_decode(self, sequences, skip_special_tokens=True):
+        return [self.decode(seq.tolist() if torch.is_tensor(seq) else seq) for seq in sequences]
+
+    def __call__(self, texts, padding=True, padding_side="left", return_tensors="pt"):
+        rows = [self.encode(text) for text in texts]
+        width = max(len(row) for row in rows)
+        input_ids = torch.full((len(rows), width), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(rows), width), dtype=torch.long)
+        for i, row in enumerate(rows):
+            input_ids[i, width - len(row):] = torch.tensor(row, dtype=torch.long)
+            attention_mask[i, width - len(row):] = 1
+        return StubEncoding(input_ids=input_ids, attention_mask=attention_mask)
+
+
+class StubEncoding(dict):
+    def to(self, device):
+        return StubEncoding({k: v.to(device) if torch.is_tensor(v) else v for k, v in self.items()})
+
+
+def build_tiny_lm(seed=0):
+    torch.manual_seed(seed)
+    config = LlamaConfig(vocab_size=VOCAB_SIZE, hidden_size=128, intermediate_size=256, num_hidden_layers=4, num_attention_heads=4, num_key_value_heads=4)
+    model = LlamaForCausalLM(config).eval()
+    model.generation_config.eos_token_id = None
+    return model
+
+
+SCRIPT = "Sure, here is a short answer. The stub model replies in whole sentences. Each one ends with a full stop, so speech can start early. "
+
+
+class ScriptedLM(LlamaForCausalLM):
+    """The tiny LM with its logits replaced by a looping scripted reply.
+
+    The forward pass and the KV cache are real, so costs stay realistic, but the text has
+    sentence boundaries for streaming TTS to split on. The next token only depends on the
+    sequence length, so batched, cached and speculative decoding all agree.
+    """
+
+    def forward(self, input_ids=None, attention_mask=None, past_key_values=None, **kwargs):
+        # Read before the forward pass, which appends to the cache.
+        past_length = past_key_values.get_seq_length() if past_key_values is not None else 0
+        outputs = super().forward(input_ids=input_ids, attention_mask=attention_mask, past_key_values=past_key_values, **kwargs)
+        width = input_ids.shape[1]
+        if attention_mask is not None:
+            # Left padding: a row's length is its count of real tokens so far.
+            lengths = attention_mask.cumsum(-1)[:, -width:]
+        else:
+            lengths = past_length + torch.arange(1, width + 1, device=input_ids.device).expand(input_ids.shape[0], -1)
+        script = torch.tensor(StubTokenizer().encode(SCRIPT), device=input_ids.device)
+        targets = script[lengths % len(script)]
+        logits = torch.zeros_like(outputs.logits)
+        outputs.logits = logits.scatter(-1, targets.unsqueeze(-1), 50.0)
+        return outputs
+
+
+def build_scripted_lm(seed=0):
+    torch.manual_seed(seed)
+    config = LlamaConfig(vocab_size=VOCAB_SIZE, hidden_size=128, intermediate_size=256, num_hidden_layers=4, num_attention_heads=4, num_key_value_heads=4)
+    model = ScriptedLM(config).eval()
+    model.generation_config.eos_token_id = None
+    return model
+
+
+class StubVisionProcessor:
+    """Shrinks images to a 4x4 grid of RGB patches and expands one placeholder token per patch."""
+
+    image_token = "#"
+    merge_size = 1
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        # The engine calls `processor.image_processor(...)`; the stub handles both roles.
+        self.image_processor = self
+
+    def __call__(self, images, return_tensors="pt"):
+        image = images[0].resize((32, 32))
+        pixels = torch.from_numpy(np.asarray(image, dtype=np.float32) / 255.0)
+        patches = pixels.reshape(4, 8, 4, 8, 3).permute(0, 2, 1, 3, 4).reshape(16, -1)
+        return {"pixel_values": patches, "image_grid_thw": torch.tensor([[1, 4, 4]])}
+
+    def apply_chat_template(self, messages, tokenize=False, add_generation_prompt=True):
+        parts = []
+        for m in messages:
+            for item in m["content"]:
+                parts.append(self.image_token if item["type"] == "image" else item["text"])
+        return f"<{messages[0]['role']}>{''.join(parts)}\n<assistant>"
+
+    def batch_decode(self, sequences, skip_special_tokens=True):
+        return self.tokenizer.batch_decode(sequences, skip_special_tokens)
+
+
+class StubVisionModel:
+    """Stands in for the vision LM and returns deterministic captions.
+
+    A call costs `ms_per_batch` (streaming the weights, decoding) plus `ms_per_image` per
+    image (the vision encoder), so batching saves time the way it does on the real model.
+    """
+
+    def __init__(self, ms_per_image=10.0, ms_per_batch=50.0):
+        self.ms_per_image = ms_per_image
+        self.ms_per_batch = ms_per_batch
+        self.device = torch.device("cpu")
+        self.caption = StubTokenizer().encode("A stub caption of the image. It has colours and shapes.")
+
+    def parameters(self):
+        return iter(())
+
+    def buffers(self):
+        return iter(())
+
+    def to(self, device):
+        return self
+
+    def generate(self, input_ids, attention_mask=None, pixel_values=None, image_grid_thw=None, max_new_tokens=32, **kwargs):
+        time.sleep((self.ms_per_batch + self.ms_per_image * len(image_grid_thw)) / 1000)
+        generated = torch.tensor([self.caption[:max_new_tokens]] * input_ids.shape[0], dtype=torch.long)
+        return torch.cat([input_ids, generated], dim=1)
+
+
+class StubTTSService(TTSService):
+    """Returns a tone whose length follows the text, taking `rtf` times the audio duration to make."""
+
+    def __init__(self, rtf=0.05, seconds_per_char=0.06, **kwargs):
+        super().__init__(**kwargs)
+        self.rtf = rtf
+        self.seconds_per_char = seconds_per_char
+
+    def load(self, lang="a"):
+        self.pipelines.setdefault(lang, None)
+        return None
+
+    def _synthesize(self, sentence, voice, speed, lang):
+        duration = len(sentence) * self.seconds_per_char / speed
+        with self.synth_lock:
+            time.sleep(duration * self.rtf)
+        t = np.arange(int(duration * SAMPLE_RATE), dtype=np.float32) / SAMPLE_RATE
+        return (0.1 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+
+class StubSTTService(STTService):
+    """Reads audio with soundfile and emits one segment per second, taking `rtf` times the audio duration."""
+
+    def __init__(self, rtf=0.1):
+        super().__init__(device="cpu", compute_type="int8")
+        self.rtf = rtf
+
+    def load(self, model_size=None):
+        model_size = model_size or self.default_size
+        self.models.setdefault(model_size, None)
+        return None
+
+    def iter_segments(self, audio, model_size=None, beam_size=None, vad=None, language=None):
+        import soundfile as sf
+        self.load(model_size)
+        if not isinstance(audio, np.ndarray):
+            audio, _ = sf.read(audio, dtype="float32")
+        duration = len(audio) / STT_SAMPLE_RATE
+        start = 0.0
+        while start < duration:
+            end = min(start + 1.0, duration)
+            time.sleep((end - start) * self.rtf)
+            yield SimpleNamespace(text=" hello there", start=start, end=end)
+            start = end
+
+
+class StubSearchBackend(SearchBackend):
+    name = "stub"
+
+    def __init__(self, latency_ms=100.0):
+        self.latency = latency_ms / 1000
+
+    def search(self, query, max_results):
+        time.sleep(self.latency)
+        return [{"title": f"Result {i} for {query}", "body": "Some body text about the query.", "href": f"https://example.invalid/{i}"} for i in range(max_results)]
+
+
+def install_stubs(engine, vision_ms=10.0, tts_rtf=0.05, stt_rtf=0.1, search_ms=100.0, vision_batch_ms=50.0):
+    """Swaps every model-backed component of `omni_engine` for a stub so it runs offline on CPU.
+
+    The real scheduler, batcher, prefix cache, model manager and caches stay in place, so
+    benchmarks still measure the code around the models.
+    """
+    tokenizer = StubTokenizer()
+    text_model = build_scripted_lm()
+    vision_processor = StubVisionProcessor(tokenizer)
+    vision_model = StubVisionModel(vision_ms, vision_batch_ms)
+
+    engine.get_text_tokenizer = lambda: tokenizer
+    engine.get_vision_processor = lambda: vision_processor
+    engine.model_manager.register("text", lambda: (text_model, tokenizer), "Stub text LM", estimate_bytes=0)
+    engine.model_manager.register("vision", lambda: (vision_model, vision_processor), "Stub vision LM", estimate_bytes=0)
+    engine.tts_service = StubTTSService(tts_rtf)
+    engine.stt_service = StubSTTService(stt_rtf)
+    engine.search_service = SearchService(backends=[StubSearchBackend(search_ms)])
+    return engine
+
+
+def sample_image(seed=0, size=(256, 256)):
+    from PIL import Image
+    rng = np.random.default_rng(seed)
+    buffer = io.BytesIO()
+    Image.fromarray(rng.integers(0, 255, (size[1], size[0], 3), dtype=np.uint8)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def sample_speech(seconds=2.0):
+    import soundfile as sf
+    t = np.arange(int(seconds * STT_SAMPLE_RATE), dtype=np.float32) / STT_SAMPLE_RATE
+    buffer = io.BytesIO()
+    sf.write(buffer, 0.2 * np.sin(2 * np.pi * 180 * t), STT_SAMPLE_RATE, format="WAV")
+    return buffer.getvalue()
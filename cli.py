@@ -1,14 +1,19 @@
 import subprocess
+import threading
 import platform
-import requests
+import httpx
+import queue
 import os
 
+from omni_client import OmniClient, OmniClientError, Conversation, save_audio
+
 
 print("Initializing OmniLocal CLI Client...\n")
 
-API_URL = os.getenv("OMNI_API_URL", "http://127.0.0.1:8000")
 CLIENT_AUDIO_DIR = "client_audio" 
 os.makedirs(CLIENT_AUDIO_DIR, exist_ok=True)
+client = OmniClient()
+conversation = Conversation(client)
 
 print("="*25)
 print("OmniLocal (CLI)")
@@ -18,25 +23,6 @@ print("- Type '/image [path/to/image.jpg]' to analyze an image.")
 print("- Type 'exit' to quit.")
 print("="*25)
 
-chat_history = []
-
-
-def download_audio(audio_url):
-    """Helper to download the audio file from the server."""
-    try:
-        filename = audio_url.split("/")[-1]
-        local_path = os.path.join(CLIENT_AUDIO_DIR, filename) 
-        response = requests.get(audio_url)
-
-        response.raise_for_status() 
-        
-        with open(local_path, "wb") as f:
-            f.write(response.content)
-        return local_path
-    except Exception as e:
-        print(f"  [Warning] Could not download audio: {e}") 
-        return audio_url
-
 
 def play_audio(file_path):
     try:
@@ -50,6 +36,20 @@ def play_audio(file_path):
         print(f"[Audio Error] Could not play audio: {e}")
 
 
+playback_queue = queue.Queue()
+
+
+def playback_worker():
+    """Plays sentence audio chunks in order while the reply is still streaming."""
+    while True:
+        file_path = playback_queue.get()
+        play_audio(file_path)
+        playback_queue.task_done()
+
+
+threading.Thread(target=playback_worker, daemon=True).start()
+
+
 while True:
     user_input = input("\nUser: ").strip()
     if user_input.lower() in ['exit', 'quit']:
@@ -74,23 +74,15 @@ while True:
             
         print("\nSending image to API...")
         try:
-            with open(image_path, "rb") as image_file:
-                res = requests.post(
-                    f"{API_URL}/api/vision", 
-                    data={"prompt": prompt},
-                    files={"image_file": image_file}
-                )
-            res.raise_for_status()
-            data = res.json()
+            data = client.vision(image_path, prompt)
             
             print(f"OmniLocal: {data['response_text']}")
-            saved_path = download_audio(data['audio_url'])
-            print(f"(Audio saved to {saved_path})")
-            
-            if os.path.exists(saved_path):
+            saved_path = client.save_response_audio(data, os.path.join(CLIENT_AUDIO_DIR, f"vision_{os.getpid()}.{data['audio_format']}"))
+            if saved_path:
+                print(f"(Audio saved to {saved_path})")
                 play_audio(saved_path)
                 
-        except requests.exceptions.RequestException as e:
+        except (httpx.HTTPError, OmniClientError) as e:
             print(f"[Connection Error] Make sure your FastAPI server is running. Details: {e}")
 
     else:
@@ -102,28 +94,24 @@ while True:
             query = user_input[8:].strip()
             
         print("\nSending request to API...")
-        payload = {
-            "user_input": query,
-            "chat_history": chat_history,
-            "use_search": use_search
-        }
         
         try:
-            res = requests.post(f"{API_URL}/api/chat", json=payload)
-            res.raise_for_status()
-            data = res.json()
+            chunk_index = 0
+            print("OmniLocal: ", end="", flush=True)
             
-            response_text = data["response_text"]
-            
-            chat_history.append({"role": "user", "content": query})
-            chat_history.append({"role": "assistant", "content": response_text})
-            
-            print(f"OmniLocal: {response_text}")
-            saved_path = download_audio(data['audio_url'])
-            print(f"(Audio saved to {saved_path})")
-            
-            if os.path.exists(saved_path):
-                play_audio(saved_path)
+            for event in conversation.stream(query, use_search):
+                if event["type"] == "session_renewed":
+                    print("[System] Session expired, starting a new conversation.")
+                elif event["type"] == "token":
+                    print(event["text"], end="", flush=True)
+                elif event["type"] == "audio":
+                    chunk_index += 1
+                    playback_queue.put(save_audio(event["data"], os.path.join(CLIENT_AUDIO_DIR, f"stream_{os.getpid()}_{chunk_index}.{event['format']}")))
+                elif event["type"] == "error":
+                    print(f"\n[Server Error] {event['detail']}")
+            print()
+                
+            playback_queue.join()
             
-        except requests.exceptions.RequestException as e:
+        except (httpx.HTTPError, OmniClientError) as e:
             print(f"[Connection Error] Make sure your FastAPI server is running. Details: {e}")
@@ -0,0 +1,397 @@
+import numpy as np
+import threading
+import argparse
+import functools
+import io
+import os
+
+from multiprocessing.connection import Listener, Client
+from multiprocessing import shared_memory, resource_tracker
+from concurrent.futures import ThreadPoolExecutor
+from admission import request_deadline, request_priority
+from scheduler import DeadlineExceeded
+
+
+DEFAULT_SOCKET = "/tmp/omnilocal-engine.sock"
+SHM_MIN_BYTES = int(os.getenv("OMNI_SHM_MIN_BYTES", str(64 * 1024)))
+
+# Everything the HTTP server uses from omni_engine; only these paths can be called remotely.
+EXPOSED = {
+    "initialize", "count_tokens", "summarize_history", "search_web",
+    "generate_text", "stream_text", "stream_chat", "generate_vision", "generate_vision_batch", "generate_audio", "transcribe_audio",
+    "PROFILE.to_dict", "warmup.ready", "warmup.stats",
+    "model_manager.stats", "scheduler.stats", "text_batcher.stats", "speculative_decoder.stats", "search_service.stats",
+    "tts_service.stats", "stt_service.stats", "stt_service.transcribe", "stt_service.iter_segments",
+    "image_cache.stats", "response_cache.stats",
+}
+# State the HTTP workers share, hosted by the EngineServer itself rather than omni_engine.
+HOSTED = {
+    "session_store.create", "session_store.get", "session_store.append", "session_store.trim", "session_store.delete", "session_store.stats",
+    "audio_store.put", "audio_store.pop", "audio_store.stats",
+    "job_manager.submit", "job_manager.status", "job_manager.stats",
+}
+STREAMING = {"stream_text", "stream_chat", "stt_service.iter_segments"}
+CONSTANTS = ("DEVICE", "SYSTEM_PROMPT", "MAX_NEW_TOKENS", "TEMPERATURE", "HISTORY_TOKEN_BUDGET", "HISTORY_KEEP_RATIO", "SUMMARIZE_HISTORY", "SAMPLE_RATE", "DEFAULT_VOICE")
+
+
+# Errors the endpoints turn into 4xx answers keep their type across the socket; anything else arrives as RemoteEngineError.
+REMOTE_ERRORS = {error.__name__: error for error in (ValueError, PermissionError, FileNotFoundError, OSError, DeadlineExceeded)}
+
+
+class RemoteEngineError(RuntimeError):
+    pass
+
+
+class HungUp(Exception):
+    """The worker on the other end of a connection went away."""
+
+
+def _create(size):
+    # The receiving side unlinks the segment, so the creating process must not clean it up at exit.
+    shm = shared_memory.SharedMemory(create=True, size=size)
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+class SharedRef:
+    """Pickled in place of a large bytes payload or array; the data itself travels in shared memory."""
+
+    def __init__(self, name, size, dtype=None, shape=None):
+        self.name = name
+        self.size = size
+        self.dtype = dtype
+        self.shape = shape
+
+    @classmethod
+    def put(cls, value):
+        array = value if isinstance(value, np.ndarray) else np.frombuffer(value, dtype=np.uint8)
+        shm = _create(max(array.nbytes, 1))
+        try:
+            np.ndarray(array.shape, array.dtype, buffer=shm.buf)[...] = array
+        finally:
+            shm.close()
+        if isinstance(value, np.ndarray):
+            return cls(shm.name, array.nbytes, array.dtype.str, array.shape)
+        return cls(shm.name, array.nbytes)
+
+    def take(self):
+        """Copies the payload out and frees the segment; each ref is read exactly once."""
+        shm = shared_memory.SharedMemory(name=self.name)
+        try:
+            if self.dtype is None:
+                return bytes(shm.buf[:self.size])
+            return np.ndarray(self.shape, np.dtype(self.dtype), buffer=shm.buf).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def discard(self):
+        try:
+            shm = shared_memory.SharedMemory(name=self.name)
+        except FileNotFoundError:
+            return
+        shm.close()
+        shm.unlink()
+
+
+class FilePayload:
+    """A file-like argument (an upload, a BytesIO) sent as its contents and reopened as BytesIO."""
+
+    def __init__(self, data):
+        self.data = data
+
+
+def pack(value):
+    if isinstance(value, (bytes, bytearray, np.ndarray)):
+        nbytes = value.nbytes if isinstance(value, np.ndarray) else len(value)
+        return SharedRef.put(value) if nbytes >= SHM_MIN_BYTES else value
+    if hasattr(value, "read"):
+        return FilePayload(pack(value.read()))
+    if isinstance(value, (list, tuple)):
+        return type(value)(pack(item) for item in value)
+    if isinstance(value, dict):
+        return {key: pack(item) for key, item in value.items()}
+    return value
+
+
+def unpack(value):
+    if isinstance(value, SharedRef):
+        return value.take()
+    if isinstance(value, FilePayload):
+        return io.BytesIO(unpack(value.data))
+    if isinstance(value, (list, tuple)):
+        return type(value)(unpack(item) for item in value)
+    if isinstance(value, dict):
+        return {key: unpack(item) for key, item in value.items()}
+    return value
+
+
+def discard(value):
+    """Frees the shared memory of a packed value that will never be unpacked."""
+    if isinstance(value, SharedRef):
+        value.discard()
+    elif isinstance(value, FilePayload):
+        discard(value.data)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            discard(item)
+    elif isinstance(value, dict):
+        for item in value.values():
+            discard(item)
+
+
+def authkey_from_env():
+    # Calls are unpickled on both ends, so an unauthenticated peer could run code in the other process.
+    key = os.getenv("OMNI_ENGINE_AUTHKEY")
+    if not key:
+        raise RuntimeError("OMNI_ENGINE_AUTHKEY must be set to the same secret for the engine and every HTTP worker.")
+    return key.encode("utf-8")
+
+
+class EngineServer:
+    """Serves one omni_engine to every HTTP worker over a Unix socket.
+
+    Each connection gets a thread and handles one call at a time, so concurrent
+    requests from the workers still meet in the engine's scheduler and batcher.
+    Streaming calls answer with ("item", value) messages followed by ("end", None); a
+    worker that abandons a stream sends a "cancel" message and reads up to that end.
+    A call carries the caller's request deadline and lane priority, which are set for the
+    engine while it runs.
+    """
+
+    def __init__(self, address=None, authkey=None):
+        # Checked before the engine import, so a missing key fails fast.
+        self.authkey = authkey or authkey_from_env()
+        import omni_engine
+        from metrics import REGISTRY, process_memory
+        from sessions import SessionStore
+        from audio_store import AudioStore
+        from batch_jobs import JobManager
+        self.engine = omni_engine
+        self.hosted = {"session_store": SessionStore(), "audio_store": AudioStore(), "job_manager": JobManager(omni_engine)}
+        self.address = address or os.getenv("OMNI_ENGINE_SOCKET", DEFAULT_SOCKET)
+        self.handlers = {
+            "constants": self._constants,
+            "metrics_snapshot": REGISTRY.snapshot,
+            "process_memory": process_memory,
+        }
+        for path in EXPOSED:
+            self.handlers[path] = functools.reduce(getattr, path.split("."), omni_engine)
+        for path in HOSTED:
+            owner, name = path.split(".")
+            self.handlers[path] = getattr(self.hosted[owner], name)
+
+    def _constants(self):
+        constants = {name: getattr(self.engine, name) for name in CONSTANTS}
+        constants["WARMUP_TASKS"] = list(self.engine.WARMUP_TASKS)
+        return constants
+
+    def _send(self, conn, message):
+        try:
+            conn.send(message)
+        except Exception as e:
+            discard(message[1])
+            raise HungUp() from e
+
+    def _cancelled(self, conn):
+        """True once the worker asked to stop an abandoned stream, the only message it sends mid-stream."""
+        try:
+            if not conn.poll():
+                return False
+            conn.recv()
+        except (EOFError, OSError) as e:
+            raise HungUp() from e
+        return True
+
+    def _handle(self, conn):
+        try:
+            while True:
+                try:
+                    path, args, kwargs, deadline, priority = conn.recv()
+                except (EOFError, OSError):
+                    return
+                if path == "cancel":
+                    # Arrived after its stream had already ended; the worker still drains up to that end.
+                    continue
+                handler = self.handlers.get(path)
+                token = request_deadline.set(deadline)
+                priority_token = request_priority.set(priority)
+                try:
+                    args, kwargs = unpack(args), unpack(kwargs)
+                    if handler is None:
+                        raise AttributeError(f"omni_engine.{path} is not exposed.")
+                    result = handler(*args, **kwargs)
+                    if path not in STREAMING:
+                        self._send(conn, ("result", pack(result)))
+                        continue
+                    try:
+                        for item in result:
+                            self._send(conn, ("item", pack(item)))
+                            if self._cancelled(conn):
+                                break
+                    finally:
+                        # Stops decoding if the worker hung up mid-stream.
+                        if hasattr(result, "close"):
+                            result.close()
+                    self._send(conn, ("end", None))
+                except HungUp:
+                    return
+                except Exception as e:
+                    name = next((cls.__name__ for cls in type(e).__mro__ if cls.__name__ in REMOTE_ERRORS), type(e).__name__)
+                    self._send(conn, ("error", (name, str(e))))
+                finally:
+                    request_deadline.reset(token)
+                    request_priority.reset(priority_token)
+        except HungUp:
+            return
+        finally:
+            conn.close()
+
+    def serve_forever(self):
+        if os.path.exists(self.address):
+            os.remove(self.address)
+        # Bind with an owner-only umask so the socket is never reachable by other users, not even briefly.
+        umask = os.umask(0o177)
+        try:
+            listener = Listener(self.address, family="AF_UNIX", authkey=self.authkey)
+        finally:
+            os.umask(umask)
+        print(f"[System] Engine listening on {self.address}")
+        self.engine.initialize()
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                print(f"[Warning] Rejected engine connection: {e}")
+                continue
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+
+class RemoteAttr:
+    def __init__(self, engine, path):
+        self.engine = engine
+        self.path = path
+
+    def __getattr__(self, name):
+        return RemoteAttr(self.engine, f"{self.path}.{name}")
+
+    def __call__(self, *args, **kwargs):
+        return self.engine.call(self.path, *args, **kwargs)
+
+
+class RemoteEngine:
+    """Stands in for the omni_engine module in an HTTP worker, forwarding calls to the EngineServer.
+
+    Attribute access mirrors the module (`engine.scheduler.stats()`), constants are
+    fetched once, and connections are pooled and reused between calls.
+    """
+
+    def __init__(self, address=None, authkey=None):
+        self.address = address or os.getenv("OMNI_ENGINE_SOCKET", DEFAULT_SOCKET)
+        self.authkey = authkey or authkey_from_env()
+        self.idle = []
+        self.lock = threading.Lock()
+        self.constants = None
+        self.search_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="remote-search")
+
+    def _connect(self):
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+        return Client(self.address, family="AF_UNIX", authkey=self.authkey)
+
+    def _release(self, conn):
+        with self.lock:
+            self.idle.append(conn)
+
+    def _decode(self, message):
+        kind, value = message
+        if kind == "error":
+            name, message = value
+            raise REMOTE_ERRORS.get(name, RemoteEngineError)(message)
+        return kind, unpack(value)
+
+    def _request(self, conn, path, args, kwargs, deadline, priority):
+        args, kwargs = pack(args), pack(kwargs)
+        try:
+            conn.send((path, args, kwargs, deadline, priority))
+        except Exception:
+            discard((args, kwargs))
+            conn.close()
+            raise
+
+    def call(self, path, *args, **kwargs):
+        # Monotonic deadlines compare across processes on the same host.
+        deadline, priority = request_deadline.get(), request_priority.get()
+        if path in STREAMING:
+            return self._stream(path, args, kwargs, deadline, priority)
+        conn = self._connect()
+        self._request(conn, path, args, kwargs, deadline, priority)
+        try:
+            message = conn.recv()
+        except BaseException:
+            conn.close()
+            raise
+        # The exchange is complete even if the engine answered with an error, so the connection is reusable.
+        self._release(conn)
+        return self._decode(message)[1]
+
+    def _stream(self, path, args, kwargs, deadline, priority):
+        conn = self._connect()
+        self._request(conn, path, args, kwargs, deadline, priority)
+        finished = False
+        try:
+            while True:
+                message = conn.recv()
+                # An error ends the stream just like "end" does.
+                finished = message[0] in ("end", "error")
+                kind, value = self._decode(message)
+                if kind == "end":
+                    return
+                yield value
+        finally:
+            if finished:
+                self._release(conn)
+            else:
+                # Runs from generator cleanup, possibly on the event loop, so it must not block here.
+                threading.Thread(target=self._cancel, args=(conn,), daemon=True).start()
+
+    def _cancel(self, conn):
+        """Stops an abandoned stream and frees the shared memory of the messages nobody will read.
+
+        Shared memory is only unlinked by the reader, so unread items would otherwise leak
+        their segments. The connection is reusable once the engine's "end" arrives.
+        """
+        try:
+            conn.send(("cancel", None, None, None, None))
+            while True:
+                kind, value = conn.recv()
+                if kind != "item":
+                    break
+                discard(value)
+        except (EOFError, OSError):
+            conn.close()
+            return
+        self._release(conn)
+
+    def search_web_async(self, query, max_results=5):
+        return self.search_executor.submit(self.call, "search_web", query, max_results)
+
+    def __getattr__(self, name):
+        if name.isupper():
+            if self.constants is None:
+                self.constants = self.call("constants")
+            if name in self.constants:
+                return self.constants[name]
+        return RemoteAttr(self, name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the models in one process that every HTTP worker shares over a Unix socket.")
+    parser.add_argument("--socket", default=None, help=f"Socket path (default: OMNI_ENGINE_SOCKET or {DEFAULT_SOCKET}).")
+    args = parser.parse_args()
+    EngineServer(args.socket).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import threading
+import hashlib
+import os
+
+from collections import OrderedDict
+
+
+def image_key(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+class ImageCache:
+    """LRU cache of preprocessed vision inputs keyed by the hash of the encoded image.
+
+    Entries hold the image processor output for a single image (`pixel_values` and
+    `image_grid_thw`) on the CPU, so asking about the same image again skips decoding,
+    resizing and patching it.
+    """
+
+    def __init__(self, max_bytes=None):
+        if max_bytes is None:
+            max_bytes = float(os.getenv("OMNI_IMAGE_CACHE_MB", "512")) * 1024 ** 2
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, features):
+        nbytes = sum(t.numel() * t.element_size() for t in features.values())
+        if nbytes > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                return
+            self.entries[key] = (features, nbytes)
+            self.bytes += nbytes
+            while self.bytes > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.bytes -= evicted
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "memory_mb": round(self.bytes / 1024 ** 2, 2),
+                "max_memory_mb": round(self.max_bytes / 1024 ** 2, 2),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
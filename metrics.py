@@ -0,0 +1,214 @@
+import contextvars
+import threading
+import bisect
+import time
+import uuid
+import math
+import sys
+import os
+
+from contextlib import contextmanager
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for v in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.values)
+
+    def combine(self, a, b):
+        return a + b
+
+    def samples(self, remote=None):
+        """Label dicts and values, with `remote` (another process's snapshot of this metric) folded in."""
+        values = self.snapshot()
+        for key, value in (remote or {}).items():
+            values[key] = self.combine(values[key], value) if key in values else value
+        return [(dict(zip(self.labelnames, key)), value) for key, value in values.items()]
+
+    def render(self, remote=None):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in self.samples(remote):
+            lines.append(f"{self.name}{format_labels(labels)} {format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def combine(self, a, b):
+        return b
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value)
+
+    def snapshot(self):
+        with self.lock:
+            return {key: (list(counts), total) for key, (counts, total) in self.values.items()}
+
+    def combine(self, a, b):
+        return [x + y for x, y in zip(a[0], b[0])], a[1] + b[1]
+
+    def render(self, remote=None):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for labels, (counts, total) in self.samples(remote):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{format_labels({**labels, 'le': format_value(float(bound))})} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(labels)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Holds metrics and scrape-time collectors and renders them in the Prometheus text format.
+
+    A collector is a callable returning (name, kind, documentation, [(labels, value), ...])
+    tuples, for values that other components already track in their `stats()`.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def snapshot(self):
+        """Every metric's values, for a process that renders them together with its own."""
+        return {metric.name: metric.snapshot() for metric in self.metrics}
+
+    def render(self, remote=None):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render((remote or {}).get(metric.name)))
+        for collector in self.collectors:
+            try:
+                families = collector()
+            except Exception as e:
+                print(f"[Warning] Metrics collector failed: {e}")
+                continue
+            for name, kind, documentation, samples in families:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(f"{name}{format_labels(labels)} {format_value(value)}" for labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUESTS = Counter("omni_requests_total", "HTTP requests by endpoint and status code.", ["endpoint", "status"])
+REQUEST_SECONDS = Histogram("omni_request_seconds", "Time until the response headers are sent (streamed bodies continue afterwards).", ["endpoint"])
+STAGE_SECONDS = Histogram("omni_stage_seconds", "Time spent in each stage of a request.", ["endpoint", "stage"])
+MODEL_LOAD_SECONDS = Histogram("omni_model_load_seconds", "Time to load a model or restore it from CPU RAM.", ["model", "kind"], buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0))
+SCHEDULER_WAIT_SECONDS = Histogram("omni_scheduler_wait_seconds", "Time a request waited for its turn on the accelerator.", ["model"])
+TOKENS_GENERATED = Counter("omni_tokens_generated_total", "Tokens generated by the batched LLM.", ["model"])
+TIME_TO_FIRST_TOKEN_SECONDS = Histogram("omni_time_to_first_token_seconds", "Queueing plus prefill time until a request's first token.", ["model"])
+DECODE_TOKENS_PER_SECOND = Histogram("omni_decode_tokens_per_second", "Per-request decode speed after the first token.", ["model"], buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 250))
+RESPONSE_CACHE_LOOKUPS = Counter("omni_response_cache_lookups_total", "Response cache lookups by kind and result (memory, disk or miss).", ["kind", "result"])
+SPECULATIVE_DRAFT_TOKENS = Counter("omni_speculative_draft_tokens_total", "Speculative decoding draft tokens proposed and accepted by the main model.", ["mode", "result"])
+ADMISSION_DECISIONS = Counter("omni_admission_decisions_total", "Requests admitted, rejected with a full queue, or expired while queued, per lane.", ["lane", "result"])
+ADMISSION_WAIT_SECONDS = Histogram("omni_admission_wait_seconds", "Time admitted requests waited in their lane queue.", ["lane"])
+TTS_REAL_TIME_FACTOR = Histogram("omni_tts_real_time_factor", "Synthesis time divided by the duration of the synthesized audio.", buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0))
+
+
+def process_memory():
+    """Resident memory of this process and, once it uses CUDA, PyTorch's allocated and reserved memory."""
+    memory = {"rss": None, "cuda": {}}
+    if os.path.exists("/proc/self/statm"):
+        with open("/proc/self/statm") as f:
+            memory["rss"] = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    # Only look at torch if something already imported it, so light processes stay light.
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available() and torch.cuda.is_initialized():
+        memory["cuda"] = {"allocated": torch.cuda.memory_allocated(), "reserved": torch.cuda.memory_reserved()}
+    return memory
+
+
+current_trace = contextvars.ContextVar("omni_trace", default=None)
+
+
+class Trace:
+    """Per-request trace id and stage timings, carried in a context variable."""
+
+    def __init__(self, endpoint, trace_id=None):
+        self.endpoint = endpoint
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.stages = {}
+
+    def server_timing(self):
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items())
+
+
+def observe_stage(name, seconds):
+    """Records a stage duration in the stage histogram and on the current trace, if any."""
+    trace = current_trace.get()
+    STAGE_SECONDS.observe(seconds, endpoint=trace.endpoint if trace else "internal", stage=name)
+    if trace is not None:
+        trace.stages[name] = trace.stages.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - start)
@@ -0,0 +1,171 @@
+import threading
+import time
+import gc
+import os
+
+import torch
+
+from metrics import MODEL_LOAD_SECONDS
+
+
+GB = 1024 ** 3
+
+
+def get_footprint(model):
+    if hasattr(model, "get_memory_footprint"):
+        return model.get_memory_footprint()
+    params = sum(p.numel() * p.element_size() for p in model.parameters())
+    buffers = sum(b.numel() * b.element_size() for b in model.buffers())
+    return params + buffers
+
+
+def default_budget(device):
+    env_budget = os.getenv("OMNI_MODEL_BUDGET_GB")
+    if env_budget:
+        return float(env_budget) * GB
+    if device.startswith("cuda"):
+        reserve = float(os.getenv("OMNI_GPU_RESERVE_GB", "2")) * GB
+        return max(torch.cuda.get_device_properties(0).total_memory - reserve, 0)
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") * 0.6
+    except (AttributeError, ValueError, OSError):
+        return float("inf")
+
+
+class ModelEntry:
+    def __init__(self, name, loader, label=None, estimate_bytes=0, offloadable=True):
+        self.name = name
+        self.label = label or name
+        self.loader = loader
+        self.offloadable = offloadable
+        self.model = None
+        self.processor = None
+        self.state = "unloaded"
+        self.footprint = estimate_bytes
+        self.last_used = 0.0
+        self.loads = 0
+        self.restores = 0
+        self.offloads = 0
+        self.evictions = 0
+        self.load_seconds = []
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "footprint_gb": round(self.footprint / GB, 3),
+            "loads": self.loads,
+            "restores": self.restores,
+            "offloads": self.offloads,
+            "evictions": self.evictions,
+            "last_load_s": round(self.load_seconds[-1], 3) if self.load_seconds else None,
+            "avg_load_s": round(sum(self.load_seconds) / len(self.load_seconds), 3) if self.load_seconds else None,
+            "last_used": self.last_used,
+        }
+
+
+class ModelManager:
+    """Keeps as many registered models resident as the memory budget allows.
+
+    Models live in one of three states: "device" (ready to run), "cpu" (offloaded
+    to system RAM, cheap to restore) or "unloaded". Under memory pressure the least
+    recently used model is offloaded to CPU first and only dropped entirely once
+    the offload budget is exhausted as well.
+    """
+
+    def __init__(self, device, budget_bytes=None, offload_budget_bytes=None):
+        self.device = device
+        self.budget = default_budget(device) if budget_bytes is None else budget_bytes
+        if offload_budget_bytes is None:
+            offload_budget_bytes = float(os.getenv("OMNI_OFFLOAD_BUDGET_GB", "16")) * GB
+        self.offload_budget = offload_budget_bytes if device != "cpu" else 0
+        self.entries = {}
+        self.swaps = 0
+        self.lock = threading.RLock()
+
+    def register(self, name, loader, label=None, estimate_bytes=0, offloadable=True):
+        with self.lock:
+            self.entries[name] = ModelEntry(name, loader, label, estimate_bytes, offloadable)
+
+    def _used(self, state):
+        return sum(e.footprint for e in self.entries.values() if e.state == state)
+
+    def _lru(self, state, exclude):
+        candidates = [e for e in self.entries.values() if e.state == state and e.name != exclude]
+        return min(candidates, key=lambda e: e.last_used) if candidates else None
+
+    def _drop(self, entry):
+        print(f"\n[System] Unloading {entry.label}...")
+        entry.model, entry.processor = None, None
+        entry.state = "unloaded"
+        entry.evictions += 1
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def _offload(self, entry):
+        if not entry.offloadable:
+            self._drop(entry)
+            return
+        while self._used("cpu") + entry.footprint > self.offload_budget:
+            victim = self._lru("cpu", entry.name)
+            if victim is None:
+                self._drop(entry)
+                return
+            self._drop(victim)
+
+        print(f"\n[System] Offloading {entry.label} to CPU RAM...")
+        entry.model.to("cpu")
+        entry.state = "cpu"
+        entry.offloads += 1
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def _make_room(self, entry):
+        while self._used("device") + entry.footprint > self.budget:
+            victim = self._lru("device", entry.name)
+            if victim is None:
+                return
+            self.swaps += 1
+            self._offload(victim)
+
+    def acquire(self, name):
+        """Returns (model, processor) for `name`, loading or restoring it onto the device if needed."""
+        with self.lock:
+            entry = self.entries[name]
+            entry.last_used = time.time()
+            if entry.state == "device":
+                return entry.model, entry.processor
+
+            self._make_room(entry)
+            start = time.perf_counter()
+
+            if entry.state == "cpu":
+                print(f"[System] Restoring {entry.label} from CPU RAM...")
+                entry.model.to(self.device)
+                entry.restores += 1
+                kind = "restore"
+            else:
+                print(f"[System] Loading {entry.label}...")
+                entry.model, entry.processor = entry.loader()
+                entry.footprint = get_footprint(entry.model)
+                entry.loads += 1
+                kind = "load"
+
+            entry.state = "device"
+            entry.load_seconds.append(time.perf_counter() - start)
+            MODEL_LOAD_SECONDS.observe(entry.load_seconds[-1], model=name, kind=kind)
+            # The real footprint is only known after the first load, so re-check the budget.
+            self._make_room(entry)
+            return entry.model, entry.processor
+
+    def stats(self):
+        with self.lock:
+            return {
+                "device": self.device,
+                "budget_gb": round(self.budget / GB, 3) if self.budget != float("inf") else None,
+                "offload_budget_gb": round(self.offload_budget / GB, 3),
+                "resident_gb": round(self._used("device") / GB, 3),
+                "offloaded_gb": round(self._used("cpu") / GB, 3),
+                "swaps": self.swaps,
+                "models": {name: entry.stats() for name, entry in self.entries.items()},
+            }
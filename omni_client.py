@@ -0,0 +1,419 @@
+import argparse
+import asyncio
+import base64
+import httpx
+import json
+import time
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+API_URL = os.getenv("OMNI_API_URL", "http://127.0.0.1:8000")
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".gif"}
+# Statuses that mean the server did not process the request, so it is safe to send it again.
+RETRY_STATUSES = {429, 503}
+
+
+class OmniClientError(Exception):
+    pass
+
+
+class SessionExpired(OmniClientError):
+    pass
+
+
+def default_timeout():
+    return httpx.Timeout(float(os.getenv("OMNI_CLIENT_TIMEOUT_S", "120")), connect=5.0)
+
+
+def default_limits(max_connections):
+    return httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+
+
+def retry_delay(response, attempt, backoff):
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), 30.0)
+    return backoff * 2 ** attempt
+
+
+def parse_sse_line(line):
+    if line and line.startswith("data: "):
+        return json.loads(line[6:])
+    return None
+
+
+def check_response(response):
+    if response.status_code == 404 and "Session" in response.text:
+        raise SessionExpired(response.json().get("detail", "Session not found or expired."))
+    if response.status_code >= 400:
+        try:
+            detail = response.json().get("detail", response.text)
+        except ValueError:
+            detail = response.text
+        raise OmniClientError(f"{response.status_code}: {detail}")
+
+
+def image_files(directory):
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS)
+
+
+def read_bytes(source):
+    """Accepts a path, bytes or a binary file object."""
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            return f.read()
+    return source.read()
+
+
+def decode_audio_field(data):
+    """Returns the inline audio of an OmniResponse as bytes, or None when it was delivered by URL."""
+    return base64.b64decode(data["audio_base64"]) if data.get("audio_base64") else None
+
+
+def save_audio(audio, path):
+    """Writes audio bytes, or the base64 text of a streamed audio event, to `path` and returns it."""
+    if isinstance(audio, str):
+        audio = base64.b64decode(audio)
+    with open(path, "wb") as f:
+        f.write(audio)
+    return path
+
+
+def chat_payload(user_input, session_id, use_search, **options):
+    payload = {"user_input": user_input, "session_id": session_id, "use_search": use_search}
+    payload.update({key: value for key, value in options.items() if value is not None})
+    return payload
+
+
+class OmniClient:
+    """Blocking OmniLocal API client with pooled keep-alive connections, timeouts and retries.
+
+    Connection failures and 429/503 answers are retried with exponential backoff (or the
+    server's Retry-After); anything else is raised as OmniClientError, and a 404 for an
+    unknown session as SessionExpired.
+    """
+
+    def __init__(self, base_url=None, timeout=None, retries=3, backoff=0.5, max_connections=10):
+        self.base_url = (base_url or API_URL).rstrip("/")
+        self.retries = retries
+        self.backoff = backoff
+        self.max_connections = max_connections
+        self.http = httpx.Client(base_url=self.base_url, timeout=timeout or default_timeout(), limits=default_limits(max_connections))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.http.close()
+
+    def _send(self, method, path, stream=False, **kwargs):
+        for attempt in range(self.retries + 1):
+            response = None
+            try:
+                request = self.http.build_request(method, path, **kwargs)
+                response = self.http.send(request, stream=stream)
+                if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                    return response
+                response.close()
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout):
+                if attempt == self.retries:
+                    raise
+            time.sleep(retry_delay(response, attempt, self.backoff))
+
+    def _json(self, method, path, **kwargs):
+        response = self._send(method, path, **kwargs)
+        check_response(response)
+        return response.json()
+
+    def _events(self, path, **kwargs):
+        response = self._send("POST", path, stream=True, **kwargs)
+        try:
+            if response.status_code >= 400:
+                response.read()
+                check_response(response)
+            for line in response.iter_lines():
+                event = parse_sse_line(line)
+                if event is not None:
+                    yield event
+        finally:
+            response.close()
+
+    def new_session(self):
+        return self._json("POST", "/api/sessions")["session_id"]
+
+    def get_session(self, session_id):
+        return self._json("GET", f"/api/sessions/{session_id}")
+
+    def delete_session(self, session_id):
+        return self._json("DELETE", f"/api/sessions/{session_id}")
+
+    def chat(self, user_input, session_id=None, use_search=False, audio_delivery="inline", **options):
+        """Returns the OmniResponse dict for one turn; see /api/chat for the options."""
+        return self._json("POST", "/api/chat", json=chat_payload(user_input, session_id, use_search, audio_delivery=audio_delivery, **options))
+
+    def chat_stream(self, user_input, session_id=None, use_search=False, **options):
+        """Yields the server-sent events of /api/chat/stream as dicts."""
+        return self._events("/api/chat/stream", json=chat_payload(user_input, session_id, use_search, **options))
+
+    def voice_stream(self, audio, session_id=None, use_search=False, **options):
+        """Uploads a recording to /api/voice and yields its events (transcript, tokens, audio, done)."""
+        data = {"session_id": session_id, "use_search": str(use_search).lower()}
+        data.update({key: str(value) for key, value in options.items() if value is not None})
+        data = {key: value for key, value in data.items() if value is not None}
+        return self._events("/api/voice", data=data, files={"file": ("audio.wav", read_bytes(audio))})
+
+    def vision(self, image, prompt, audio_delivery="inline", **options):
+        data = {"prompt": prompt, "audio_delivery": audio_delivery}
+        data.update({key: str(value) for key, value in options.items() if value is not None})
+        return self._json("POST", "/api/vision", data=data, files={"image_file": ("image", read_bytes(image))})
+
+    def vision_batch(self, images, prompts, audio_delivery="none", **options):
+        """Captions several images in one request; `prompts` is one string or one per image."""
+        prompts = [prompts] if isinstance(prompts, str) else list(prompts)
+        files = [("image_files", (f"image_{i}", read_bytes(image))) for i, image in enumerate(images)]
+        data = {"prompt": prompts, "audio_delivery": audio_delivery}
+        data.update({key: str(value) for key, value in options.items() if value is not None})
+        return self._json("POST", "/api/vision/batch", data=data, files=files)["results"]
+
+    def transcribe(self, audio, **options):
+        data = {key: str(value) for key, value in options.items() if value is not None}
+        return self._json("POST", "/api/transcribe", data=data, files={"file": ("audio.wav", read_bytes(audio))})["text"]
+
+    def fetch_audio(self, url):
+        response = self._send("GET", url)
+        check_response(response)
+        return response.content
+
+    def fetch_audio_many(self, urls):
+        """Downloads several one-shot audio URLs concurrently over the shared connection pool."""
+        with ThreadPoolExecutor(max_workers=self.max_connections) as executor:
+            return list(executor.map(self.fetch_audio, urls))
+
+    def save_response_audio(self, data, path):
+        """Saves the audio of an OmniResponse, inline or by URL, to `path`; None when it has none."""
+        audio = decode_audio_field(data)
+        if audio is None and data.get("audio_url"):
+            audio = self.fetch_audio(data["audio_url"])
+        return save_audio(audio, path) if audio is not None else None
+
+    def caption_directory(self, directory, prompt="Describe this image in three sentences.", batch_size=8, concurrency=2):
+        """Returns {path: caption} for every image in `directory`, sending batches concurrently."""
+        paths = image_files(directory)
+        batches = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = executor.map(lambda batch: self.vision_batch(batch, prompt), batches)
+            return {path: result["response_text"] for batch, batch_results in zip(batches, results) for path, result in zip(batch, batch_results)}
+
+
+class AsyncOmniClient:
+    """asyncio counterpart of OmniClient with the same methods, all awaitable (streams are async iterators)."""
+
+    def __init__(self, base_url=None, timeout=None, retries=3, backoff=0.5, max_connections=10):
+        self.base_url = (base_url or API_URL).rstrip("/")
+        self.retries = retries
+        self.backoff = backoff
+        self.max_connections = max_connections
+        self.http = httpx.AsyncClient(base_url=self.base_url, timeout=timeout or default_timeout(), limits=default_limits(max_connections))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        await self.http.aclose()
+
+    async def _send(self, method, path, stream=False, **kwargs):
+        for attempt in range(self.retries + 1):
+            response = None
+            try:
+                request = self.http.build_request(method, path, **kwargs)
+                response = await self.http.send(request, stream=stream)
+                if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                    return response
+                await response.aclose()
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout):
+                if attempt == self.retries:
+                    raise
+            await asyncio.sleep(retry_delay(response, attempt, self.backoff))
+
+    async def _json(self, method, path, **kwargs):
+        response = await self._send(method, path, **kwargs)
+        check_response(response)
+        return response.json()
+
+    async def _events(self, path, **kwargs):
+        response = await self._send("POST", path, stream=True, **kwargs)
+        try:
+            if response.status_code >= 400:
+                await response.aread()
+                check_response(response)
+            async for line in response.aiter_lines():
+                event = parse_sse_line(line)
+                if event is not None:
+                    yield event
+        finally:
+            await response.aclose()
+
+    async def new_session(self):
+        return (await self._json("POST", "/api/sessions"))["session_id"]
+
+    async def get_session(self, session_id):
+        return await self._json("GET", f"/api/sessions/{session_id}")
+
+    async def delete_session(self, session_id):
+        return await self._json("DELETE", f"/api/sessions/{session_id}")
+
+    async def chat(self, user_input, session_id=None, use_search=False, audio_delivery="inline", **options):
+        return await self._json("POST", "/api/chat", json=chat_payload(user_input, session_id, use_search, audio_delivery=audio_delivery, **options))
+
+    def chat_stream(self, user_input, session_id=None, use_search=False, **options):
+        return self._events("/api/chat/stream", json=chat_payload(user_input, session_id, use_search, **options))
+
+    def voice_stream(self, audio, session_id=None, use_search=False, **options):
+        data = {"session_id": session_id, "use_search": str(use_search).lower()}
+        data.update({key: str(value) for key, value in options.items() if value is not None})
+        data = {key: value for key, value in data.items() if value is not None}
+        return self._events("/api/voice", data=data, files={"file": ("audio.wav", read_bytes(audio))})
+
+    async def vision(self, image, prompt, audio_delivery="inline", **options):
+        data = {"prompt": prompt, "audio_delivery": audio_delivery}
+        data.update({key: str(value) for key, value in options.items() if value is not None})
+        return await self._json("POST", "/api/vision", data=data, files={"image_file": ("image", read_bytes(image))})
+
+    async def vision_batch(self, images, prompts, audio_delivery="none", **options):
+        prompts = [prompts] if isinstance(prompts, str) else list(prompts)
+        files = [("image_files", (f"image_{i}", read_bytes(image))) for i, image in enumerate(images)]
+        data = {"prompt": prompts, "audio_delivery": audio_delivery}
+        data.update({key: str(value) for key, value in options.items() if value is not None})
+        return (await self._json("POST", "/api/vision/batch", data=data, files=files))["results"]
+
+    async def transcribe(self, audio, **options):
+        data = {key: str(value) for key, value in options.items() if value is not None}
+        return (await self._json("POST", "/api/transcribe", data=data, files={"file": ("audio.wav", read_bytes(audio))}))["text"]
+
+    async def fetch_audio(self, url):
+        response = await self._send("GET", url)
+        check_response(response)
+        return response.content
+
+    async def fetch_audio_many(self, urls):
+        return await asyncio.gather(*(self.fetch_audio(url) for url in urls))
+
+    async def save_response_audio(self, data, path):
+        audio = decode_audio_field(data)
+        if audio is None and data.get("audio_url"):
+            audio = await self.fetch_audio(data["audio_url"])
+        return save_audio(audio, path) if audio is not None else None
+
+    async def caption_directory(self, directory, prompt="Describe this image in three sentences.", batch_size=8, concurrency=2):
+        paths = image_files(directory)
+        batches = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def caption(batch):
+            async with semaphore:
+                return await self.vision_batch(batch, prompt)
+
+        results = await asyncio.gather(*(caption(batch) for batch in batches))
+        return {path: result["response_text"] for batch, batch_results in zip(batches, results) for path, result in zip(batch, batch_results)}
+
+
+class Conversation:
+    """A server-side chat session that transparently starts a new one when it expires.
+
+    `stream` and `voice` yield the server's events; after a renewal they first yield
+    {"type": "session_renewed", "session_id": ...} so frontends can tell the user.
+    """
+
+    def __init__(self, client, session_id=None):
+        self.client = client
+        self.session_id = session_id
+
+    def _with_session(self, open_stream):
+        for attempt in range(2):
+            renewed = self.session_id is None and attempt > 0
+            if self.session_id is None:
+                self.session_id = self.client.new_session()
+            try:
+                events = open_stream(self.session_id)
+                first = next(events, None)
+            except SessionExpired:
+                if attempt:
+                    raise
+                self.session_id = None
+                continue
+            if renewed:
+                yield {"type": "session_renewed", "session_id": self.session_id}
+            if first is not None:
+                yield first
+                yield from events
+            return
+
+    def stream(self, user_input, use_search=False, **options):
+        return self._with_session(lambda session_id: self.client.chat_stream(user_input, session_id, use_search, **options))
+
+    def voice(self, audio, use_search=False, **options):
+        # The recording is read up front so a retry after renewal can resend it.
+        audio = read_bytes(audio)
+        return self._with_session(lambda session_id: self.client.voice_stream(audio, session_id, use_search, **options))
+
+
+class AsyncConversation(Conversation):
+    """Conversation over an AsyncOmniClient; `stream` and `voice` return async iterators."""
+
+    async def _with_session(self, open_stream):
+        for attempt in range(2):
+            renewed = self.session_id is None and attempt > 0
+            if self.session_id is None:
+                self.session_id = await self.client.new_session()
+            events = open_stream(self.session_id)
+            try:
+                first = await events.__anext__()
+            except StopAsyncIteration:
+                first = None
+            except SessionExpired:
+                if attempt:
+                    raise
+                self.session_id = None
+                continue
+            if renewed:
+                yield {"type": "session_renewed", "session_id": self.session_id}
+            if first is not None:
+                yield first
+                async for event in events:
+                    yield event
+            return
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch captioning with the OmniLocal API.")
+    parser.add_argument("directory", help="Directory of images to caption.")
+    parser.add_argument("--prompt", default="Describe this image in three sentences.")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=2)
+    parser.add_argument("--output", default=None, help="Write {\"image\", \"caption\"} JSON lines here instead of stdout.")
+    parser.add_argument("--url", default=None)
+    args = parser.parse_args()
+
+    with OmniClient(args.url, max_connections=args.concurrency) as client:
+        captions = client.caption_directory(args.directory, args.prompt, args.batch_size, args.concurrency)
+
+    lines = [json.dumps({"image": path, "caption": caption}) for path, caption in captions.items()]
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+    else:
+        print("\n".join(lines))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,103 +1,153 @@
-import soundfile as sf
+import numpy as np
 import torch
+import io
 import os
-import gc
-import re
 
-from transformers import AutoModelForCausalLM, AutoTokenizer, Qwen3VLForConditionalGeneration, AutoProcessor
-from qwen_vl_utils import process_vision_info
-from faster_whisper import WhisperModel
+from functools import lru_cache
+from collections import deque
 from datetime import datetime
-from kokoro import KPipeline
-from ddgs import DDGS
+from PIL import Image
+from model_manager import ModelManager
+from profiles import get_profile
+from prefix_cache import PrefixCache
+from image_cache import ImageCache, image_key
+from response_cache import ResponseCache, response_key, normalize_messages
+from batching import BatchEngine
+from speculative import SpeculativeDecoder
+from scheduler import ModelScheduler
+from admission import request_deadline, request_priority
+from web_search import SearchService
+from tts_service import TTSService, split_sentences, SAMPLE_RATE, DEFAULT_VOICE
+from audio_store import encode_audio
+from stt_service import STTService, STT_SAMPLE_RATE
+from warmup import WarmupTracker
 
 
-AUDIO_DIR = "audio"
-os.makedirs(AUDIO_DIR, exist_ok=True)
-
 MAX_NEW_TOKENS = 250
 TEMPERATURE = 0.7
 SYSTEM_PROMPT = "You are OmniLocal, a highly intelligent and concise conversational AI. Keep your answers brief, natural, and easy to read aloud. Do not use asterisks or markdown formatting. Do not use more than five sentences and always end the answer with a period. Do not mention that you are an AI."
 
-tts_pipeline = None
-stt_model = None
-active_slot = None
-llm_model = None
-llm_tokenizer = None
-vision_model = None
-vision_processor = None
+HISTORY_TOKEN_BUDGET = int(os.getenv("OMNI_HISTORY_TOKEN_BUDGET", "2048"))
+HISTORY_KEEP_RATIO = 0.6
+SUMMARIZE_HISTORY = os.getenv("OMNI_SUMMARIZE_HISTORY", "0") == "1"
+SUMMARY_PROMPT = "Summarize the conversation below in at most three sentences. Keep names, facts, decisions and open questions. Do not add anything else."
+
+TEXT_MODEL_ID = "microsoft/Phi-4-mini-instruct"
+VISION_MODEL_ID = "Qwen/Qwen3-VL-2B-Instruct"
+DRAFT_MODEL_ID = os.getenv("OMNI_DRAFT_MODEL_ID")
+PROFILE = get_profile()
+DEVICE = PROFILE.device
+VISION_BATCH_SIZE = int(os.getenv("OMNI_VISION_BATCH_SIZE", "4"))
+WARMUP = [name.strip() for name in os.getenv("OMNI_WARMUP", "text,stt,tts").split(",") if name.strip()]
+
+tts_service = TTSService()
+stt_service = STTService(DEVICE, os.getenv("OMNI_STT_COMPUTE_TYPE") or PROFILE.stt_compute_type)
+model_manager = ModelManager(DEVICE)
+scheduler = ModelScheduler()
+search_service = SearchService()
 
 
 def initialize():
-    global tts_pipeline, stt_model
-    if tts_pipeline is None:
-        print("[System] Loading TTS (Kokoro-82M)...")
-        tts_pipeline = KPipeline(lang_code='a')
-        
-    if stt_model is None:
-        print("[System] Loading STT (Faster-Whisper base)...")
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        stt_model = WhisperModel("medium", device=device, compute_type="float16")
-        
-    load_text_brain()
+    """Starts warming up the OMNI_WARMUP capabilities in the background and returns immediately."""
+    warmup.start()
+
+
+@lru_cache(maxsize=1)
+def get_text_tokenizer():
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(TEXT_MODEL_ID)
+
+
+def _load_text_model():
+    from transformers import AutoModelForCausalLM
+    llm_model = PROFILE.load_pretrained(AutoModelForCausalLM, TEXT_MODEL_ID)
+    return llm_model, get_text_tokenizer()
+
+
+@lru_cache(maxsize=1)
+def get_vision_processor():
+    from transformers import AutoProcessor
+    return AutoProcessor.from_pretrained(VISION_MODEL_ID)
+
+
+def _load_vision_model():
+    from transformers import Qwen3VLForConditionalGeneration
+    vision_processor = get_vision_processor()
+    vision_model = PROFILE.load_pretrained(Qwen3VLForConditionalGeneration, VISION_MODEL_ID)
+    return vision_model, vision_processor
+
+
+model_manager.register("text", _load_text_model, "Text Brain (Phi-4-mini-instruct)", estimate_bytes=int(7.7 * PROFILE.size_factor * 1024 ** 3), offloadable=PROFILE.offloadable)
+model_manager.register("vision", _load_vision_model, "Vision Brain (Qwen3-VL-2B-Instruct)", estimate_bytes=int(4.3 * PROFILE.size_factor * 1024 ** 3), offloadable=PROFILE.offloadable)
+
+
+def _load_draft_model():
+    from transformers import AutoModelForCausalLM
+    return PROFILE.load_pretrained(AutoModelForCausalLM, DRAFT_MODEL_ID), None
+
+
+speculative_decoder = SpeculativeDecoder()
+if speculative_decoder.mode == "draft":
+    if DRAFT_MODEL_ID:
+        # The draft model must share the text model's tokenizer; it is verified token by token.
+        model_manager.register("draft", _load_draft_model, f"Draft Model ({DRAFT_MODEL_ID})", offloadable=PROFILE.offloadable)
+    else:
+        print("[Warning] OMNI_SPECULATIVE=draft needs OMNI_DRAFT_MODEL_ID, falling back to prompt-lookup.")
+        speculative_decoder.mode = "prompt-lookup"
 
 
 def load_text_brain():
-    global active_slot, llm_model, llm_tokenizer, vision_model, vision_processor
-    if active_slot == "text": return
-        
-    if vision_model is not None:
-        print("\n[System] Unloading Vision Brain...")
-        del vision_model, vision_processor
-        vision_model, vision_processor = None, None
-        gc.collect()
-        torch.cuda.empty_cache()
-        
-    print("[System] Loading Text Brain (Phi-4-mini-instruct)...")
-    llm_id = "microsoft/Phi-4-mini-instruct"
-    llm_tokenizer = AutoTokenizer.from_pretrained(llm_id)
-    llm_model = AutoModelForCausalLM.from_pretrained(llm_id, device_map="auto", torch_dtype=torch.float16)
-    active_slot = "text"
+    return model_manager.acquire("text")
 
 
 def load_vision_brain():
-    global active_slot, llm_model, llm_tokenizer, vision_model, vision_processor
-    if active_slot == "vision": return
+    return model_manager.acquire("vision")
+
+
+prefix_cache = PrefixCache()
+image_cache = ImageCache()
+response_cache = ResponseCache()
+text_batcher = BatchEngine(load_text_brain, scheduler, "text", prefix_cache=prefix_cache)
+
+
+def count_tokens(text):
+    return len(get_text_tokenizer().encode(text, add_special_tokens=False))
+
+
+def summarize_history(messages, previous_summary=""):
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    if previous_summary:
+        transcript = f"Earlier summary: {previous_summary}\n{transcript}"
+    prompt = [{"role": "system", "content": SUMMARY_PROMPT}, {"role": "user", "content": transcript}]
+    return generate_text(prompt, max_new_tokens=120, temperature=0).strip()
+
+
+def format_search_results(results):
+    if not results:
+        return "No web search results found."
         
-    if llm_model is not None:
-        print("\n[System] Unloading Text Brain...")
-        del llm_model, llm_tokenizer
-        llm_model, llm_tokenizer = None, None
-        gc.collect()
-        torch.cuda.empty_cache()
+    formatted_results = "CURRENT WEB CONTEXT:\n"
+    for i, res in enumerate(results):
+        formatted_results += f"{i+1}. {res['title']}: {res['body']}\n"
         
-    print("[System] Loading Vision Brain (Qwen3-VL-2B-Instruct)...")
-    vision_id = "Qwen/Qwen3-VL-2B-Instruct"
-    vision_processor = AutoProcessor.from_pretrained(vision_id)
-    vision_model = Qwen3VLForConditionalGeneration.from_pretrained(vision_id, device_map="auto", torch_dtype=torch.float16)
-    active_slot = "vision"
+    return formatted_results
 
 
 def search_web(query, max_results=5):
     print(f"\n[System] Searching the web for: '{query}'...")
     try:
-        results = DDGS().text(query, max_results=max_results)
-        if not results:
-            return "No web search results found."
-            
-        formatted_results = "CURRENT WEB CONTEXT:\n"
-        for i, res in enumerate(results):
-            formatted_results += f"{i+1}. {res['title']}: {res['body']}\n"
-            
-        return formatted_results
+        return format_search_results(search_service.search(query, max_results))
     except Exception as e:
         print(f"[Warning] Web search failed: {e}")
         return ""
 
 
-def generate_text(messages, web_context=""):
-    load_text_brain()
+def search_web_async(query, max_results=5):
+    """Starts search_web in the background so the caller can prepare the prompt meanwhile."""
+    return search_service.request_executor.submit(search_web, query, max_results)
 
+
+def build_prompt(messages, web_context=""):
     messages_copy = list(messages)
     
     if web_context:
@@ -115,49 +165,208 @@ def generate_text(messages, web_context=""):
         )
         messages_copy[-1] = {"role": messages_copy[-1]["role"], "content": forced_prompt}
 
-    inputs = llm_tokenizer.apply_chat_template(
-        messages_copy, return_tensors="pt", add_generation_prompt=True, return_dict=True
-    ).to(llm_model.device)
-    
-    with torch.no_grad():
-        outputs = llm_model.generate(**inputs, max_new_tokens=MAX_NEW_TOKENS, do_sample=True, temperature=TEMPERATURE)
-        
-    generated_tokens = outputs[0][inputs['input_ids'].shape[1]:]
-    return llm_tokenizer.decode(generated_tokens, skip_special_tokens=True)
+    return messages_copy
 
 
-def generate_vision(image_path, prompt):
-    load_vision_brain()
-    messages = [{"role": "user", "content": [{"type": "image", "image": f"file://{os.path.abspath(image_path)}"}, {"type": "text", "text": prompt}]}]
-    
-    text_prompt = vision_processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-    image_inputs, video_inputs = process_vision_info(messages)
+def _text_cache_key(messages, web_context, max_new_tokens, temperature, cache):
+    """Cache key for a text reply, or None when sampling is random and the caller did not opt in."""
+    if not response_cache.enabled or not (cache or temperature <= 0):
+        return None
+    return response_key("text", TEXT_MODEL_ID, PROFILE.name, normalize_messages(messages), web_context, max_new_tokens, temperature)
+
+
+def _speculative_tokens(input_ids, max_new_tokens, temperature, deadline=None, priority=None):
+    """Decodes one prompt with the speculative decoder, holding the text slot instead of joining the batch."""
+    with scheduler.slot("text", deadline, priority):
+        # Acquire the draft first so making room for it can never push out the text model we are about to use.
+        draft_model = model_manager.acquire("draft")[0] if speculative_decoder.mode == "draft" else None
+        llm_model, llm_tokenizer = load_text_brain()
+        yield from speculative_decoder.generate(llm_model, llm_tokenizer, input_ids, max_new_tokens, temperature, draft_model)
+
+
+def generate_text(messages, web_context="", max_new_tokens=MAX_NEW_TOKENS, temperature=TEMPERATURE, cache=False):
+    key = _text_cache_key(messages, web_context, max_new_tokens, temperature, cache)
+    if key is not None:
+        cached = response_cache.get("text", key)
+        if cached is not None:
+            return cached
+
+    messages_copy = build_prompt(messages, web_context)
+    llm_tokenizer = get_text_tokenizer()
+
+    input_ids = llm_tokenizer.apply_chat_template(messages_copy, add_generation_prompt=True, return_dict=True)["input_ids"]
+    # Set by the server (or the engine socket) for HTTP requests, so queued work past its deadline is dropped
+    # and queued work is served in admission lane order.
+    deadline, priority = request_deadline.get(), request_priority.get()
+    if speculative_decoder.enabled:
+        generated_tokens = list(_speculative_tokens(input_ids, max_new_tokens, temperature, deadline, priority))
+    else:
+        generated_tokens = text_batcher.submit(input_ids, max_new_tokens, temperature, deadline, priority).result()
+    reply = llm_tokenizer.decode(generated_tokens, skip_special_tokens=True)
+    if key is not None:
+        response_cache.put(key, reply, searched=bool(web_context))
+    return reply
+
+
+def stream_text(messages, web_context="", max_new_tokens=MAX_NEW_TOKENS, temperature=TEMPERATURE, cache=False):
+    """Yields decoded text pieces while the LLM is still generating."""
+    key = _text_cache_key(messages, web_context, max_new_tokens, temperature, cache)
+    if key is not None:
+        cached = response_cache.get("text", key)
+        if cached is not None:
+            yield cached
+            return
+
+    messages_copy = build_prompt(messages, web_context)
+    llm_tokenizer = get_text_tokenizer()
+
+    input_ids = llm_tokenizer.apply_chat_template(messages_copy, add_generation_prompt=True, return_dict=True)["input_ids"]
     
-    inputs = vision_processor(text=[text_prompt], images=image_inputs, videos=video_inputs, padding=True, return_tensors="pt").to(vision_model.device)
+    deadline, priority = request_deadline.get(), request_priority.get()
+    tokens = _speculative_tokens(input_ids, max_new_tokens, temperature, deadline, priority) if speculative_decoder.enabled else text_batcher.stream(input_ids, max_new_tokens, temperature, deadline, priority)
+    generated_tokens = []
+    emitted = ""
+    for token in tokens:
+        generated_tokens.append(token)
+        text = llm_tokenizer.decode(generated_tokens, skip_special_tokens=True)
+        # Hold back incomplete multi-byte characters until the next token completes them.
+        if text.endswith("\ufffd") or len(text) <= len(emitted):
+            continue
+        yield text[len(emitted):]
+        emitted = text
+
+    if key is not None:
+        response_cache.put(key, llm_tokenizer.decode(generated_tokens, skip_special_tokens=True), searched=bool(web_context))
+
+
+def _image_features(data):
+    key = image_key(data)
+    features = image_cache.get(key)
+    if features is None:
+        try:
+            image = Image.open(io.BytesIO(data)).convert("RGB")
+        except Exception as e:
+            raise ValueError(f"Could not decode image: {e}")
+        processed = get_vision_processor().image_processor(images=[image], return_tensors="pt")
+        features = {"pixel_values": processed["pixel_values"], "image_grid_thw": processed["image_grid_thw"]}
+        image_cache.put(key, features)
+    return features
+
+
+def _vision_prompt(prompt, grid_thw):
+    vision_processor = get_vision_processor()
+    messages = [{"role": "user", "content": [{"type": "image"}, {"type": "text", "text": prompt}]}]
+    text = vision_processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+    # The processor expands the image placeholder itself only when it sees the image, so do it here for cached pixels.
+    image_tokens = int(grid_thw.prod()) // vision_processor.image_processor.merge_size ** 2
+    return text.replace(vision_processor.image_token, vision_processor.image_token * image_tokens, 1)
+
+
+def generate_vision_batch(items, max_new_tokens=MAX_NEW_TOKENS, cache=False):
+    """Answers a list of (image_bytes, prompt) pairs, VISION_BATCH_SIZE images per generate call.
+
+    The vision model samples, so replies are only cached when the caller opts in with `cache`.
+    """
+    keys = [None] * len(items)
+    if cache and response_cache.enabled:
+        keys = [response_key("vision", VISION_MODEL_ID, PROFILE.name, image_key(data), " ".join(prompt.split()), max_new_tokens) for data, prompt in items]
+    replies = [response_cache.get("vision", key) if key is not None else None for key in keys]
+    misses = [i for i, reply in enumerate(replies) if reply is None]
     
-    with torch.no_grad():
-        outputs = vision_model.generate(**inputs, max_new_tokens=MAX_NEW_TOKENS)
+    for start in range(0, len(misses), VISION_BATCH_SIZE):
+        indices = misses[start:start + VISION_BATCH_SIZE]
+        chunk = [items[i] for i in indices]
+        features = [_image_features(data) for data, _ in chunk]
+        texts = [_vision_prompt(prompt, f["image_grid_thw"][0]) for (_, prompt), f in zip(chunk, features)]
         
-    generated_tokens = outputs[0][inputs['input_ids'].shape[1]:]
-    return vision_processor.decode(generated_tokens, skip_special_tokens=True)
+        with scheduler.slot("vision", request_deadline.get(), request_priority.get()):
+            vision_model, vision_processor = load_vision_brain()
+            inputs = vision_processor.tokenizer(texts, padding=True, padding_side="left", return_tensors="pt")
+            inputs["pixel_values"] = torch.cat([f["pixel_values"] for f in features])
+            inputs["image_grid_thw"] = torch.cat([f["image_grid_thw"] for f in features])
+            inputs = inputs.to(vision_model.device)
+            
+            with torch.no_grad():
+                outputs = vision_model.generate(**inputs, max_new_tokens=max_new_tokens)
+                
+        generated_tokens = outputs[:, inputs["input_ids"].shape[1]:]
+        for i, reply in zip(indices, vision_processor.batch_decode(generated_tokens, skip_special_tokens=True)):
+            replies[i] = reply
+            if keys[i] is not None:
+                response_cache.put(keys[i], reply)
+    return replies
+
+
+def generate_vision(image, prompt, cache=False):
+    """Answers `prompt` about one encoded image (bytes)."""
+    return generate_vision_batch([(image, prompt)], cache=cache)[0]
+
+
+def generate_audio(text, voice=DEFAULT_VOICE, speed=1.0):
+    """Synthesizes `text` into a single float32 sample buffer at SAMPLE_RATE."""
+    return tts_service.synthesize(text, voice, speed)
 
 
-def generate_audio(text):
-    clean_text = re.sub(r'[*_#`~]', '', text)
-    generator = tts_pipeline(clean_text, voice='af_heart', speed=1)
+def stream_chat(messages, web_context="", audio_format="wav", voice=DEFAULT_VOICE, speed=1.0, cache=False):
+    """Yields ("token", text) while decoding, ("audio", encoded_bytes) per finished sentence and finally ("done", reply).
+
+    Finished sentences are synthesized on the TTS worker while decoding carries on, and
+    their audio is yielded in order as soon as it is ready.
+    """
+    reply = ""
+    pending = ""
+    synthesis = deque()
     
-    full_audio = []
-    for _, _, audio_chunk in generator:
-        full_audio.extend(audio_chunk)
+    for piece in stream_text(messages, web_context, cache=cache):
+        reply += piece
+        pending += piece
+        yield "token", piece
         
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_filename = os.path.join(AUDIO_DIR, f"omnilocal_response_{timestamp}.wav")
-    sf.write(output_filename, full_audio, 24000)
-    return output_filename
+        sentences, pending = split_sentences(pending)
+        synthesis.extend(tts_service.submit(sentence, voice, speed) for sentence in sentences)
+        while synthesis and synthesis[0].done():
+            audio = synthesis.popleft().result()
+            if audio.size:
+                yield "audio", encode_audio(audio, SAMPLE_RATE, audio_format)[0]
+                
+    if pending.strip():
+        synthesis.append(tts_service.submit(pending.strip(), voice, speed))
+    while synthesis:
+        audio = synthesis.popleft().result()
+        if audio.size:
+            yield "audio", encode_audio(audio, SAMPLE_RATE, audio_format)[0]
+            
+    yield "done", reply
+
+
+def transcribe_audio(audio, model_size=None, beam_size=None, vad=None, language=None):
+    """Transcribes a path, file-like object or 16 kHz float32 samples."""
+    print("\n[System] Transcribing audio...")
+    return stt_service.transcribe(audio, model_size, beam_size, vad, language)
+
+
+def _warm_text():
+    system_ids = get_text_tokenizer().apply_chat_template([{"role": "system", "content": SYSTEM_PROMPT}], return_dict=True)["input_ids"]
+    text_batcher.warm_prefix(system_ids)
+    # A short generate runs the decode path once so the first real request doesn't pay for kernel setup.
+    generate_text([{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": "Hello"}], max_new_tokens=4)
+
+
+def _warm_vision():
+    image = io.BytesIO()
+    Image.new("RGB", (64, 64)).save(image, format="PNG")
+    generate_vision_batch([(image.getvalue(), "Describe this image.")], max_new_tokens=4)
+
+
+def _warm_stt():
+    stt_service.transcribe(np.zeros(STT_SAMPLE_RATE, dtype=np.float32), vad=False)
+
+
+def _warm_tts():
+    tts_service.sentence_audio("Hello.", DEFAULT_VOICE)
 
 
-def transcribe_audio(audio_path):
-    print(f"\n[System] Transcribing audio from {audio_path}...")
-    segments, info = stt_model.transcribe(audio_path, beam_size=5)
-    text = "".join([segment.text for segment in segments])
-    return text.strip()
+WARMUP_TASKS = {"text": _warm_text, "vision": _warm_vision, "stt": _warm_stt, "tts": _warm_tts}
+for name in set(WARMUP) - set(WARMUP_TASKS):
+    print(f"[Warning] Unknown OMNI_WARMUP capability '{name}' ignored.")
+warmup = WarmupTracker({name: WARMUP_TASKS[name] for name in WARMUP if name in WARMUP_TASKS}, capabilities=WARMUP_TASKS)
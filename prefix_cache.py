@@ -0,0 +1,103 @@
+import threading
+import os
+
+from collections import OrderedDict
+
+
+class PrefixCache:
+    """LRU cache of per-sequence past key/values keyed on token prefixes.
+
+    Entries hold one (key, value) tensor pair per layer for a single sequence with no
+    padding. A lookup returns the longest cached entry that is a prefix of the new
+    prompt, so only the remaining tokens need to be prefilled. Pinned entries (the
+    system prompt) are never evicted.
+    """
+
+    def __init__(self, max_bytes=None):
+        if max_bytes is None:
+            max_bytes = float(os.getenv("OMNI_PREFIX_CACHE_MB", "512")) * 1024 ** 2
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.lengths = {}
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reused_tokens = 0
+        self.prefilled_tokens = 0
+
+    def _remove(self, key):
+        _, nbytes, _ = self.entries.pop(key)
+        self.bytes -= nbytes
+        self.lengths[len(key)] -= 1
+        if not self.lengths[len(key)]:
+            del self.lengths[len(key)]
+
+    def lookup(self, tokens):
+        """Returns (prefix_length, layers) for the longest usable cached prefix, or (0, None)."""
+        with self.lock:
+            for length in sorted(self.lengths, reverse=True):
+                if length > len(tokens):
+                    continue
+                key = tuple(tokens[:length])
+                if key not in self.entries:
+                    continue
+
+                self.entries.move_to_end(key)
+                layers = self.entries[key][0]
+                if length == len(tokens):
+                    # Keep at least one token to prefill so the model produces next-token logits.
+                    length -= 1
+                    layers = [(k[:, :, :length], v[:, :, :length]) for k, v in layers]
+                if length == 0:
+                    break
+
+                self.hits += 1
+                self.reused_tokens += length
+                self.prefilled_tokens += len(tokens) - length
+                return length, layers
+
+            self.misses += 1
+            self.prefilled_tokens += len(tokens)
+            return 0, None
+
+    def store(self, tokens, layers, pinned=False):
+        key = tuple(tokens)
+        nbytes = sum(k.numel() * k.element_size() + v.numel() * v.element_size() for k, v in layers)
+        if not key or nbytes > self.max_bytes:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                pinned = pinned or self.entries[key][2]
+                self._remove(key)
+
+            self.entries[key] = (layers, nbytes, pinned)
+            self.bytes += nbytes
+            self.lengths[len(key)] = self.lengths.get(len(key), 0) + 1
+
+            for old_key in list(self.entries):
+                if self.bytes <= self.max_bytes:
+                    break
+                if old_key != key and not self.entries[old_key][2]:
+                    self._remove(old_key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.lengths.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "memory_mb": round(self.bytes / 1024 ** 2, 2),
+                "max_memory_mb": round(self.max_bytes / 1024 ** 2, 2),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "reused_tokens": self.reused_tokens,
+                "prefilled_tokens": self.prefilled_tokens,
+            }
@@ -0,0 +1,76 @@
+import torch
+import os
+
+
+class RuntimeProfile:
+    """How the text LLM, the vision model and Whisper are loaded on a given kind of node.
+
+    `quantization` is None for plain `dtype` weights, "int8"/"int4" for bitsandbytes
+    weight quantization on CUDA, or "dynamic-int8" for PyTorch dynamic quantization of
+    the linear layers on CPU. `size_factor` scales the fp16 memory estimates.
+    """
+
+    def __init__(self, name, device, dtype, quantization=None, stt_compute_type="float16", size_factor=1.0):
+        self.name = name
+        self.device = device
+        self.dtype = dtype
+        self.quantization = quantization
+        self.stt_compute_type = stt_compute_type
+        self.size_factor = size_factor
+
+    @property
+    def offloadable(self):
+        # bitsandbytes weights cannot be moved between devices, so they are dropped instead of offloaded.
+        return self.quantization not in ("int8", "int4")
+
+    def model_kwargs(self):
+        from transformers import BitsAndBytesConfig
+        kwargs = {"device_map": {"": self.device}, "torch_dtype": self.dtype}
+        if self.quantization == "int8":
+            kwargs["quantization_config"] = BitsAndBytesConfig(load_in_8bit=True)
+        elif self.quantization == "int4":
+            kwargs["quantization_config"] = BitsAndBytesConfig(load_in_4bit=True, bnb_4bit_quant_type="nf4", bnb_4bit_compute_dtype=self.dtype)
+        return kwargs
+
+    def load_pretrained(self, model_class, model_id):
+        model = model_class.from_pretrained(model_id, **self.model_kwargs())
+        if self.quantization == "dynamic-int8":
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return model.eval()
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "device": self.device,
+            "dtype": str(self.dtype).replace("torch.", ""),
+            "quantization": self.quantization,
+            "stt_compute_type": self.stt_compute_type,
+        }
+
+
+PROFILES = {
+    "gpu-fp16": RuntimeProfile("gpu-fp16", "cuda", torch.float16, stt_compute_type="float16"),
+    "gpu-bf16": RuntimeProfile("gpu-bf16", "cuda", torch.bfloat16, stt_compute_type="bfloat16"),
+    "gpu-int8": RuntimeProfile("gpu-int8", "cuda", torch.float16, "int8", stt_compute_type="int8_float16", size_factor=0.55),
+    "gpu-int4": RuntimeProfile("gpu-int4", "cuda", torch.float16, "int4", stt_compute_type="int8_float16", size_factor=0.35),
+    "cpu-fp32": RuntimeProfile("cpu-fp32", "cpu", torch.float32, stt_compute_type="float32", size_factor=2.0),
+    # CTranslate2 has no bf16 kernels on most CPUs, so Whisper falls back to int8 weights.
+    "cpu-bf16": RuntimeProfile("cpu-bf16", "cpu", torch.bfloat16, stt_compute_type="int8"),
+    "cpu-int8": RuntimeProfile("cpu-int8", "cpu", torch.float32, "dynamic-int8", stt_compute_type="int8", size_factor=0.8),
+}
+
+
+def get_profile(name=None):
+    """Resolves OMNI_PROFILE (default "gpu-fp16" with CUDA, "cpu-fp32" without) to a RuntimeProfile."""
+    name = name or os.getenv("OMNI_PROFILE") or ("gpu-fp16" if torch.cuda.is_available() else "cpu-fp32")
+    if name not in PROFILES:
+        raise ValueError(f"Unknown runtime profile '{name}'. Choose one of: {', '.join(PROFILES)}.")
+
+    profile = PROFILES[name]
+    if profile.device == "cuda" and not torch.cuda.is_available():
+        print(f"[Warning] Profile '{name}' needs CUDA, falling back to 'cpu-fp32'.")
+        profile = PROFILES["cpu-fp32"]
+
+    if profile.device == "cpu" and os.getenv("OMNI_CPU_THREADS"):
+        torch.set_num_threads(int(os.getenv("OMNI_CPU_THREADS")))
+    return profile
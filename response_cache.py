@@ -0,0 +1,151 @@
+import threading
+import hashlib
+import json
+import time
+import os
+
+from collections import OrderedDict
+from metrics import RESPONSE_CACHE_LOOKUPS
+
+
+def normalize_messages(messages):
+    return [(m["role"], " ".join(m["content"].split()) if isinstance(m["content"], str) else m["content"]) for m in messages]
+
+
+def response_key(*parts):
+    """Hashes the model id, normalized inputs and sampling params that determine a reply."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Generated replies keyed by `response_key`, in an LRU of `max_entries` plus an optional disk tier.
+
+    Entries may carry a TTL (search-augmented answers go stale with the web context they
+    were built from); the rest never expire. `max_entries=0` disables the cache.
+    """
+
+    def __init__(self, max_entries=None, disk_dir=None, max_disk_bytes=None, search_ttl_s=None):
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("OMNI_RESPONSE_CACHE_SIZE", "1024"))
+        self.disk_dir = disk_dir if disk_dir is not None else os.getenv("OMNI_RESPONSE_CACHE_DIR")
+        self.max_disk_bytes = max_disk_bytes or float(os.getenv("OMNI_RESPONSE_DISK_CACHE_MB", "256")) * 1024 ** 2
+        self.search_ttl = search_ttl_s or float(os.getenv("OMNI_RESPONSE_CACHE_SEARCH_TTL_S", "600"))
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.disk_bytes = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self.disk_bytes = sum(entry.stat().st_size for entry in os.scandir(self.disk_dir) if entry.name.endswith(".json"))
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _remember(self, key, entry):
+        with self.lock:
+            self.cache[key] = entry
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+
+    def _write_disk(self, key, entry):
+        path = self._disk_path(key)
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"expires": entry[0], "text": entry[1]}, f)
+        previous = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(temp_path, path)
+        with self.lock:
+            self.disk_bytes += os.path.getsize(path) - previous
+            if self.disk_bytes <= self.max_disk_bytes:
+                return
+            entries = sorted((e for e in os.scandir(self.disk_dir) if e.name.endswith(".json")), key=lambda e: e.stat().st_mtime)
+            for entry in entries:
+                if self.disk_bytes <= self.max_disk_bytes:
+                    break
+                self.disk_bytes -= entry.stat().st_size
+                os.remove(entry.path)
+
+    def _discard_disk(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        with self.lock:
+            self.disk_bytes -= size
+
+    def get(self, kind, key):
+        if not self.enabled:
+            return None
+        now = time.time()
+        expired = False
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is not None and entry[0] is not None and entry[0] < now:
+                del self.cache[key]
+                expired = True
+                entry = None
+            if entry is not None:
+                self.cache.move_to_end(key)
+                self.memory_hits += 1
+                RESPONSE_CACHE_LOOKUPS.inc(kind=kind, result="memory")
+                return entry[1]
+
+        path = self._disk_path(key) if self.disk_dir else None
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    record = json.load(f)
+            except (OSError, ValueError):
+                record = None
+            if record is not None and (record["expires"] is None or record["expires"] >= now):
+                # Disk eviction is least-recently-used by mtime, so touch the entry on every hit.
+                os.utime(path)
+                with self.lock:
+                    self.disk_hits += 1
+                RESPONSE_CACHE_LOOKUPS.inc(kind=kind, result="disk")
+                self._remember(key, (record["expires"], record["text"]))
+                return record["text"]
+            self._discard_disk(path)
+            expired = expired or record is not None
+
+        with self.lock:
+            self.misses += 1
+            if expired:
+                self.expired += 1
+        RESPONSE_CACHE_LOOKUPS.inc(kind=kind, result="miss")
+        return None
+
+    def put(self, key, text, searched=False):
+        if not self.enabled:
+            return
+        entry = (time.time() + self.search_ttl if searched else None, text)
+        self._remember(key, entry)
+        if self.disk_dir:
+            try:
+                self._write_disk(key, entry)
+            except OSError as e:
+                print(f"[Warning] Could not write response cache entry: {e}")
+
+    def stats(self):
+        with self.lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self.cache),
+                "max_entries": self.max_entries,
+                "disk_mb": round(self.disk_bytes / 1024 ** 2, 2) if self.disk_dir else None,
+                "search_ttl_s": self.search_ttl,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+            }
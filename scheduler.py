@@ -0,0 +1,149 @@
+import threading
+import time
+import os
+
+from contextlib import contextmanager
+from collections import deque
+from metrics import SCHEDULER_WAIT_SECONDS
+
+
+class DeadlineExceeded(Exception):
+    """A request's deadline passed while it was still queued for a model."""
+
+
+class Ticket:
+    def __init__(self, model, deadline=None, priority=None):
+        self.model = model
+        self.deadline = deadline
+        self.priority = priority or 0
+        self.enqueued = time.monotonic()
+
+
+class QueueStats:
+    def __init__(self):
+        self.served = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait):
+        self.served += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+
+class ModelScheduler:
+    """Serializes model work and groups it by model to avoid swap thrash.
+
+    Each model has its own queue, ordered by priority (the admission lane's, lower
+    first; work without one counts as 0) and FIFO within a priority. When the
+    accelerator frees up, requests for the model that is already loaded are drained
+    first unless another model has a higher-priority request waiting; a request
+    waiting on another model for longer than `max_wait` seconds forces a switch so it
+    cannot starve.
+    """
+
+    def __init__(self, max_wait=None):
+        if max_wait is None:
+            max_wait = float(os.getenv("OMNI_SCHEDULER_MAX_WAIT_S", "5"))
+        self.max_wait = max_wait
+        self.cond = threading.Condition()
+        self.queues = {}
+        self.queue_stats = {}
+        self.active_model = None
+        self.busy = False
+        self.switches = 0
+        self.expired = 0
+
+    def _queue(self, model):
+        if model not in self.queues:
+            self.queues[model] = deque()
+            self.queue_stats[model] = QueueStats()
+        return self.queues[model]
+
+    def _next_ticket(self):
+        heads = [q[0] for q in self.queues.values() if q]
+        if not heads:
+            return None
+
+        now = time.monotonic()
+        starving = [t for t in heads if t.model != self.active_model and now - t.enqueued >= self.max_wait]
+        if starving:
+            return min(starving, key=lambda t: t.enqueued)
+
+        best = min(t.priority for t in heads)
+        active_queue = self.queues.get(self.active_model)
+        if active_queue and active_queue[0].priority == best:
+            return active_queue[0]
+        return min(heads, key=lambda t: (t.priority, t.enqueued))
+
+    @contextmanager
+    def slot(self, model, deadline=None, priority=None):
+        """Blocks until it is this request's turn to run on `model`, then holds the accelerator.
+
+        Raises DeadlineExceeded, without running anything, if `deadline` (monotonic) passes first.
+        """
+        ticket = Ticket(model, deadline, priority)
+        with self.cond:
+            queue = self._queue(model)
+            index = len(queue)
+            while index and queue[index - 1].priority > ticket.priority:
+                index -= 1
+            queue.insert(index, ticket)
+            while self.busy or self._next_ticket() is not ticket:
+                timeout = None if deadline is None else deadline - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    queue.remove(ticket)
+                    self.expired += 1
+                    # This ticket may have been blocking the head of the queue.
+                    self.cond.notify_all()
+                    raise DeadlineExceeded(f"Request deadline passed while waiting for the {model} model.")
+                self.cond.wait(timeout)
+
+            queue.popleft()
+            self.busy = True
+            if self.active_model not in (None, model):
+                self.switches += 1
+            self.active_model = model
+            wait = time.monotonic() - ticket.enqueued
+            self.queue_stats[model].record(wait)
+            SCHEDULER_WAIT_SECONDS.observe(wait, model=model)
+
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.busy = False
+                self.cond.notify_all()
+
+    def should_yield(self, model, priority=None):
+        """True when a request for another model has waited past the fairness bound, or outranks `priority`."""
+        with self.cond:
+            now = time.monotonic()
+            for name, queue in self.queues.items():
+                if not queue or name == model:
+                    continue
+                if now - queue[0].enqueued >= self.max_wait or (priority is not None and queue[0].priority < priority):
+                    return True
+            return False
+
+    def stats(self):
+        with self.cond:
+            now = time.monotonic()
+            models = {}
+            for model, queue in self.queues.items():
+                stats = self.queue_stats[model]
+                models[model] = {
+                    "queue_depth": len(queue),
+                    "oldest_wait_s": round(now - queue[0].enqueued, 3) if queue else 0.0,
+                    "served": stats.served,
+                    "avg_wait_s": round(stats.total_wait / stats.served, 3) if stats.served else 0.0,
+                    "max_wait_s": round(stats.max_wait, 3),
+                }
+            return {
+                "active_model": self.active_model,
+                "busy": self.busy,
+                "switches": self.switches,
+                "expired": self.expired,
+                "max_wait_s": self.max_wait,
+                "models": models,
+            }
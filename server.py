@@ -1,21 +1,136 @@
-import shutil
+import base64
+import json
+import time
+import io
 import os
 
-from fastapi import FastAPI, HTTPException, UploadFile, File, BackgroundTasks, Form
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import Response, StreamingResponse, JSONResponse, PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
+from starlette.background import BackgroundTask
 from typing import List, Optional
 from pydantic import BaseModel
+from starlette.routing import Match
 
-import omni_engine
+from audio_store import AudioStore, AUDIO_FORMATS, encode_audio
+from sessions import SessionStore, trim_history, valid_session_id
+from tts_service import VOICE_PATTERN, DEFAULT_VOICE, voice_lang
+from stt_service import StreamingTranscriber, MODEL_SIZES, pcm16_to_float
+from batch_jobs import JobManager
+from scheduler import DeadlineExceeded
+from admission import AdmissionController, AdmissionRejected, request_deadline, request_priority, deadline_exceeded
+from metrics import REGISTRY, REQUESTS, REQUEST_SECONDS, Trace, current_trace, stage, observe_stage, process_memory
+
+# With OMNI_ENGINE_SOCKET set, this worker holds no models and forwards engine calls to `python engine_ipc.py`.
+REMOTE_ENGINE = bool(os.getenv("OMNI_ENGINE_SOCKET"))
+if REMOTE_ENGINE:
+    from engine_ipc import RemoteEngine
+    omni_engine = RemoteEngine()
+    # Sessions, stored audio and jobs live in the engine process, so any worker can serve any of them.
+    session_store = omni_engine.session_store
+    audio_store = omni_engine.audio_store
+    job_manager = omni_engine.job_manager
+else:
+    import omni_engine
+    session_store = SessionStore()
+    audio_store = AudioStore()
+    job_manager = JobManager(omni_engine)
 
 
 app = FastAPI(title="OmniLocal API", version="1.0")
+admission = AdmissionController()
+TIMING_HEADERS = os.getenv("OMNI_TIMING_HEADERS", "0") == "1"
 
 @app.on_event("startup")
 async def startup_event():
     print("\n[System] Starting FastAPI Server...")
     omni_engine.initialize()
-    print("[System] OmniLocal API is running and ready for requests!\n")
+    print("[System] OmniLocal API is running, models are warming up in the background (see /readyz).\n")
+
+def route_path(request: Request):
+    # Label metrics by route template so ids in the path don't create a series per request.
+    for route in app.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+# Registered before trace_requests so that one wraps it and also counts rejected requests.
+@app.middleware("http")
+async def admit_requests(request: Request, call_next):
+    """Queues model-bound POSTs in their admission lane before the body is read, so shed load never spools uploads."""
+    lane = admission.lane_for(request.method, route_path(request))
+    if lane is None:
+        return await call_next(request)
+    try:
+        timeout = float(request.headers.get("X-Request-Timeout-S", lane.timeout))
+    except ValueError:
+        timeout = None
+    # Also rejects NaN, which fails every comparison.
+    if timeout is None or not 0 < timeout <= lane.timeout:
+        return JSONResponse(content={"detail": f"X-Request-Timeout-S must be a number of seconds in (0, {lane.timeout:g}] for {lane.name} requests."}, status_code=400)
+    deadline = time.monotonic() + timeout
+    try:
+        await admission.acquire(lane, deadline)
+    except AdmissionRejected as e:
+        return JSONResponse(content={"detail": e.detail}, status_code=e.status_code, headers={"Retry-After": str(e.retry_after)})
+
+    start = time.monotonic()
+    released = False
+    def release():
+        nonlocal released
+        if not released:
+            released = True
+            admission.release(lane, time.monotonic() - start)
+
+    token = request_deadline.set(deadline)
+    priority_token = request_priority.set(lane.priority)
+    try:
+        response = await call_next(request)
+    except BaseException:
+        release()
+        raise
+    finally:
+        request_deadline.reset(token)
+        request_priority.reset(priority_token)
+
+    # Streamed bodies keep running after call_next returns, so the slot is held until the body is done;
+    # the background task covers a body that is never iterated because the client left first.
+    body_iterator = response.body_iterator
+    async def release_after_body():
+        try:
+            async for chunk in body_iterator:
+                yield chunk
+        finally:
+            release()
+    previous_background = response.background
+    async def release_after_background():
+        try:
+            if previous_background is not None:
+                await previous_background()
+        finally:
+            release()
+    response.body_iterator = release_after_body()
+    response.background = BackgroundTask(release_after_background)
+    return response
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    endpoint = route_path(request)
+    trace = Trace(endpoint, request.headers.get("X-Trace-Id"))
+    token = current_trace.set(trace)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        current_trace.reset(token)
+    REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+    REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+
+    response.headers["X-Trace-Id"] = trace.trace_id
+    if TIMING_HEADERS and trace.stages:
+        response.headers["Server-Timing"] = trace.server_timing()
+    return response
 
 class ChatMessage(BaseModel):
     role: str
@@ -25,84 +140,540 @@ class ChatRequest(BaseModel):
     user_input: str
     chat_history: Optional[List[ChatMessage]] = []
     use_search: bool = False
+    session_id: Optional[str] = None
+    audio_delivery: str = "url"
+    audio_format: str = "wav"
+    voice: str = DEFAULT_VOICE
+    speed: float = 1.0
+    cache: bool = False
 
 class OmniResponse(BaseModel):
     response_text: str
-    audio_url: str
+    audio_url: Optional[str] = None
+    audio_base64: Optional[str] = None
+    audio_format: str = "wav"
+    session_id: Optional[str] = None
+
+class VisionBatchResponse(BaseModel):
+    results: List[OmniResponse]
+
+class SessionResponse(BaseModel):
+    session_id: str
+    messages: List[ChatMessage] = []
+    summary: str = ""
     
 class TranscribeResponse(BaseModel):
     text: str
 
+class JobRequest(BaseModel):
+    manifest_path: str
+    output_path: str
+    audio_dir: Optional[str] = None
+    chunk_size: Optional[int] = None
+    cache: bool = False
+
+def fit_history(history):
+    kept, _ = trim_history(history, omni_engine.count_tokens, omni_engine.HISTORY_TOKEN_BUDGET, omni_engine.HISTORY_KEEP_RATIO)
+    return kept
+
+def session_history(session_id: str):
+    session = session_store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found or expired.")
+
+    summary = session.summary
+    kept, dropped = trim_history(list(session.messages), omni_engine.count_tokens, omni_engine.HISTORY_TOKEN_BUDGET, omni_engine.HISTORY_KEEP_RATIO)
+    if dropped:
+        if omni_engine.SUMMARIZE_HISTORY:
+            summary = omni_engine.summarize_history(dropped, summary)
+        session_store.trim(session_id, dropped, summary)
+
+    history = list(kept)
+    if summary:
+        # A separate system turn keeps the pinned system prompt prefix intact.
+        history.insert(0, {"role": "system", "content": f"Summary of the earlier conversation: {summary}"})
+    return history
+
+def build_messages(request: ChatRequest):
+    if request.session_id:
+        history = session_history(request.session_id)
+    else:
+        history = fit_history([{"role": msg.role, "content": msg.content} for msg in request.chat_history])
+
+    messages = [{"role": "system", "content": omni_engine.SYSTEM_PROMPT}]
+    messages.extend(history)
+    messages.append({"role": "user", "content": request.user_input})
+    return messages
+
+def record_turn(request: ChatRequest, response_text: str):
+    if request.session_id:
+        session_store.append(
+            request.session_id,
+            {"role": "user", "content": request.user_input},
+            {"role": "assistant", "content": response_text.strip()},
+        )
+
+def deadline_error(detail: str):
+    return HTTPException(status_code=503, detail=detail, headers={"Retry-After": "1"})
+
+def check_deadline(deadline: Optional[float] = None):
+    """Drops a request whose deadline passed while it waited, before it takes up a model."""
+    if deadline_exceeded(deadline):
+        raise deadline_error("Request deadline exceeded before the model could start.")
+
+def sse_event(payload: dict):
+    return f"data: {json.dumps(payload)}\n\n"
+
+@app.post("/api/sessions", response_model=SessionResponse)
+def create_session_endpoint():
+    session = session_store.create()
+    return SessionResponse(session_id=session.session_id)
+
+@app.get("/api/sessions/{session_id}", response_model=SessionResponse)
+def get_session_endpoint(session_id: str):
+    session = session_store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found or expired.")
+    return SessionResponse(session_id=session.session_id, messages=session.messages, summary=session.summary)
+
+@app.delete("/api/sessions/{session_id}")
+def delete_session_endpoint(session_id: str):
+    if not valid_session_id(session_id):
+        raise HTTPException(status_code=404, detail="Session not found or expired.")
+    session_store.delete(session_id)
+    return {"deleted": session_id}
+
+def check_audio_options(audio_delivery: str, audio_format: str):
+    if audio_delivery not in ("url", "inline"):
+        raise HTTPException(status_code=400, detail="audio_delivery must be 'url' or 'inline'.")
+    if audio_format not in AUDIO_FORMATS:
+        raise HTTPException(status_code=400, detail=f"audio_format must be one of: {', '.join(AUDIO_FORMATS)}.")
+
+def check_voice(voice: str, speed: float):
+    if not VOICE_PATTERN.match(voice):
+        raise HTTPException(status_code=400, detail="voice must be a Kokoro voice id such as 'af_heart' or 'bm_george'.")
+    try:
+        voice_lang(voice)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not 0.5 <= speed <= 2.0:
+        raise HTTPException(status_code=400, detail="speed must be between 0.5 and 2.0.")
+
+def deliver_audio(http_request: Request, samples, audio_delivery: str, audio_format: str):
+    """Returns the OmniResponse audio fields, either inline or as a one-shot URL into the audio store."""
+    audio_id = audio_store.put(samples, omni_engine.SAMPLE_RATE) if audio_delivery == "url" else None
+    if audio_id is None:
+        # Replies too large for the audio store are sent inline rather than as a URL that would already be gone.
+        data, _ = encode_audio(samples, omni_engine.SAMPLE_RATE, audio_format)
+        return {"audio_base64": base64.b64encode(data).decode("ascii"), "audio_format": audio_format}
+
+    audio_url = f"{http_request.url_for('get_audio', audio_id=audio_id)}?format={audio_format}"
+    return {"audio_url": audio_url, "audio_format": audio_format}
+
+def start_search(request: ChatRequest):
+    if not request.use_search:
+        return None
+    return omni_engine.search_web_async(request.user_input)
+
+def finish_search(search_future):
+    return search_future.result() if search_future is not None else ""
+
 @app.post("/api/chat", response_model=OmniResponse)
-def chat_endpoint(request: ChatRequest):
+def chat_endpoint(request: ChatRequest, http_request: Request):
+    check_audio_options(request.audio_delivery, request.audio_format)
+    check_voice(request.voice, request.speed)
+    search_future = start_search(request)
+    with stage("history"):
+        messages = build_messages(request)
+    
     try:
-        web_context = ""
-        if request.use_search:
-            web_context = omni_engine.search_web(request.user_input)
-            
-        messages = [{"role": "system", "content": omni_engine.SYSTEM_PROMPT}]
-        for msg in request.chat_history:
-            messages.append({"role": msg.role, "content": msg.content})
-        messages.append({"role": "user", "content": request.user_input})
-
-        response_text = omni_engine.generate_text(messages, web_context)
-        audio_path = omni_engine.generate_audio(response_text)
-        
-        audio_filename = os.path.basename(audio_path)
-        audio_url = f"http://127.0.0.1:8000/audio/{audio_filename}"
-
-        return OmniResponse(response_text=response_text, audio_url=audio_url)
+        with stage("search"):
+            web_context = finish_search(search_future)
+
+        check_deadline()
+        with stage("generate"):
+            response_text = omni_engine.generate_text(messages, web_context, cache=request.cache)
+        record_turn(request, response_text)
+        with stage("tts"):
+            audio = omni_engine.generate_audio(response_text, request.voice, request.speed)
+        with stage("deliver"):
+            audio_fields = deliver_audio(http_request, audio, request.audio_delivery, request.audio_format)
+
+        return OmniResponse(response_text=response_text, session_id=request.session_id, **audio_fields)
+    except DeadlineExceeded as e:
+        raise deadline_error(str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def stream_reply_events(request: ChatRequest, messages, search_future, started: float, timings: dict, deadline: Optional[float] = None):
+    """SSE events for a streamed reply. `timings` collects the search wait and the time from
+    `started` to the first token, the first audio chunk and the end of the reply."""
+    def elapsed():
+        return round(time.perf_counter() - started, 3)
+
+    search_start = time.perf_counter()
+    web_context = finish_search(search_future)
+    if search_future is not None:
+        timings["search_s"] = round(time.perf_counter() - search_start, 3)
+
+    check_deadline(deadline)
+    for kind, value in omni_engine.stream_chat(messages, web_context, request.audio_format, request.voice, request.speed, request.cache):
+        if kind == "token":
+            timings.setdefault("first_token_s", elapsed())
+            yield sse_event({"type": "token", "text": value})
+        elif kind == "audio":
+            timings.setdefault("first_audio_s", elapsed())
+            yield sse_event({"type": "audio", "format": request.audio_format, "data": base64.b64encode(value).decode("ascii")})
+        else:
+            record_turn(request, value)
+            timings["total_s"] = elapsed()
+            for name, seconds in timings.items():
+                observe_stage(name[:-2], seconds)
+            yield sse_event({"type": "done", "response_text": value, "session_id": request.session_id, "timings": timings})
+
+@app.post("/api/chat/stream")
+def chat_stream_endpoint(request: ChatRequest):
+    started = time.perf_counter()
+    deadline = request_deadline.get()
+    check_audio_options("inline", request.audio_format)
+    check_voice(request.voice, request.speed)
+    search_future = start_search(request)
+    messages = build_messages(request)
+    
+    def event_stream():
+        try:
+            yield from stream_reply_events(request, messages, search_future, started, {}, deadline)
+        except HTTPException as e:
+            yield sse_event({"type": "error", "detail": e.detail})
+        except Exception as e:
+            yield sse_event({"type": "error", "detail": str(e)})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+def check_vision_prompts(prompts: List[str], images: int):
+    if len(prompts) not in (1, images):
+        raise HTTPException(status_code=400, detail="Send one prompt for all images or one prompt per image.")
+    return prompts * images if len(prompts) == 1 else prompts
+
 @app.post("/api/vision", response_model=OmniResponse)
-def vision_endpoint(prompt: str = Form(...), image_file: UploadFile = File(...)):
-    temp_path = f"temp_vision_{image_file.filename}"
+def vision_endpoint(http_request: Request, prompt: str = Form(...), image_file: UploadFile = File(...), audio_delivery: str = Form("url"), audio_format: str = Form("wav"), voice: str = Form(DEFAULT_VOICE), speed: float = Form(1.0), cache: bool = Form(False)):
+    check_audio_options(audio_delivery, audio_format)
+    check_voice(voice, speed)
+    check_deadline()
     
     try:
-        with open(temp_path, "wb") as buffer:
-            shutil.copyfileobj(image_file.file, buffer)
-            
-        response_text = omni_engine.generate_vision(temp_path, prompt)
-        audio_path = omni_engine.generate_audio(response_text)
-        
-        audio_filename = os.path.basename(audio_path)
-        audio_url = f"http://127.0.0.1:8000/audio/{audio_filename}"
-
-        return OmniResponse(response_text=response_text, audio_url=audio_url)
+        with stage("vision"):
+            response_text = omni_engine.generate_vision(image_file.file.read(), prompt, cache)
+        with stage("tts"):
+            audio = omni_engine.generate_audio(response_text, voice, speed)
+        with stage("deliver"):
+            audio_fields = deliver_audio(http_request, audio, audio_delivery, audio_format)
+
+        return OmniResponse(response_text=response_text, **audio_fields)
+    except DeadlineExceeded as e:
+        raise deadline_error(str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+
+@app.post("/api/vision/batch", response_model=VisionBatchResponse)
+def vision_batch_endpoint(http_request: Request, image_files: List[UploadFile] = File(...), prompt: List[str] = Form(...), audio_delivery: str = Form("none"), audio_format: str = Form("wav"), voice: str = Form(DEFAULT_VOICE), speed: float = Form(1.0), cache: bool = Form(False)):
+    """Captions many images in one request. `prompt` is repeated once per image or given once for all;
+    audio is only synthesized when `audio_delivery` is "url" or "inline"."""
+    if audio_delivery != "none":
+        check_audio_options(audio_delivery, audio_format)
+        check_voice(voice, speed)
+    prompts = check_vision_prompts(prompt, len(image_files))
+    check_deadline()
+
+    try:
+        items = [(image_file.file.read(), text) for image_file, text in zip(image_files, prompts)]
+        with stage("vision"):
+            replies = omni_engine.generate_vision_batch(items, cache=cache)
+        results = []
+        for response_text in replies:
+            audio_fields = {}
+            if audio_delivery != "none":
+                with stage("tts"):
+                    audio = omni_engine.generate_audio(response_text, voice, speed)
+                with stage("deliver"):
+                    audio_fields = deliver_audio(http_request, audio, audio_delivery, audio_format)
+            results.append(OmniResponse(response_text=response_text, **audio_fields))
+
+        return VisionBatchResponse(results=results)
+    except DeadlineExceeded as e:
+        raise deadline_error(str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def check_stt_options(model_size: Optional[str], beam_size: Optional[int]):
+    if model_size is not None and model_size not in MODEL_SIZES:
+        raise HTTPException(status_code=400, detail=f"model_size must be one of: {', '.join(sorted(MODEL_SIZES))}.")
+    if beam_size is not None and not 1 <= beam_size <= 10:
+        raise HTTPException(status_code=400, detail="beam_size must be between 1 and 10.")
+
+def parse_transcribe_config(text: str):
+    """Validates a /ws/transcribe config frame, raising HTTPException(400) like the form endpoints."""
+    try:
+        config = json.loads(text)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Config must be a JSON object: {e}")
+    if not isinstance(config, dict):
+        raise HTTPException(status_code=400, detail="Config must be a JSON object.")
+    sample_rate = config.get("sample_rate", 16000)
+    if isinstance(sample_rate, bool) or not isinstance(sample_rate, int) or not 1 <= sample_rate <= 192000:
+        raise HTTPException(status_code=400, detail="sample_rate must be a positive integer of at most 192000.")
+    beam_size = config.get("beam_size")
+    if beam_size is not None and (isinstance(beam_size, bool) or not isinstance(beam_size, int)):
+        raise HTTPException(status_code=400, detail="beam_size must be an integer.")
+    if config.get("language") is not None and not isinstance(config["language"], str):
+        raise HTTPException(status_code=400, detail="language must be a string.")
+    if config.get("model_size") is not None and not isinstance(config["model_size"], str):
+        raise HTTPException(status_code=400, detail="model_size must be a string.")
+    check_stt_options(config.get("model_size"), beam_size)
+    return config
 
 @app.post("/api/transcribe", response_model=TranscribeResponse)
-async def transcribe_endpoint(file: UploadFile = File(...)):
-    temp_path = f"temp_{file.filename}"
-    with open(temp_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-        
+def transcribe_endpoint(file: UploadFile = File(...), model_size: Optional[str] = Form(None), beam_size: Optional[int] = Form(None), vad: Optional[bool] = Form(None), language: Optional[str] = Form(None)):
+    check_stt_options(model_size, beam_size)
+    check_deadline()
     try:
-        transcribed_text = omni_engine.transcribe_audio(temp_path)
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+        with stage("stt"):
+            transcribed_text = omni_engine.transcribe_audio(file.file, model_size, beam_size, vad, language)
         return TranscribeResponse(text=transcribed_text)
     except Exception as e:
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/audio/{filename}")
-async def get_audio(filename: str, background_tasks: BackgroundTasks):
-    base_dir = os.path.abspath(omni_engine.AUDIO_DIR)
-    file_path = os.path.abspath(os.path.join(base_dir, filename))
-    
-    if not file_path.startswith(base_dir):
-        raise HTTPException(status_code=400, detail="Invalid file path.")
+@app.post("/api/transcribe/stream")
+def transcribe_stream_endpoint(file: UploadFile = File(...), model_size: Optional[str] = Form(None), beam_size: Optional[int] = Form(None), vad: Optional[bool] = Form(None), language: Optional[str] = Form(None)):
+    check_stt_options(model_size, beam_size)
+    # The upload is closed once the endpoint returns, before the stream is consumed.
+    audio = io.BytesIO(file.file.read())
+
+    def event_stream():
+        try:
+            texts = []
+            for segment in omni_engine.stt_service.iter_segments(audio, model_size, beam_size, vad, language):
+                texts.append(segment.text)
+                yield sse_event({"type": "partial", "text": segment.text.strip(), "start": round(segment.start, 2), "end": round(segment.end, 2)})
+            yield sse_event({"type": "done", "text": "".join(texts).strip()})
+        except Exception as e:
+            yield sse_event({"type": "error", "detail": str(e)})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.post("/api/voice")
+def voice_endpoint(file: UploadFile = File(...), session_id: Optional[str] = Form(None), chat_history: Optional[str] = Form(None), use_search: bool = Form(False), audio_format: str = Form("wav"), voice: str = Form(DEFAULT_VOICE), speed: float = Form(1.0), model_size: Optional[str] = Form(None), language: Optional[str] = Form(None)):
+    """One voice turn: transcribes the upload, then streams the reply like /api/chat/stream.
+    The reply starts decoding as soon as the transcript is final and each sentence is voiced
+    while the next one is generated."""
+    started = time.perf_counter()
+    deadline = request_deadline.get()
+    check_audio_options("inline", audio_format)
+    check_voice(voice, speed)
+    check_stt_options(model_size, None)
+    check_deadline()
+    if session_id and session_store.get(session_id) is None:
+        raise HTTPException(status_code=404, detail="Session not found or expired.")
+    try:
+        history = [ChatMessage(**msg) for msg in json.loads(chat_history)] if chat_history else []
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"chat_history must be a JSON list of messages: {e}")
+    audio = io.BytesIO(file.file.read())
+
+    def event_stream():
+        timings = {}
+        try:
+            texts = []
+            for segment in omni_engine.stt_service.iter_segments(audio, model_size, language=language):
+                texts.append(segment.text)
+                yield sse_event({"type": "partial_transcript", "text": segment.text.strip()})
+            user_input = "".join(texts).strip()
+            timings["stt_s"] = round(time.perf_counter() - started, 3)
+            yield sse_event({"type": "transcript", "text": user_input})
+            if not user_input:
+                yield sse_event({"type": "error", "detail": "No speech detected."})
+                return
 
-    if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="Audio file not found.")
-        
-    background_tasks.add_task(os.remove, file_path)
+            request = ChatRequest(user_input=user_input, chat_history=history, use_search=use_search, session_id=session_id, audio_format=audio_format, voice=voice, speed=speed)
+            search_future = start_search(request)
+            messages = build_messages(request)
+            yield from stream_reply_events(request, messages, search_future, started, timings, deadline)
+        except HTTPException as e:
+            yield sse_event({"type": "error", "detail": e.detail})
+        except Exception as e:
+            yield sse_event({"type": "error", "detail": str(e)})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.websocket("/ws/transcribe")
+async def transcribe_websocket(websocket: WebSocket):
+    """Live transcription. Send an optional JSON config first ({"sample_rate", "model_size",
+    "beam_size", "language"}), then binary 16-bit mono PCM frames, then {"type": "end"}."""
+    await websocket.accept()
+    # A live session holds a voice-lane slot for as long as it stays open.
+    lane = admission.lanes["voice"]
+    try:
+        await admission.acquire(lane, time.monotonic() + lane.timeout)
+    except AdmissionRejected as e:
+        await websocket.send_json({"type": "error", "detail": e.detail, "retry_after": e.retry_after})
+        await websocket.close(code=1013)
+        return
+    config = {}
+    transcriber = None
+    remainder = b""
     
-    return FileResponse(file_path, media_type="audio/wav")
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+                
+            if message.get("text") is not None:
+                try:
+                    payload = parse_transcribe_config(message["text"])
+                except HTTPException as e:
+                    await websocket.send_json({"type": "error", "detail": e.detail})
+                    await websocket.close(code=1003)
+                    return
+                if payload.get("type") == "end":
+                    break
+                config = payload
+                continue
+            if message.get("bytes") is None:
+                continue
+
+            if transcriber is None:
+                transcriber = StreamingTranscriber(omni_engine.stt_service, config.get("model_size"), config.get("beam_size"), config.get("language"))
+
+            data = remainder + message["bytes"]
+            # PCM16 frames may split a sample across messages.
+            remainder = data[len(data) - len(data) % 2:]
+            samples = pcm16_to_float(data[:len(data) - len(data) % 2], config.get("sample_rate", 16000))
+            for event in await run_in_threadpool(transcriber.feed, samples):
+                await websocket.send_json(event)
+
+        if transcriber is None:
+            await websocket.send_json({"type": "done", "text": ""})
+        else:
+            for event in await run_in_threadpool(transcriber.finish):
+                await websocket.send_json(event)
+        await websocket.close()
+    except WebSocketDisconnect:
+        return
+    finally:
+        admission.release(lane)
+
+@app.get("/healthz")
+def healthz_endpoint():
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz_endpoint(capability: Optional[str] = None):
+    """200 once `capability` (text, vision, stt or tts) has warmed up, or without one once the whole OMNI_WARMUP set has."""
+    if capability is not None and capability not in omni_engine.WARMUP_TASKS:
+        raise HTTPException(status_code=400, detail=f"capability must be one of: {', '.join(omni_engine.WARMUP_TASKS)}.")
+    ready = omni_engine.warmup.ready(capability)
+    models = omni_engine.model_manager.stats()["models"]
+    body = {
+        "ready": ready,
+        "capabilities": omni_engine.warmup.stats(),
+        "models": {name: model["state"] for name, model in models.items()},
+    }
+    return JSONResponse(content=body, status_code=200 if ready else 503)
+
+def collect_runtime_metrics():
+    """Scrape-time metrics from the stats the model manager, scheduler and batcher already keep."""
+    models = omni_engine.model_manager.stats()
+    scheduler = omni_engine.scheduler.stats()
+    batching = omni_engine.text_batcher.stats()
+    families = [
+        ("omni_model_swaps_total", "counter", "Models offloaded to make room for another.", [({}, models["swaps"])]),
+        ("omni_model_switches_total", "counter", "Times the accelerator switched between models.", [({}, scheduler["switches"])]),
+        ("omni_model_loaded", "gauge", "1 for the state each model is currently in.", [({"model": name, "state": m["state"]}, 1) for name, m in models["models"].items()]),
+        ("omni_model_resident_bytes", "gauge", "Estimated memory of the models on the device and offloaded to CPU RAM.", [
+            ({"location": "device"}, int(models["resident_gb"] * 1024 ** 3)),
+            ({"location": "cpu"}, int(models["offloaded_gb"] * 1024 ** 3)),
+        ]),
+        ("omni_scheduler_queue_depth", "gauge", "Requests waiting for the accelerator per model.", [({"model": name}, q["queue_depth"]) for name, q in scheduler["models"].items()]),
+        ("omni_batch_queue_depth", "gauge", "Text requests queued for or decoding in the batcher.", [({"state": "queued"}, batching["queued"]), ({"state": "active"}, batching["active"])]),
+    ]
+    for event in ("loads", "restores", "offloads", "evictions"):
+        families.append((f"omni_model_{event}_total", "counter", f"Model {event} per model.", [({"model": name}, entry[event]) for name, entry in models["models"].items()]))
+    processes = {"server": process_memory()}
+    if REMOTE_ENGINE:
+        processes["engine"] = omni_engine.process_memory()
+    cuda = [({"process": name, "kind": kind}, value) for name, memory in processes.items() for kind, value in memory["cuda"].items()]
+    if cuda:
+        families.append(("omni_cuda_memory_bytes", "gauge", "CUDA memory allocated and reserved by PyTorch.", cuda))
+    rss = [({"process": name}, memory["rss"]) for name, memory in processes.items() if memory["rss"] is not None]
+    if rss:
+        families.append(("omni_process_resident_bytes", "gauge", "Resident memory of the server and engine processes.", rss))
+    return families
+
+REGISTRY.add_collector(collect_runtime_metrics)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    # Model-side metrics (tokens, loads, TTS speed) are recorded in the engine process.
+    remote = omni_engine.metrics_snapshot() if REMOTE_ENGINE else None
+    return PlainTextResponse(REGISTRY.render(remote), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/models")
+def models_endpoint():
+    stats = omni_engine.model_manager.stats()
+    stats["profile"] = omni_engine.PROFILE.to_dict()
+    return stats
+
+@app.get("/api/scheduler")
+def scheduler_endpoint():
+    stats = omni_engine.scheduler.stats()
+    stats["text_batching"] = omni_engine.text_batcher.stats()
+    stats["speculative"] = omni_engine.speculative_decoder.stats()
+    stats["sessions"] = session_store.stats()
+    stats["search"] = omni_engine.search_service.stats()
+    stats["audio_store"] = audio_store.stats()
+    stats["tts"] = omni_engine.tts_service.stats()
+    stats["stt"] = omni_engine.stt_service.stats()
+    stats["image_cache"] = omni_engine.image_cache.stats()
+    stats["response_cache"] = omni_engine.response_cache.stats()
+    stats["admission"] = admission.stats()
+    return stats
+
+@app.post("/api/jobs")
+def create_job_endpoint(request: JobRequest):
+    if request.chunk_size is not None and request.chunk_size < 1:
+        raise HTTPException(status_code=400, detail="chunk_size must be at least 1.")
+    try:
+        return job_manager.submit(request.manifest_path, request.output_path, request.audio_dir, request.chunk_size, request.cache)
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid job: {e}")
+
+@app.get("/api/jobs")
+def list_jobs_endpoint():
+    return job_manager.stats()
+
+@app.get("/api/jobs/{job_id}")
+def get_job_endpoint(job_id: str):
+    status = job_manager.status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return status
+
+@app.get("/audio/{audio_id}")
+def get_audio(audio_id: str, format: str = "wav"):
+    check_audio_options("url", format)
+    entry = audio_store.pop(audio_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Audio not found or expired.")
+
+    samples, sample_rate = entry
+    data, media_type = encode_audio(samples, sample_rate, format)
+    return Response(content=data, media_type=media_type)
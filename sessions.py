@@ -0,0 +1,154 @@
+import threading
+import uuid
+import json
+import time
+import re
+import os
+
+from collections import OrderedDict
+
+
+# The ids create() hands out (uuid4().hex); anything else never names a session or a file.
+SESSION_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+class Session:
+    def __init__(self, session_id, messages=None, summary="", created=None, last_active=None):
+        self.session_id = session_id
+        self.messages = messages or []
+        self.summary = summary
+        self.created = created or time.time()
+        self.last_active = last_active or self.created
+
+    def to_dict(self):
+        return {
+            "session_id": self.session_id,
+            "messages": self.messages,
+            "summary": self.summary,
+            "created": self.created,
+            "last_active": self.last_active,
+        }
+
+
+def valid_session_id(session_id):
+    return isinstance(session_id, str) and bool(SESSION_ID_PATTERN.match(session_id))
+
+
+def trim_history(messages, count_tokens, budget, keep_ratio):
+    """Drops the oldest turns once the history exceeds `budget` tokens.
+
+    Trimming goes down to `budget * keep_ratio` rather than just under the budget, so
+    the kept history stays identical for several turns and its prefix stays cached.
+    Returns (kept, dropped).
+    """
+    sizes = [count_tokens(m["content"]) for m in messages]
+    total = sum(sizes)
+    if total <= budget:
+        return messages, []
+
+    target = budget * keep_ratio
+    start = 0
+    while start < len(messages) and total > target:
+        total -= sizes[start]
+        start += 1
+    # Never start the kept history on an assistant turn.
+    while start < len(messages) and messages[start]["role"] != "user":
+        start += 1
+    return messages[start:], messages[:start]
+
+
+class SessionStore:
+    """Bounded in-memory conversation store with TTL expiry and optional JSON persistence."""
+
+    def __init__(self, max_sessions=None, ttl_seconds=None, persist_dir=None):
+        self.max_sessions = max_sessions or int(os.getenv("OMNI_MAX_SESSIONS", "1000"))
+        self.ttl = ttl_seconds or float(os.getenv("OMNI_SESSION_TTL_S", "3600"))
+        self.persist_dir = persist_dir if persist_dir is not None else os.getenv("OMNI_SESSION_DIR")
+        if self.persist_dir:
+            os.makedirs(self.persist_dir, exist_ok=True)
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _path(self, session_id):
+        return os.path.join(self.persist_dir, f"{session_id}.json")
+
+    def _save(self, session):
+        if not self.persist_dir:
+            return
+        temp_path = self._path(session.session_id) + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(session.to_dict(), f)
+        os.replace(temp_path, self._path(session.session_id))
+
+    def _discard(self, session_id):
+        self.sessions.pop(session_id, None)
+        if self.persist_dir and os.path.exists(self._path(session_id)):
+            os.remove(self._path(session_id))
+
+    def _expired(self, session):
+        return time.time() - session.last_active > self.ttl
+
+    def _purge(self):
+        for session_id in [sid for sid, s in self.sessions.items() if self._expired(s)]:
+            self._discard(session_id)
+        # Sessions evicted for space stay on disk and are reloaded on their next turn.
+        while len(self.sessions) > self.max_sessions:
+            self.sessions.popitem(last=False)
+
+    def create(self):
+        with self.lock:
+            self._purge()
+            session = Session(uuid.uuid4().hex)
+            self.sessions[session.session_id] = session
+            self._save(session)
+            return session
+
+    def get(self, session_id):
+        if not valid_session_id(session_id):
+            return None
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None and self.persist_dir and os.path.exists(self._path(session_id)):
+                with open(self._path(session_id), encoding="utf-8") as f:
+                    session = Session(**json.load(f))
+                self.sessions[session_id] = session
+
+            if session is None:
+                return None
+            if self._expired(session):
+                self._discard(session_id)
+                return None
+
+            session.last_active = time.time()
+            self.sessions.move_to_end(session_id)
+            return session
+
+    def append(self, session_id, *messages):
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                return
+            session.messages.extend(messages)
+            session.last_active = time.time()
+            self._save(session)
+
+    def trim(self, session_id, dropped, summary):
+        """Drops the `dropped` oldest messages and stores the new summary, keeping turns appended meanwhile."""
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                return
+            if session.messages[:len(dropped)] == dropped:
+                session.messages = session.messages[len(dropped):]
+            session.summary = summary
+            self._save(session)
+
+    def delete(self, session_id):
+        if not valid_session_id(session_id):
+            return
+        with self.lock:
+            self._discard(session_id)
+
+    def stats(self):
+        with self.lock:
+            return {"sessions": len(self.sessions), "max_sessions": self.max_sessions, "ttl_s": self.ttl, "persistent": bool(self.persist_dir)}
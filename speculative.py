@@ -0,0 +1,193 @@
+import threading
+import time
+import os
+
+import torch
+
+from batching import sampling_filters, filter_logits
+from metrics import TOKENS_GENERATED, TIME_TO_FIRST_TOKEN_SECONDS, DECODE_TOKENS_PER_SECOND, SPECULATIVE_DRAFT_TOKENS
+
+
+SPECULATIVE_MODES = ("off", "prompt-lookup", "draft")
+
+
+def prompt_lookup(tokens, num_draft, max_ngram=3):
+    """Proposes the tokens that followed the latest earlier occurrence of the sequence's trailing n-gram."""
+    for n in range(min(max_ngram, len(tokens) - 1), 0, -1):
+        tail = tokens[-n:]
+        for start in range(len(tokens) - n - 1, -1, -1):
+            if tokens[start:start + n] == tail:
+                return tokens[start + n:start + n + num_draft]
+    return []
+
+
+def eos_ids(model, tokenizer):
+    eos = model.generation_config.eos_token_id
+    if eos is None:
+        eos = tokenizer.eos_token_id
+    return set(eos) if isinstance(eos, (list, tuple)) else {eos}
+
+
+def truncate_cache(past, length):
+    """Drops the cached positions after the first `length`, counting from the end as crop() expects."""
+    extra = past.get_seq_length() - length
+    if extra > 0:
+        past.crop(-extra)
+
+
+class SpeculativeDecoder:
+    """Draft-and-verify decoding for one request at a time.
+
+    Drafts come from prompt lookup (n-gram matches in the prompt and the reply so far,
+    which suits answers that quote web context) or from a small draft model sharing the
+    main model's tokenizer. The main model scores every draft in one forward pass. A
+    draft is kept with probability p(draft), or when it is the argmax for greedy
+    requests, and the first rejected position is resampled from p without the draft,
+    so the output follows the same distribution as plain decoding.
+    """
+
+    def __init__(self, mode=None, num_draft=None, max_ngram=None):
+        mode = mode or os.getenv("OMNI_SPECULATIVE", "off")
+        if mode not in SPECULATIVE_MODES:
+            print(f"[Warning] Unknown OMNI_SPECULATIVE '{mode}', speculative decoding is off.")
+            mode = "off"
+        self.mode = mode
+        self.num_draft = num_draft or int(os.getenv("OMNI_SPECULATIVE_TOKENS", "5"))
+        self.max_ngram = max_ngram or int(os.getenv("OMNI_PROMPT_LOOKUP_NGRAM", "3"))
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.proposed = 0
+        self.accepted = 0
+        self.generated = 0
+        self.verify_passes = 0
+        self.decode_seconds = 0.0
+
+    @property
+    def enabled(self):
+        return self.mode != "off"
+
+    def _draft_model_tokens(self, draft_model, state, tokens, num_draft):
+        """Greedy drafts from the draft model, reusing its cache for the prefix it has already seen."""
+        cached = state["tokens"]
+        common = 0
+        limit = min(len(cached), len(tokens) - 1)
+        while common < limit and cached[common] == tokens[common]:
+            common += 1
+        past = state["past"]
+        if past is not None:
+            truncate_cache(past, common)
+
+        feed = tokens[common:]
+        drafts = []
+        for _ in range(num_draft):
+            outputs = draft_model(input_ids=torch.tensor([feed], device=draft_model.device), past_key_values=past, use_cache=True)
+            past = outputs.past_key_values
+            drafts.append(int(outputs.logits[0, -1].argmax()))
+            feed = drafts[-1:]
+        # The last draft was never fed, so the cache stops just before it.
+        state["past"] = past
+        state["tokens"] = tokens + drafts[:-1]
+        return drafts
+
+    def _propose(self, tokens, num_draft, draft_model, draft_state):
+        if num_draft <= 0:
+            return []
+        if self.mode == "draft" and draft_model is not None:
+            return self._draft_model_tokens(draft_model, draft_state, tokens, num_draft)
+        return prompt_lookup(tokens, num_draft, self.max_ngram)
+
+    def _sample(self, logits, temperature, filters):
+        if temperature <= 0:
+            return int(logits.argmax())
+        return int(torch.multinomial(torch.softmax(filter_logits(logits.float() / temperature, *filters), dim=-1), num_samples=1))
+
+    def _verify(self, logits, draft, temperature, filters):
+        """Returns `draft` if it is accepted, otherwise the token sampled in its place."""
+        if temperature <= 0:
+            return int(logits.argmax())
+        # Drafts are judged against the same top-k/top-p distribution plain sampling draws from.
+        probs = torch.softmax(filter_logits(logits.float() / temperature, *filters), dim=-1)
+        if torch.rand(()).item() < probs[draft].item():
+            return draft
+        probs[draft] = 0.0
+        return int(torch.multinomial(probs / probs.sum(), num_samples=1))
+
+    def generate(self, model, tokenizer, input_ids, max_new_tokens, temperature, draft_model=None):
+        """Yields generated token ids for one prompt; end-of-sequence tokens are not yielded."""
+        stop_ids = eos_ids(model, tokenizer)
+        filters = sampling_filters(model)
+        tokens = list(input_ids)
+        draft_state = {"past": None, "tokens": []}
+        proposed = accepted = passes = generated = 0
+        created = time.perf_counter()
+        first_token_at = None
+
+        try:
+            with torch.no_grad():
+                outputs = model(input_ids=torch.tensor([tokens], device=model.device), use_cache=True)
+                past = outputs.past_key_values
+                next_token = self._sample(outputs.logits[0, -1], temperature, filters)
+
+                # Invariant: the cache covers `tokens`, and `next_token` is sampled but not yet fed.
+                while next_token not in stop_ids:
+                    tokens.append(next_token)
+                    generated += 1
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    yield next_token
+                    if generated >= max_new_tokens:
+                        break
+
+                    # Leave room for the token sampled after the drafts.
+                    drafts = self._propose(tokens, min(self.num_draft, max_new_tokens - generated - 1), draft_model, draft_state)
+                    outputs = model(input_ids=torch.tensor([[next_token] + drafts], device=model.device), past_key_values=past, use_cache=True)
+                    past = outputs.past_key_values
+                    logits = outputs.logits[0]
+                    passes += 1
+                    proposed += len(drafts)
+
+                    next_token = None
+                    for i, draft in enumerate(drafts):
+                        token = self._verify(logits[i], draft, temperature, filters)
+                        if token != draft or draft in stop_ids:
+                            next_token = token
+                            break
+                        accepted += 1
+                        tokens.append(draft)
+                        generated += 1
+                        yield draft
+                    if next_token is None:
+                        next_token = self._sample(logits[len(drafts)], temperature, filters)
+                    truncate_cache(past, len(tokens))
+        finally:
+            self._record(proposed, accepted, passes, generated, created, first_token_at)
+
+    def _record(self, proposed, accepted, passes, generated, created, first_token_at):
+        SPECULATIVE_DRAFT_TOKENS.inc(proposed, mode=self.mode, result="proposed")
+        SPECULATIVE_DRAFT_TOKENS.inc(accepted, mode=self.mode, result="accepted")
+        TOKENS_GENERATED.inc(generated, model="text")
+        decode_seconds = time.perf_counter() - first_token_at if first_token_at is not None else 0.0
+        if first_token_at is not None:
+            TIME_TO_FIRST_TOKEN_SECONDS.observe(first_token_at - created, model="text")
+        if generated > 1 and decode_seconds > 0:
+            DECODE_TOKENS_PER_SECOND.observe((generated - 1) / decode_seconds, model="text")
+        with self.lock:
+            self.requests += 1
+            self.proposed += proposed
+            self.accepted += accepted
+            self.generated += generated
+            self.verify_passes += passes
+            self.decode_seconds += decode_seconds
+
+    def stats(self):
+        with self.lock:
+            return {
+                "mode": self.mode,
+                "draft_tokens": self.num_draft,
+                "requests": self.requests,
+                "proposed": self.proposed,
+                "accepted": self.accepted,
+                "acceptance_rate": round(self.accepted / self.proposed, 3) if self.proposed else 0.0,
+                "tokens_per_pass": round(self.generated / (self.verify_passes + self.requests), 2) if self.requests else 0.0,
+                "tokens_per_s": round(self.generated / self.decode_seconds, 2) if self.decode_seconds else 0.0,
+            }
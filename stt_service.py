@@ -0,0 +1,144 @@
+import numpy as np
+import threading
+import os
+
+
+STT_SAMPLE_RATE = 16000
+MODEL_SIZES = {"tiny", "tiny.en", "base", "base.en", "small", "small.en", "medium", "medium.en", "large-v3", "distil-large-v3"}
+
+
+class STTService:
+    """Faster-Whisper transcription with per-request model size, beam size and VAD.
+
+    Models are loaded lazily per size and shared between requests. The compute type
+    defaults to float16 on CUDA and int8 on CPU, where float16 is not supported.
+    """
+
+    def __init__(self, device=None, compute_type=None, default_size=None, beam_size=None, vad=None):
+        if device is None:
+            # Lazy, so a remote HTTP worker importing StreamingTranscriber and the helpers stays torch-free.
+            import torch
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.device = device
+        self.compute_type = compute_type or os.getenv("OMNI_STT_COMPUTE_TYPE") or ("float16" if self.device == "cuda" else "int8")
+        self.default_size = default_size or os.getenv("OMNI_STT_MODEL", "medium")
+        self.beam_size = beam_size or int(os.getenv("OMNI_STT_BEAM_SIZE", "5"))
+        self.vad = vad if vad is not None else os.getenv("OMNI_STT_VAD", "1") == "1"
+        self.workers = int(os.getenv("OMNI_STT_WORKERS", "2"))
+        self.models = {}
+        self.lock = threading.Lock()
+
+    def load(self, model_size=None):
+        model_size = model_size or self.default_size
+        if model_size not in MODEL_SIZES:
+            raise ValueError(f"Unknown Whisper model '{model_size}'. Choose one of: {', '.join(sorted(MODEL_SIZES))}.")
+        with self.lock:
+            if model_size not in self.models:
+                from faster_whisper import WhisperModel
+                print(f"[System] Loading STT (Faster-Whisper {model_size}, {self.compute_type})...")
+                self.models[model_size] = WhisperModel(model_size, device=self.device, compute_type=self.compute_type, num_workers=self.workers)
+            return self.models[model_size]
+
+    def iter_segments(self, audio, model_size=None, beam_size=None, vad=None, language=None):
+        """Yields segments as Whisper decodes them. `audio` is a path, a file-like object or 16 kHz float32 samples."""
+        model = self.load(model_size)
+        if not isinstance(audio, (str, np.ndarray)):
+            from faster_whisper import decode_audio
+            audio = decode_audio(audio, sampling_rate=STT_SAMPLE_RATE)
+        segments, _ = model.transcribe(
+            audio,
+            beam_size=beam_size or self.beam_size,
+            vad_filter=self.vad if vad is None else vad,
+            language=language,
+        )
+        yield from segments
+
+    def transcribe(self, audio, model_size=None, beam_size=None, vad=None, language=None):
+        text = "".join(segment.text for segment in self.iter_segments(audio, model_size, beam_size, vad, language))
+        return text.strip()
+
+    def stats(self):
+        return {
+            "device": self.device,
+            "compute_type": self.compute_type,
+            "default_model": self.default_size,
+            "loaded_models": sorted(self.models),
+            "beam_size": self.beam_size,
+            "vad": self.vad,
+        }
+
+
+class StreamingTranscriber:
+    """Incremental transcription of a live 16 kHz audio stream.
+
+    Audio is buffered and every `partial_interval_s` the buffer is run through VAD.
+    Pure silence is discarded, ongoing speech is transcribed greedily as a partial
+    result, and once speech is followed by `min_silence_ms` of silence the utterance
+    is transcribed with the full beam and emitted as final.
+    """
+
+    def __init__(self, service, model_size=None, beam_size=None, language=None, partial_interval_s=1.0, min_silence_ms=600, max_utterance_s=30):
+        self.service = service
+        self.model_size = model_size
+        self.beam_size = beam_size
+        self.language = language
+        self.partial_samples = int(partial_interval_s * STT_SAMPLE_RATE)
+        self.min_silence = int(min_silence_ms * STT_SAMPLE_RATE / 1000)
+        self.max_utterance = int(max_utterance_s * STT_SAMPLE_RATE)
+        from faster_whisper.vad import VadOptions
+        self.vad_options = VadOptions(min_silence_duration_ms=min_silence_ms)
+        self.pad = int(0.2 * STT_SAMPLE_RATE)
+        self.buffer = np.zeros(0, dtype=np.float32)
+        self.offset = 0
+        self.since_partial = 0
+        self.finals = []
+
+    def feed(self, samples):
+        """Adds float32 samples and returns any new {"type": "partial"|"final", ...} events."""
+        self.buffer = np.concatenate([self.buffer, samples.astype(np.float32, copy=False)])
+        self.since_partial += len(samples)
+        if self.since_partial < self.partial_samples:
+            return []
+        self.since_partial = 0
+        return self._process(final=False)
+
+    def finish(self):
+        events = self._process(final=True) if len(self.buffer) else []
+        events.append({"type": "done", "text": " ".join(self.finals)})
+        return events
+
+    def _drop(self, samples):
+        self.buffer = self.buffer[samples:]
+        self.offset += samples
+
+    def _process(self, final):
+        from faster_whisper.vad import get_speech_timestamps
+        speech = get_speech_timestamps(self.buffer, self.vad_options)
+        if not speech:
+            # Only silence so far; keep a short tail so a word starting at the boundary isn't cut.
+            self._drop(max(len(self.buffer) - self.pad, 0))
+            return []
+
+        start = max(speech[0]["start"] - self.pad, 0)
+        end = min(speech[-1]["end"] + self.pad, len(self.buffer))
+        trailing_silence = len(self.buffer) - speech[-1]["end"]
+
+        if final or trailing_silence >= self.min_silence or end - start >= self.max_utterance:
+            text = self.service.transcribe(self.buffer[start:end], self.model_size, self.beam_size, vad=False, language=self.language)
+            event = {"type": "final", "text": text, "start": round((self.offset + start) / STT_SAMPLE_RATE, 2), "end": round((self.offset + end) / STT_SAMPLE_RATE, 2)}
+            self._drop(end)
+            if text:
+                self.finals.append(text)
+            return [event]
+
+        text = self.service.transcribe(self.buffer[start:], self.model_size, beam_size=1, vad=False, language=self.language)
+        return [{"type": "partial", "text": text}]
+
+
+def pcm16_to_float(data, sample_rate=STT_SAMPLE_RATE):
+    """Converts little-endian 16-bit mono PCM bytes to 16 kHz float32 samples."""
+    samples = np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768.0
+    if sample_rate != STT_SAMPLE_RATE and len(samples):
+        target = int(len(samples) * STT_SAMPLE_RATE / sample_rate)
+        samples = np.interp(np.linspace(0, len(samples) - 1, target), np.arange(len(samples)), samples).astype(np.float32)
+    return samples
@@ -0,0 +1,14 @@
+import subprocess
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_remote_worker_does_not_import_torch():
+    # A worker forwarding to `python engine_ipc.py` holds no models, so it must not pay for torch either.
+    env = dict(os.environ, OMNI_ENGINE_SOCKET="/tmp/omnilocal-test-missing.sock", OMNI_ENGINE_AUTHKEY="test")
+    code = "import sys, server; print('torch' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().splitlines()[-1] == "False"
@@ -0,0 +1,208 @@
+import numpy as np
+import threading
+import hashlib
+import time
+import os
+import re
+
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from metrics import TTS_REAL_TIME_FACTOR
+
+
+SAMPLE_RATE = 24000
+DEFAULT_VOICE = "af_heart"
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+VOICE_PATTERN = re.compile(r'^[a-z]{2}_[a-z0-9]+$')
+# Language codes KPipeline accepts: American and British English, Spanish, French, Hindi, Italian, Japanese, Portuguese, Mandarin.
+KOKORO_LANGS = "abefhijpz"
+
+
+def clean_text(text):
+    return " ".join(re.sub(r'[*_#`~]', '', text).split())
+
+
+def split_sentences(buffer):
+    """Splits off the completed sentences of a partial reply, returning them with the unfinished tail."""
+    parts = SENTENCE_END.split(buffer)
+    return [p.strip() for p in parts[:-1] if p.strip()], parts[-1]
+
+
+def voice_lang(voice):
+    # Kokoro voice ids start with their language code, e.g. "af_heart" -> "a", "bf_emma" -> "b".
+    if voice[0] not in KOKORO_LANGS:
+        raise ValueError(f"Voice '{voice}' has no supported language prefix. Use one starting with: {', '.join(KOKORO_LANGS)}.")
+    return voice[0]
+
+
+class TTSService:
+    """Kokoro synthesis with a sentence-level audio cache.
+
+    Text is split into sentences and each one is looked up by (text, voice, speed,
+    lang), first in a size-bounded in-memory LRU and then in an optional on-disk
+    tier, so replies that only partially overlap still reuse the shared sentences.
+    """
+
+    def __init__(self, max_bytes=None, disk_dir=None, max_disk_bytes=None):
+        self.max_bytes = max_bytes or float(os.getenv("OMNI_TTS_CACHE_MB", "64")) * 1024 ** 2
+        self.disk_dir = disk_dir if disk_dir is not None else os.getenv("OMNI_TTS_CACHE_DIR")
+        self.max_disk_bytes = max_disk_bytes or float(os.getenv("OMNI_TTS_DISK_CACHE_MB", "1024")) * 1024 ** 2
+        self.pipelines = {}
+        self.synth_lock = threading.Lock()
+        # Synthesis is serialized by synth_lock anyway, so one worker keeps queued sentences in order.
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tts")
+        self.cache = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_bytes = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self.disk_bytes = sum(entry.stat().st_size for entry in os.scandir(self.disk_dir) if entry.name.endswith(".npy") and not entry.name.endswith(".tmp.npy"))
+
+    def load(self, lang="a"):
+        if lang not in self.pipelines:
+            from kokoro import KPipeline
+            print(f"[System] Loading TTS (Kokoro-82M, lang '{lang}')...")
+            self.pipelines[lang] = KPipeline(lang_code=lang)
+        return self.pipelines[lang]
+
+    def _disk_path(self, key):
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.disk_dir, f"{digest}.npy")
+
+    def _remember(self, key, samples):
+        with self.lock:
+            if key in self.cache:
+                return
+            self.cache[key] = samples
+            self.bytes += samples.nbytes
+            while self.bytes > self.max_bytes and self.cache:
+                _, evicted = self.cache.popitem(last=False)
+                self.bytes -= evicted.nbytes
+
+    def _write_disk(self, key, samples):
+        """Best effort: a full or read-only disk leaves the sentence cached in memory only."""
+        path = self._disk_path(key)
+        if os.path.exists(path):
+            return
+        # Per-thread temp names, so concurrent writers of the same sentence never share one.
+        temp_path = f"{path[:-len('.npy')]}.{threading.get_ident()}.tmp.npy"
+        try:
+            np.save(temp_path, samples)
+            os.replace(temp_path, path)
+            size = os.path.getsize(path)
+        except OSError as e:
+            print(f"[Warning] Could not write TTS cache entry: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+        with self.lock:
+            self.disk_bytes += size
+            if self.disk_bytes <= self.max_disk_bytes:
+                return
+            # In-flight temp files belong to other writers and are not cache entries.
+            entries = [e for e in os.scandir(self.disk_dir) if e.name.endswith(".npy") and not e.name.endswith(".tmp.npy")]
+            for entry in sorted(entries, key=lambda e: e.stat().st_mtime):
+                if self.disk_bytes <= self.max_disk_bytes:
+                    break
+                try:
+                    size = entry.stat().st_size
+                    os.remove(entry.path)
+                except OSError:
+                    continue
+                self.disk_bytes -= size
+
+    def _lookup(self, key):
+        with self.lock:
+            samples = self.cache.get(key)
+            if samples is not None:
+                self.cache.move_to_end(key)
+                self.memory_hits += 1
+                return samples
+
+        path = self._disk_path(key) if self.disk_dir else None
+        if path and os.path.exists(path):
+            try:
+                samples = np.load(path)
+                # Disk eviction is least-recently-used by mtime, so touch the entry on every hit.
+                os.utime(path)
+            except (OSError, ValueError):
+                # Evicted by another thread meanwhile, or unreadable: synthesize it again.
+                return None
+            with self.lock:
+                self.disk_hits += 1
+            self._remember(key, samples)
+            return samples
+        return None
+
+    def _synthesize(self, sentence, voice, speed, lang):
+        # Only synthesis needs torch; remote HTTP workers import this module just for its helpers.
+        import torch
+        chunks = []
+        with self.synth_lock:
+            pipeline = self.load(lang)
+            start = time.perf_counter()
+            for _, _, audio_chunk in pipeline(sentence, voice=voice, speed=speed):
+                if torch.is_tensor(audio_chunk):
+                    audio_chunk = audio_chunk.detach().cpu().numpy()
+                chunks.append(np.asarray(audio_chunk, dtype=np.float32))
+        if not chunks:
+            return np.zeros(0, dtype=np.float32)
+        audio = np.concatenate(chunks)
+        if audio.size:
+            TTS_REAL_TIME_FACTOR.observe((time.perf_counter() - start) / (audio.size / SAMPLE_RATE))
+        return audio
+
+    def sentence_audio(self, sentence, voice=DEFAULT_VOICE, speed=1.0):
+        lang = voice_lang(voice)
+        key = (clean_text(sentence), voice, round(float(speed), 2), lang)
+        if not key[0]:
+            return np.zeros(0, dtype=np.float32)
+
+        samples = self._lookup(key)
+        if samples is not None:
+            return samples
+
+        with self.lock:
+            self.misses += 1
+        samples = self._synthesize(key[0], voice, speed, lang)
+        self._remember(key, samples)
+        if self.disk_dir:
+            self._write_disk(key, samples)
+        return samples
+
+    def submit(self, sentence, voice=DEFAULT_VOICE, speed=1.0):
+        return self.executor.submit(self.sentence_audio, sentence, voice, speed)
+
+    def synthesize(self, text, voice=DEFAULT_VOICE, speed=1.0):
+        """Returns the whole text as one float32 buffer at SAMPLE_RATE, built from cached sentences."""
+        sentences, tail = split_sentences(text)
+        if tail.strip():
+            sentences.append(tail.strip())
+
+        parts = [self.sentence_audio(sentence, voice, speed) for sentence in sentences]
+        total = sum(part.size for part in parts)
+        audio = np.empty(total, dtype=np.float32)
+        offset = 0
+        for part in parts:
+            audio[offset:offset + part.size] = part
+            offset += part.size
+        return audio
+
+    def stats(self):
+        with self.lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "loaded_langs": sorted(self.pipelines),
+                "entries": len(self.cache),
+                "memory_mb": round(self.bytes / 1024 ** 2, 2),
+                "max_memory_mb": round(self.max_bytes / 1024 ** 2, 2),
+                "disk_mb": round(self.disk_bytes / 1024 ** 2, 2) if self.disk_dir else None,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+            }
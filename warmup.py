@@ -0,0 +1,57 @@
+import threading
+import time
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+class WarmupTracker:
+    """Runs named warm-up tasks in the background and records how far each one got.
+
+    Each capability moves from "pending" to "loading" and then "ready" or "failed".
+    Known `capabilities` outside the warm-up set are reported as "cold": they load on
+    their first request, so readiness probes must not send traffic their way.
+    """
+
+    def __init__(self, tasks, max_workers=None, capabilities=None):
+        self.tasks = dict(tasks)
+        self.max_workers = max_workers or int(os.getenv("OMNI_WARMUP_WORKERS", "4"))
+        self.states = {name: {"state": "cold"} for name in capabilities or ()}
+        self.states.update({name: {"state": "pending"} for name in self.tasks})
+        self.lock = threading.Lock()
+        self.executor = None
+
+    def _set(self, name, **state):
+        with self.lock:
+            self.states[name] = state
+
+    def _run(self, name):
+        self._set(name, state="loading")
+        start = time.perf_counter()
+        try:
+            self.tasks[name]()
+        except Exception as e:
+            print(f"[Warning] Warm-up of '{name}' failed: {e}")
+            self._set(name, state="failed", error=str(e))
+            return
+        seconds = time.perf_counter() - start
+        print(f"[System] '{name}' is warm ({seconds:.1f}s).")
+        self._set(name, state="ready", seconds=round(seconds, 2))
+
+    def start(self):
+        if self.executor is not None or not self.tasks:
+            return
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="warmup")
+        for name in self.tasks:
+            self.executor.submit(self._run, name)
+
+    def ready(self, name=None):
+        """True once `name` has warmed up, or, without a name, once every capability in the warm-up set has."""
+        with self.lock:
+            if name is not None:
+                return name in self.states and self.states[name]["state"] == "ready"
+            return all(self.states[name]["state"] == "ready" for name in self.tasks)
+
+    def stats(self):
+        with self.lock:
+            return {name: dict(state) for name, state in self.states.items()}
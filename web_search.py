@@ -0,0 +1,163 @@
+import threading
+import string
+import json
+import time
+import os
+
+from concurrent.futures import ThreadPoolExecutor, wait
+from collections import OrderedDict
+
+
+PUNCTUATION = str.maketrans("", "", string.punctuation.replace("+", "").replace("#", ""))
+
+
+def normalize_query(query):
+    return " ".join(query.lower().translate(PUNCTUATION).split())
+
+
+class SearchBackend:
+    """Interface for search providers. `search` returns dicts with "title", "body" and "href"."""
+
+    name = "backend"
+
+    def search(self, query, max_results):
+        raise NotImplementedError
+
+
+class DDGSBackend(SearchBackend):
+    def __init__(self, backend="auto"):
+        self.backend = backend
+        self.name = f"ddgs:{backend}"
+
+    def search(self, query, max_results):
+        from ddgs import DDGS
+        return DDGS().text(query, max_results=max_results, backend=self.backend) or []
+
+
+class OfflineBackend(SearchBackend):
+    """Keyword search over a local list of documents, or a JSONL file of {"title", "body", "href"}."""
+
+    name = "offline"
+
+    def __init__(self, documents=None, index_path=None):
+        self.documents = list(documents or [])
+        if index_path:
+            with open(index_path, encoding="utf-8") as f:
+                self.documents.extend(json.loads(line) for line in f if line.strip())
+
+    def search(self, query, max_results):
+        terms = set(normalize_query(query).split())
+        scored = []
+        for doc in self.documents:
+            words = normalize_query(f"{doc.get('title', '')} {doc.get('body', '')}").split()
+            score = sum(1 for word in words if word in terms)
+            if score:
+                scored.append((score, doc))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [doc for _, doc in scored[:max_results]]
+
+
+def default_backends():
+    if os.getenv("OMNI_SEARCH_BACKEND", "ddgs") == "offline":
+        return [OfflineBackend(index_path=os.getenv("OMNI_SEARCH_INDEX"))]
+    engines = os.getenv("OMNI_SEARCH_ENGINES", "auto").split(",")
+    return [DDGSBackend(engine.strip()) for engine in engines if engine.strip()]
+
+
+class SearchService:
+    """Fans a query out to every backend and merges whatever answers within the latency budget.
+
+    Results are cached by normalized query. Answers from a budget-limited search are
+    returned but not cached, so the next identical query gets another chance at the
+    full result set.
+    """
+
+    def __init__(self, backends=None, budget_s=None, cache_ttl_s=None, cache_size=None):
+        self.backends = backends if backends is not None else default_backends()
+        self.budget = budget_s if budget_s is not None else float(os.getenv("OMNI_SEARCH_BUDGET_S", "3"))
+        self.cache_ttl = cache_ttl_s or float(os.getenv("OMNI_SEARCH_CACHE_TTL_S", "600"))
+        self.cache_size = cache_size or int(os.getenv("OMNI_SEARCH_CACHE_SIZE", "256"))
+        self.executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="search-backend")
+        # Callers' searches wait on backend futures, so they get their own pool to avoid starving it.
+        self.request_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="search")
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.partial = 0
+        self.failures = 0
+        self.total_latency = 0.0
+
+    def _cached(self, key):
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[0] > self.cache_ttl:
+                del self.cache[key]
+                return None
+            self.cache.move_to_end(key)
+            return entry[1]
+
+    def _store(self, key, results):
+        with self.lock:
+            self.cache[key] = (time.time(), results)
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def search(self, query, max_results=5):
+        key = (normalize_query(query), max_results)
+        cached = self._cached(key)
+        if cached is not None:
+            with self.lock:
+                self.hits += 1
+            return cached
+
+        start = time.perf_counter()
+        futures = [self.executor.submit(backend.search, query, max_results) for backend in self.backends]
+        done, not_done = wait(futures, timeout=self.budget)
+
+        results, seen, failed = [], set(), 0
+        for future in futures:
+            if future not in done:
+                continue
+            try:
+                backend_results = future.result()
+            except Exception as e:
+                print(f"[Warning] Web search backend failed: {e}")
+                failed += 1
+                continue
+            for res in backend_results:
+                ident = res.get("href") or res.get("title")
+                if ident not in seen:
+                    seen.add(ident)
+                    results.append(res)
+        results = results[:max_results]
+
+        with self.lock:
+            self.misses += 1
+            self.total_latency += time.perf_counter() - start
+            if not_done:
+                self.partial += 1
+            if failed == len(futures):
+                self.failures += 1
+
+        if not not_done and not failed and results:
+            self._store(key, results)
+        return results
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "backends": [backend.name for backend in self.backends],
+                "budget_s": self.budget,
+                "cached_queries": len(self.cache),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "partial": self.partial,
+                "failures": self.failures,
+                "avg_latency_s": round(self.total_latency / self.misses, 3) if self.misses else 0.0,
+            }